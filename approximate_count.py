@@ -0,0 +1,282 @@
+import argparse
+import time
+from statistics import NormalDist
+
+import numpy as np
+
+from data_preprocessor import DataPreprocessor
+
+# the first batch of random walks is small, so the first estimate is available quickly, and the batches grow up to the maximum
+MIN_BATCH_SIZE = 1024
+MAX_BATCH_SIZE = 65536
+# the accuracy budget is only checked after this many walks (the variance of fewer walks is not a reliable estimate)
+MIN_WALKS = 2048
+# time budget in seconds if only an accuracy budget is given (the estimate of an empty result never reaches an accuracy budget)
+DEFAULT_TIME_BUDGET = 1.0
+
+
+class WalkPlan():
+    """
+    Direction of the random walks through a path query: the first property table of the walk and the CSR index of every
+    following step (forward walks follow the objects of the subjects, backward walks follow the subjects of the objects)
+    """
+
+    def __init__(self, tables, forward=True):
+        """
+        Parameters
+        ----------
+        tables : list
+            Columnar property tables of the path in the order of the path
+        forward : bool
+            If True, the walks start in the first property table, otherwise in the last property table
+        """
+        self.forward = forward
+        if forward:
+            self.start = (tables[0].subjects, tables[0].objects)
+            self.steps = [(table.subject_keys, table.subject_offsets, table.objects) for table in tables[1:]]
+        else:
+            self.start = (tables[-1].os_objects, tables[-1].os_subjects)
+            self.steps = [(table.object_keys, table.object_offsets, table.os_subjects) for table in reversed(tables[:-1])]
+
+    def walk(self, number_of_walks, rng):
+        """
+        Run random walks: every walk starts at a uniformly chosen triple of the first table and continues to a uniformly chosen
+        neighbour in every step, a walk fails if the current term has no neighbour
+
+        Parameters
+        ----------
+        number_of_walks : int
+            Number of walks
+        rng : np.random.Generator
+            Random number generator
+
+        Returns
+        -------
+        np.ndarray
+            Inverse of the probability of every walk (float64, 0 for the failed walks)
+        """
+        first, second = self.start
+        current = second[rng.integers(0, len(first), number_of_walks)]
+        weights = np.full(number_of_walks, float(len(first)))
+        for keys, offsets, values in self.steps:
+            if not len(keys):
+                return np.zeros(number_of_walks)
+            index = np.minimum(np.searchsorted(keys, current), len(keys) - 1)
+            starts = offsets[index]
+            degrees = np.where(keys[index] == current, offsets[index + 1] - starts, 0)
+            # a failed walk stays at its term (its weight is 0 from now on)
+            choice = starts + (rng.random(number_of_walks) * degrees).astype(np.int64)
+            current = np.where(degrees > 0, values[np.minimum(choice, len(values) - 1)], current)
+            weights *= degrees
+        return weights
+
+
+class WanderJoin():
+    """
+    Online approximate COUNT of a path query p_1 ⋈ p_2 ⋈ ... ⋈ p_n with p_i.object = p_(i+1).subject (wander join)
+    Random walks through the CSR indices of the columnar property tables sample results of the query. A walk that reaches the
+    end of the path with probability p estimates the number of results with 1 / p (Horvitz-Thompson), a failed walk with 0,
+    so the mean over the walks is an unbiased estimate and its confidence interval tightens with the number of walks
+    The confidence interval is the normal approximation: on skewed data a few terms with many neighbours carry a large part
+    of the results, and as long as few walks went through them the interval is too narrow
+
+    Uniform samples of the results are drawn with the number of paths that start at every term (one bincount per property table,
+    computed on the first call of sample): every walk continues to a neighbour with a probability proportional to the paths
+    through it, so every walk reaches the end of the path and every result has the same probability
+
+        wander_join = WanderJoin(data_preprocessor)
+        for estimate in wander_join.estimates(time_budget=0.05):
+            print(estimate['count'], estimate['low'], estimate['high'])
+        rows = wander_join.sample(10)
+    """
+
+    def __init__(self, preprocessor, properties=('follows', 'friendOf', 'likes', 'hasReview'), direction='auto', seed=None):
+        """
+        Parameters
+        ----------
+        preprocessor : DataPreprocessor
+            Preprocessor that contains the property tables
+        properties : list
+            Properties of the path in the order of the path
+        direction : str
+            'forward' (walks start in the first property table), 'backward' (walks start in the last property table) or 'auto'
+            (a pilot batch of walks in both directions chooses the direction with the smaller variance)
+        seed : int
+            Seed of the random number generator
+        """
+        if direction not in ('auto', 'forward', 'backward'):
+            raise ValueError(f"Direction {direction} not supported")
+        self.properties = list(properties)
+        self.term_dictionary = preprocessor.term_dictionary
+        self.tables = [preprocessor.property_tables[property_name] for property_name in self.properties]
+        self.direction = direction
+        self.rng = np.random.default_rng(seed)
+        # for every property table the cumulative number of paths through its triples (SO order), built by sample
+        self.cumulative_paths = None
+
+    def choose_plan(self):
+        """
+        Walk plan of the configured direction and the weights of the pilot batch in this direction (None without pilot batch)
+        """
+        if self.direction != 'auto':
+            return WalkPlan(self.tables, self.direction == 'forward'), None
+        pilots = []
+        for forward in (True, False):
+            plan = WalkPlan(self.tables, forward)
+            weights = plan.walk(MIN_BATCH_SIZE, self.rng)
+            pilots.append((weights.var(), not forward, plan, weights))
+        _, _, plan, weights = min(pilots, key=lambda pilot: pilot[:2])
+        return plan, weights
+
+    def estimates(self, time_budget=None, relative_error=None, confidence=0.95, max_walks=None):
+        """
+        Estimate the number of results online: after every batch of random walks the current estimate is yielded
+        The estimation stops when the time budget is used up, when the maximum number of walks is reached or when the
+        confidence interval is within the relative error of the estimate
+
+        Parameters
+        ----------
+        time_budget : float
+            Time budget in seconds (DEFAULT_TIME_BUDGET if neither a time budget nor a maximum number of walks is given)
+        relative_error : float
+            Accuracy budget: half width of the confidence interval relative to the estimate (e.g. 0.01)
+        confidence : float
+            Confidence level of the confidence interval
+        max_walks : int
+            Maximum number of random walks
+
+        Returns
+        -------
+        generator
+            Dictionary with the estimate ('count'), the confidence interval ('low', 'high'), the number of walks ('walks',
+            'successful_walks'), the direction of the walks and the elapsed time in seconds
+        """
+        if time_budget is None and max_walks is None:
+            if relative_error is None:
+                raise ValueError("The estimation needs a time budget, an accuracy budget or a maximum number of walks")
+            time_budget = DEFAULT_TIME_BUDGET
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        start_time = time.perf_counter()
+        if any(not len(table) for table in self.tables):
+            # the result of a path with an empty property table is empty
+            yield {'count': 0.0, 'low': 0.0, 'high': 0.0, 'walks': 0, 'successful_walks': 0, 'direction': None,
+                   'time': time.perf_counter() - start_time}
+            return
+
+        plan, weights = self.choose_plan()
+        walks = successful_walks = 0
+        weight_sum = weight_square_sum = 0.0
+        batch_size = MIN_BATCH_SIZE
+        while True:
+            if weights is None:
+                if max_walks is not None:
+                    batch_size = min(batch_size, max_walks - walks)
+                weights = plan.walk(batch_size, self.rng)
+                batch_size = min(2 * batch_size, MAX_BATCH_SIZE)
+            walks += len(weights)
+            successful_walks += int(np.count_nonzero(weights))
+            weight_sum += float(weights.sum())
+            weight_square_sum += float(np.square(weights).sum())
+            weights = None
+
+            count = weight_sum / walks
+            variance = max(weight_square_sum / walks - count * count, 0.0) * walks / max(walks - 1, 1)
+            half_width = z * (variance / walks) ** 0.5
+            elapsed = time.perf_counter() - start_time
+            yield {'count': count, 'low': max(count - half_width, 0.0), 'high': count + half_width, 'walks': walks,
+                   'successful_walks': successful_walks, 'direction': 'forward' if plan.forward else 'backward',
+                   'time': elapsed}
+
+            if time_budget is not None and elapsed >= time_budget:
+                return
+            if max_walks is not None and walks >= max_walks:
+                return
+            if relative_error is not None and walks >= MIN_WALKS and 0 < count and half_width <= relative_error * count:
+                return
+
+    def estimate(self, time_budget=None, relative_error=None, confidence=0.95, max_walks=None):
+        """
+        Final estimate of the number of results within the budget (see estimates)
+        """
+        estimate = None
+        for estimate in self.estimates(time_budget, relative_error, confidence, max_walks):
+            pass
+        return estimate
+
+    def count_paths(self):
+        """
+        Cumulative number of paths through the triples of every property table (a triple (s, o) of p_i starts as many paths
+        through p_i to p_n as start at o in p_(i+1))
+        """
+        size = len(self.term_dictionary) + 1
+        paths = np.ones(size, dtype=np.int64)
+        self.cumulative_paths = [None] * len(self.tables)
+        for i in reversed(range(len(self.tables))):
+            table = self.tables[i]
+            self.cumulative_paths[i] = cumulative = np.cumsum(paths[table.objects])
+            # the paths of a subject are the difference of the cumulative numbers at the ends of its range
+            ends = cumulative[table.subject_offsets[1:] - 1] if len(table) else cumulative[:0]
+            paths = np.zeros(size, dtype=np.int64)
+            paths[table.subject_keys] = np.diff(ends, prepend=0)
+
+    def sample(self, number_of_samples):
+        """
+        Uniform samples (with replacement) of the results
+
+        Parameters
+        ----------
+        number_of_samples : int
+            Number of samples
+
+        Returns
+        -------
+        np.ndarray
+            int32 array with one row of term indices per sample and one column per term of the path
+        """
+        if self.cumulative_paths is None:
+            self.count_paths()
+        first = self.tables[0]
+        cumulative = self.cumulative_paths[0]
+        if not len(cumulative) or not cumulative[-1]:
+            return np.empty((0, len(self.tables) + 1), dtype=np.int32)
+        # a triple is chosen with a probability proportional to its paths (the first triple whose cumulative number exceeds
+        # a uniform number below the total)
+        chosen = np.searchsorted(cumulative, self.rng.integers(0, cumulative[-1], number_of_samples), side='right')
+        nodes = [first.subjects[chosen], first.objects[chosen]]
+        for table, cumulative in zip(self.tables[1:], self.cumulative_paths[1:]):
+            # every term of a sampled path has paths in the following property tables, so it is a subject of this table
+            index = np.searchsorted(table.subject_keys, nodes[-1])
+            starts, ends = table.subject_offsets[index], table.subject_offsets[index + 1]
+            before = np.where(starts > 0, cumulative[starts - 1], 0)
+            chosen = np.searchsorted(cumulative, before + self.rng.integers(0, cumulative[ends - 1] - before), side='right')
+            nodes.append(table.objects[chosen])
+        return np.stack(nodes, axis=1).astype(np.int32)
+
+    def decode_samples(self, rows):
+        """
+        Local names of the terms of sampled results (one list per result)
+        """
+        rows = np.asarray(rows)
+        return self.term_dictionary.decode(rows.reshape(-1)).reshape(rows.shape).tolist()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Approximate COUNT of a path query with random walks (wander join)")
+    parser.add_argument('data_path')
+    parser.add_argument('--properties', nargs='*', default=['follows', 'friendOf', 'likes', 'hasReview'])
+    parser.add_argument('--time', type=float, help="time budget in seconds")
+    parser.add_argument('--error', type=float, help="accuracy budget: half width of the confidence interval relative to the estimate")
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--samples', type=int, default=10, help="number of uniform samples of the results")
+    parser.add_argument('--seed', type=int)
+    arguments = parser.parse_args()
+    if arguments.time is None and arguments.error is None:
+        arguments.time = 0.1
+
+    data_preprocessor = DataPreprocessor(arguments.data_path, arguments.properties, cache_path=f"{arguments.data_path}.cache")
+    wander_join = WanderJoin(data_preprocessor, arguments.properties, seed=arguments.seed)
+    for estimate in wander_join.estimates(arguments.time, arguments.error, arguments.confidence):
+        print(f"{estimate['time'] * 1000:8.2f} ms  {estimate['walks']:9d} walks  COUNT(*) ≈ {estimate['count']:.1f} "
+              f"[{estimate['low']:.1f}, {estimate['high']:.1f}] ({estimate['direction']})")
+    for row in wander_join.decode_samples(wander_join.sample(arguments.samples)):
+        print(' '.join(row))
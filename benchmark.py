@@ -0,0 +1,200 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+
+from data_generator import generate_dataset
+from data_preprocessor import DataPreprocessor
+from join_algorithms import JoinAlgorithm
+
+PROPERTIES = ['follows', 'friendOf', 'likes', 'hasReview']
+ALGORITHMS = ['hash_join', 'sort_merge_join', 'leapfrog_triejoin']
+PERCENTILES = [10, 50, 90, 99]
+
+
+def summarize(runtimes):
+    """
+    Summary statistics of the runtimes of the repetitions
+
+    Parameters
+    ----------
+    runtimes : list
+        Runtimes in seconds
+
+    Returns
+    -------
+    dict
+        Minimum, maximum, mean, median and percentiles of the runtimes
+    """
+    summary = {'min': min(runtimes), 'max': max(runtimes), 'mean': float(np.mean(runtimes)), 'median': float(np.median(runtimes))}
+    for percentile in PERCENTILES:
+        summary[f'p{percentile}'] = float(np.percentile(runtimes, percentile))
+    return summary
+
+
+def run_configuration(data_preprocessor, algorithm_type, use_yannakakis, workers):
+    """
+    Run one configuration once (the prints of the join algorithm are suppressed)
+
+    Parameters
+    ----------
+    data_preprocessor : DataPreprocessor
+        Preprocessor that contains the property tables
+    algorithm_type : str
+        Type of the join algorithm
+    use_yannakakis : bool
+        If True, yannakakis algorithm is used
+    workers : int
+        Number of worker processes of the join algorithm
+
+    Returns
+    -------
+    reduction_time : float
+        Time of the Yannakakis reduction (the initialization of the join algorithm) in seconds
+    join_time : float
+        Time of the joins in seconds
+    sizes : dict
+        Sizes of the property tables after the reduction (see JoinAlgorithm.get_info)
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        # the results are still decoded and written, but to the null device so the disk does not distort the timings
+        with JoinAlgorithm(algorithm_type, data_preprocessor, os.devnull, use_yannakakis, workers=workers) as join_algorithm:
+            reduced_time = time.perf_counter()
+            sizes = join_algorithm.get_info()
+            join_start_time = time.perf_counter()
+            join_algorithm.run()
+            end_time = time.perf_counter()
+    return reduced_time - start_time, end_time - join_start_time, sizes
+
+
+def peak_memory(data_preprocessor, algorithm_type, use_yannakakis, workers):
+    """
+    Peak memory allocated by one run of a configuration (measured with tracemalloc in an extra run that is not timed)
+
+    Returns
+    -------
+    int
+        Peak allocated memory in bytes
+    """
+    tracemalloc.start()
+    try:
+        run_configuration(data_preprocessor, algorithm_type, use_yannakakis, workers)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_dataset(data_path, algorithms, warmups, repetitions, workers):
+    """
+    Run the matrix of join algorithms with and without Yannakakis on a dataset
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the data file
+    algorithms : list
+        Algorithm types of JoinAlgorithm
+    warmups : int
+        Number of runs before the measured runs
+    repetitions : int
+        Number of measured runs
+    workers : int
+        Number of worker processes of the join algorithms
+
+    Returns
+    -------
+    dict
+        Load time and the results of every configuration
+    """
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        data_preprocessor = DataPreprocessor(data_path, PROPERTIES)
+    load_time = time.perf_counter() - start_time
+
+    results = []
+    for algorithm_type in algorithms:
+        for use_yannakakis in [True, False]:
+            print(f"{data_path}: {algorithm_type} with Yannakakis: {use_yannakakis}")
+            reduction_times, join_times = [], []
+            for repetition in range(warmups + repetitions):
+                reduction_time, join_time, sizes = run_configuration(data_preprocessor, algorithm_type, use_yannakakis, workers)
+                if repetition >= warmups:
+                    reduction_times.append(reduction_time)
+                    join_times.append(join_time)
+            total_times = [reduction_time + join_time for reduction_time, join_time in zip(reduction_times, join_times)]
+
+            results.append({
+                'algorithm': algorithm_type,
+                'yannakakis': use_yannakakis,
+                'sizes': {property_name: [int(value) for value in size] for property_name, size in sizes.items()},
+                'reduction_time': summarize(reduction_times),
+                'join_time': summarize(join_times),
+                'total_time': summarize(total_times),
+                'runtimes': total_times,
+                'peak_memory_bytes': peak_memory(data_preprocessor, algorithm_type, use_yannakakis, workers),
+            })
+            print(f"    median {results[-1]['total_time']['median']:.4f} s, p90 {results[-1]['total_time']['p90']:.4f} s, "
+                  f"peak memory {results[-1]['peak_memory_bytes'] / 1e6:.1f} MB")
+
+    return {
+        'path': data_path,
+        'triples': sum(len(property_table) for property_table in data_preprocessor.property_tables.values()),
+        'load_time': load_time,
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark of the join algorithms with and without Yannakakis")
+    parser.add_argument('--data', nargs='*', default=[], help="existing data files (instead of generated datasets)")
+    parser.add_argument('--scale-factors', nargs='*', type=float, default=[1, 10, 100], help="scale factors of the generated datasets")
+    parser.add_argument('--skew', type=float, default=1.0, help="degree skew of the generated datasets (0 for uniform degrees)")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the data generator")
+    parser.add_argument('--algorithms', nargs='*', default=ALGORITHMS)
+    parser.add_argument('--warmups', type=int, default=1)
+    parser.add_argument('--repetitions', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=1, help="number of worker processes of the join algorithms")
+    parser.add_argument('--output', default='output/benchmark.json')
+    arguments = parser.parse_args()
+
+    datasets = []
+    if arguments.data:
+        data_paths = [(data_path, None) for data_path in arguments.data]
+    else:
+        data_paths = []
+        for scale_factor in arguments.scale_factors:
+            # generated datasets are reused, the generator is deterministic for the same parameters
+            data_path = f"data/generated_sf{scale_factor:g}_skew{arguments.skew:g}_seed{arguments.seed}.txt"
+            if not os.path.exists(data_path):
+                generate_dataset(data_path, scale_factor, arguments.skew, arguments.seed)
+            data_paths.append((data_path, scale_factor))
+
+    for data_path, scale_factor in data_paths:
+        dataset = benchmark_dataset(data_path, arguments.algorithms, arguments.warmups, arguments.repetitions, arguments.workers)
+        dataset['scale_factor'] = scale_factor
+        datasets.append(dataset)
+
+    benchmark = {
+        'config': {key: value for key, value in vars(arguments).items() if key != 'output'},
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            # maximum resident set size of the benchmark process (ru_maxrss is in kilobytes on Linux)
+            'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        },
+        'datasets': datasets,
+    }
+    os.makedirs(os.path.dirname(arguments.output) or '.', exist_ok=True)
+    with open(arguments.output, 'w') as output_file:
+        json.dump(benchmark, output_file, indent=2)
+    print(f"Results written to {arguments.output}")
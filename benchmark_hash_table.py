@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+
+from data_structures import HashMap, IntHashTable, hash_function, hash_array, match_sorted_keys
+
+############################################
+# Benchmark of the hash tables of the hash join
+# HashMap: dictionary of lists, one Python call per key (the hash table of the original hash join)
+# sorted hashes: build keys sorted by their hash, probed with a binary search (the previous vectorized hash join)
+# IntHashTable: open addressing with linear probing, without and with radix partitioning
+############################################
+
+
+def hash_map_join(build_keys, probe_keys):
+    """
+    Hash join with the dictionary-based HashMap (one Python call per build and probe key)
+    """
+    hash_table = HashMap()
+    for build_index, key in enumerate(build_keys.tolist()):
+        hash_table.insert(hash_function(key), (key, build_index))
+
+    build_indices, probe_indices = [], []
+    for probe_index, key in enumerate(probe_keys.tolist()):
+        # compare the actual keys because of hash collisions
+        for build_key, build_index in hash_table.get(hash_function(key)):
+            if build_key == key:
+                build_indices.append(build_index)
+                probe_indices.append(probe_index)
+    return build_indices, probe_indices
+
+
+def sorted_hashes_join(build_keys, probe_keys):
+    """
+    Hash join with the build keys sorted by their hash
+    """
+    build_hashes = hash_array(build_keys)
+    order = np.argsort(build_hashes, kind='stable')
+    probe_indices, positions = match_sorted_keys(build_hashes[order], hash_array(probe_keys))
+    build_indices = order[positions]
+    matches = build_keys[build_indices] == probe_keys[probe_indices]
+    return build_indices[matches], probe_indices[matches]
+
+
+def measure(join_function, build_keys, probe_keys, repetitions=3):
+    """
+    Median runtime of a join function in seconds
+    """
+    runtimes = []
+    for _ in range(repetitions):
+        start_time = time.perf_counter()
+        join_function(build_keys, probe_keys)
+        runtimes.append(time.perf_counter() - start_time)
+    return float(np.median(runtimes))
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(42)
+    join_functions = {
+        'HashMap': hash_map_join,
+        'sorted hashes': sorted_hashes_join,
+        'IntHashTable': lambda build_keys, probe_keys: IntHashTable(build_keys).probe(probe_keys),
+        'IntHashTable (radix 4)': lambda build_keys, probe_keys: IntHashTable(build_keys, radix_bits=4).probe(probe_keys),
+    }
+
+    for build_size, probe_size in [(10_000, 100_000), (100_000, 1_000_000), (1_000_000, 1_000_000)]:
+        # distinct build keys (like the distinct objects of the left join table) and probe keys with duplicates
+        build_keys = rng.choice(build_size * 2, build_size, replace=False).astype(np.int64)
+        probe_keys = rng.integers(0, build_size * 2, probe_size).astype(np.int64)
+        print(f"build keys: {build_size}, probe keys: {probe_size}")
+        for name, join_function in join_functions.items():
+            # the HashMap is too slow for the largest inputs
+            if name == 'HashMap' and build_size > 100_000:
+                continue
+            print(f"    {name}: {measure(join_function, build_keys, probe_keys):.4f} s")
@@ -0,0 +1,320 @@
+import numpy as np
+
+from data_structures import hash_array
+
+# a container holds the ids with the same upper 16 bits, containers with more ids than ARRAY_LIMIT are stored as bitmaps
+CONTAINER_BITS = 16
+CONTAINER_SIZE = 1 << CONTAINER_BITS
+ARRAY_LIMIT = 4096
+WORDS_PER_BITMAP = CONTAINER_SIZE // 64
+# container of the upper 16 bits of an id that is not a bitmap container (see RoaringBitmap.container_rows)
+ARRAY_CONTAINER = -1
+NO_CONTAINER = -2
+
+
+def popcount(words):
+    """
+    Number of set bits of every uint64 word
+    """
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).astype(np.int64)
+    # numpy < 2.0 has no bitwise_count
+    return np.unpackbits(words.view(np.uint8).reshape(*words.shape, 8), axis=-1).sum(axis=-1).astype(np.int64)
+
+
+class RoaringBitmap():
+    """
+    Compressed bitmap of non-negative 32 bit integer ids (Roaring layout)
+    The ids are split into containers by their upper 16 bits. A sparse container is a sorted array of its ids, a dense container
+    (more than ARRAY_LIMIT ids) is a bitmap of 1024 uint64 words, so a dense container needs one bit per possible id and a
+    sparse container four bytes per id. The array containers are stored in one sorted array and the bitmap containers in one
+    2d array, so contains, AND and OR work on all containers at once (the bitmap containers word by word)
+    """
+
+    def __init__(self, array_values, bitmap_keys, bitmap_words):
+        """
+        Initialize the bitmap from its containers (use RoaringBitmap.from_array to create a bitmap from ids)
+
+        Parameters
+        ----------
+        array_values : np.ndarray
+            Sorted uint32 ids of the array containers
+        bitmap_keys : np.ndarray
+            Sorted upper 16 bits of the bitmap containers
+        bitmap_words : np.ndarray
+            uint64 array with one row of WORDS_PER_BITMAP words for every bitmap container
+        """
+        self.array_values = array_values
+        self.bitmap_keys = bitmap_keys
+        self.bitmap_words = bitmap_words
+        self._container_rows = None
+
+    @classmethod
+    def from_array(cls, ids, is_sorted=False):
+        """
+        Create a bitmap from an array of ids
+
+        Parameters
+        ----------
+        ids : array-like
+            Non-negative ids (below 2^32), duplicates are allowed
+        is_sorted : bool
+            True if the ids are already sorted and distinct (e.g. the keys of a CSR index)
+
+        Returns
+        -------
+        RoaringBitmap
+            Bitmap of the ids
+        """
+        ids = np.asarray(ids).astype(np.uint32)
+        if not is_sorted:
+            if len(ids) and (ids[1:] >= ids[:-1]).all():
+                # sorted ids with duplicates (e.g. the subjects of a property table) only need to drop the repeated ids
+                ids = ids[np.concatenate([[True], ids[1:] != ids[:-1]])]
+            else:
+                ids = np.unique(ids)
+        keys, counts = np.unique(ids >> CONTAINER_BITS, return_counts=True)
+        dense = counts > ARRAY_LIMIT
+        in_bitmap = np.repeat(dense, counts)
+        return cls(ids[~in_bitmap], keys[dense], cls.bitmap_rows(ids[in_bitmap], keys[dense]))
+
+    @staticmethod
+    def bitmap_rows(ids, keys):
+        """
+        Bitmap containers of the ids (all ids are in the containers of the keys)
+        """
+        bits = np.zeros(len(keys) * CONTAINER_SIZE, dtype=bool)
+        rows = np.searchsorted(keys, ids >> CONTAINER_BITS)
+        bits[rows.astype(np.int64) * CONTAINER_SIZE + (ids & (CONTAINER_SIZE - 1))] = True
+        return np.packbits(bits, bitorder='little').view(np.uint64).reshape(len(keys), WORDS_PER_BITMAP)
+
+    @classmethod
+    def from_containers(cls, ids, bitmap_keys, bitmap_words):
+        """
+        Create a normalized bitmap: bitmap containers with at most ARRAY_LIMIT ids become array containers and array containers
+        with more ids become bitmap containers
+
+        Parameters
+        ----------
+        ids : np.ndarray
+            Sorted distinct ids outside of the bitmap containers
+        bitmap_keys : np.ndarray
+            Sorted keys of the bitmap containers
+        bitmap_words : np.ndarray
+            Words of the bitmap containers
+        """
+        sparse_rows = popcount(bitmap_words).sum(axis=1) <= ARRAY_LIMIT
+        if sparse_rows.any():
+            sparse = cls(np.empty(0, dtype=np.uint32), bitmap_keys[sparse_rows], bitmap_words[sparse_rows])
+            ids = np.union1d(ids, sparse.to_array())
+            bitmap_keys, bitmap_words = bitmap_keys[~sparse_rows], bitmap_words[~sparse_rows]
+
+        keys, counts = np.unique(ids >> CONTAINER_BITS, return_counts=True)
+        dense_keys = keys[counts > ARRAY_LIMIT]
+        if len(dense_keys):
+            in_bitmap = np.isin(ids >> CONTAINER_BITS, dense_keys)
+            bitmap_keys = np.concatenate([bitmap_keys, dense_keys])
+            bitmap_words = np.concatenate([bitmap_words, cls.bitmap_rows(ids[in_bitmap], dense_keys)])
+            order = np.argsort(bitmap_keys)
+            bitmap_keys, bitmap_words = bitmap_keys[order], bitmap_words[order]
+            ids = ids[~in_bitmap]
+        return cls(ids.astype(np.uint32), bitmap_keys, bitmap_words)
+
+    def __len__(self):
+        return self.cardinality()
+
+    def cardinality(self):
+        """
+        Number of ids in the bitmap
+        """
+        return len(self.array_values) + int(popcount(self.bitmap_words).sum())
+
+    def nbytes(self):
+        """
+        Memory used by the containers
+        """
+        return self.array_values.nbytes + self.bitmap_keys.nbytes + self.bitmap_words.nbytes
+
+    @property
+    def container_rows(self):
+        """
+        Lookup table from the upper 16 bits of an id to its container: the row of the bitmap container, ARRAY_CONTAINER or
+        NO_CONTAINER (built on first use, its size is the largest container key)
+        """
+        if self._container_rows is None:
+            array_keys = np.unique(self.array_values >> CONTAINER_BITS)
+            size = int(max(array_keys[-1] if len(array_keys) else 0, self.bitmap_keys[-1] if len(self.bitmap_keys) else 0)) + 1
+            self._container_rows = np.full(size, NO_CONTAINER, dtype=np.int32)
+            self._container_rows[array_keys] = ARRAY_CONTAINER
+            self._container_rows[self.bitmap_keys] = np.arange(len(self.bitmap_keys), dtype=np.int32)
+        return self._container_rows
+
+    def contains(self, ids):
+        """
+        Check for several ids at once if they are in the bitmap
+        The container of every id is found with a lookup table, the bits of the bitmap containers are read byte-wise and the ids
+        of the array containers are searched in the sorted array of their ids
+
+        Parameters
+        ----------
+        ids : np.ndarray
+            Ids that are looked up (negative ids and ids above 2^32 are never contained)
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array, True for the ids of the bitmap
+        """
+        ids = np.asarray(ids)
+        if not len(ids):
+            return np.zeros(0, dtype=bool)
+        container_rows = self.container_rows
+        keys = ids >> CONTAINER_BITS
+        if ids.min() >= 0 and keys.max() < len(container_rows):
+            rows = container_rows[keys]
+        else:
+            valid = (ids >= 0) & (keys < len(container_rows))
+            rows = np.where(valid, container_rows[np.where(valid, keys, 0)], NO_CONTAINER)
+
+        found = np.zeros(len(ids), dtype=bool)
+        if len(self.bitmap_keys):
+            # bit position within the bitmap containers (there are at most 2^16 containers, so it fits into 32 bits)
+            positions = (np.maximum(rows, 0).astype(np.uint32) << np.uint32(CONTAINER_BITS)) | (ids & (CONTAINER_SIZE - 1)).astype(np.uint32)
+            bits = (self.bitmap_words.view(np.uint8).reshape(-1)[positions >> np.uint32(3)] >> (positions & np.uint32(7)).astype(np.uint8)) & np.uint8(1)
+            found = (rows >= 0) & bits.view(bool)
+        in_array = rows == ARRAY_CONTAINER
+        if in_array.any():
+            candidates = ids[in_array]
+            positions = np.minimum(np.searchsorted(self.array_values, candidates), len(self.array_values) - 1)
+            found[in_array] = self.array_values[positions] == candidates
+        return found
+
+    def __contains__(self, id):
+        return bool(self.contains(np.array([id]))[0])
+
+    def to_array(self):
+        """
+        Sorted ids of the bitmap (uint32)
+        """
+        bits = np.unpackbits(self.bitmap_words.view(np.uint8), bitorder='little').reshape(len(self.bitmap_keys), CONTAINER_SIZE)
+        rows, low = np.nonzero(bits)
+        bitmap_ids = (self.bitmap_keys[rows].astype(np.uint32) << CONTAINER_BITS) | low.astype(np.uint32)
+        return np.sort(np.concatenate([self.array_values, bitmap_ids]))
+
+    def __and__(self, other):
+        """
+        Intersection of two bitmaps: the bitmap containers of both bitmaps are combined word by word, the ids of the array
+        containers are looked up in the other bitmap
+        """
+        keys, self_rows, other_rows = np.intersect1d(self.bitmap_keys, other.bitmap_keys, assume_unique=True, return_indices=True)
+        words = self.bitmap_words[self_rows] & other.bitmap_words[other_rows]
+        ids = np.union1d(self.array_values[other.contains(self.array_values)], other.array_values[self.contains(other.array_values)])
+        return RoaringBitmap.from_containers(ids, keys, words)
+
+    def __or__(self, other):
+        """
+        Union of two bitmaps: the bitmap containers of both bitmaps are combined word by word, the ids of the array containers
+        are set in the bitmap containers or merged
+        """
+        keys = np.union1d(self.bitmap_keys, other.bitmap_keys)
+        words = np.zeros((len(keys), WORDS_PER_BITMAP), dtype=np.uint64)
+        words[np.searchsorted(keys, self.bitmap_keys)] |= self.bitmap_words
+        words[np.searchsorted(keys, other.bitmap_keys)] |= other.bitmap_words
+
+        ids = np.union1d(self.array_values, other.array_values)
+        in_bitmap = np.isin(ids >> CONTAINER_BITS, keys)
+        if in_bitmap.any():
+            words |= RoaringBitmap.bitmap_rows(ids[in_bitmap], keys)
+        return RoaringBitmap.from_containers(ids[~in_bitmap], keys, words)
+
+
+class BloomFilter():
+    """
+    Bloom filter of integer ids for approximate pre-filtering: contains never misses an id that was added, but returns True for
+    other ids with a false positive rate of about (1 - e^(-k n / m))^k for n ids, m bits and k hash functions
+    The k positions of an id are derived from two hashes (double hashing), all ids are added and looked up at once
+    """
+
+    def __init__(self, ids, bits_per_id=10, number_of_hashes=None):
+        """
+        Build the Bloom filter
+
+        Parameters
+        ----------
+        ids : np.ndarray
+            Ids that are added to the filter
+        bits_per_id : int
+            Minimum size of the filter in bits per id, rounded up to a power of two number of bits (10 bits give a false positive
+            rate of about 1%)
+        number_of_hashes : int
+            Number of hash functions (the optimal number for bits_per_id if None)
+        """
+        ids = np.asarray(ids)
+        # the number of bits is rounded up to a power of two, so the positions are taken modulo the size with a mask
+        self.number_of_bits = 1 << max(int(np.ceil(np.log2(max(len(ids) * bits_per_id, 64)))), 6)
+        self.number_of_hashes = number_of_hashes or max(int(round(bits_per_id * np.log(2))), 1)
+        bits = np.zeros(self.number_of_bits, dtype=bool)
+        bits[self.positions(ids).ravel()] = True
+        self.words = np.packbits(bits, bitorder='little').view(np.uint64)
+
+    def positions(self, ids):
+        """
+        Bit positions of every id (one row per id, one column per hash function)
+        """
+        first = hash_array(ids)
+        # the second hash is odd, so the positions of an id are distinct for a power of two number of bits
+        second = hash_array(first ^ np.uint64(0x9e3779b9)) | np.uint64(1)
+        steps = np.arange(self.number_of_hashes, dtype=np.uint64)
+        return (first[:, None] + steps[None, :] * second[:, None]) & np.uint64(self.number_of_bits - 1)
+
+    def contains(self, ids):
+        """
+        Check for several ids at once if they may be in the filter
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array, False for ids that are certainly not in the filter
+        """
+        positions = self.positions(np.asarray(ids))
+        bits = (self.words.view(np.uint8)[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & np.uint8(1)
+        return bits.view(bool).all(axis=1)
+
+    def nbytes(self):
+        return self.words.nbytes
+
+
+# filters of the semi-joins: np.isin, a RoaringBitmap of the keys or a BloomFilter of the keys followed by np.isin for the candidates
+SEMI_JOIN_FILTERS = ('isin', 'bitmap', 'bloom')
+
+
+def semi_join_mask(values, keys, semi_join_filter='isin'):
+    """
+    Check for all values at once if they are keys (the membership test of a semi-join)
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Non-negative ids that are checked (e.g. the objects of a property table)
+    keys : np.ndarray or RoaringBitmap
+        Ids of the other side of the semi-join (e.g. the subjects of the next property table), duplicates are allowed
+    semi_join_filter : str
+        'isin' (sorting based np.isin), 'bitmap' (lookup in a RoaringBitmap of the keys) or 'bloom' (a BloomFilter of the keys
+        removes most values without a partner, only the remaining candidates are checked exactly with np.isin)
+
+    Returns
+    -------
+    np.ndarray
+        Boolean array, True for the values that are keys (the result is exact for every filter)
+    """
+    if isinstance(keys, RoaringBitmap):
+        return keys.contains(values)
+    if semi_join_filter == 'isin':
+        return np.isin(values, keys)
+    if semi_join_filter == 'bitmap':
+        return RoaringBitmap.from_array(keys).contains(values)
+    if semi_join_filter == 'bloom':
+        mask = BloomFilter(keys).contains(values)
+        mask[mask] = np.isin(values[mask], keys)
+        return mask
+    raise ValueError(f"Semi-join filter {semi_join_filter} not supported")
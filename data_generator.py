@@ -0,0 +1,117 @@
+import numpy as np
+
+# number of entities and triples per scale factor, the ratios are similar to the watdiv 100k dataset
+USERS_PER_SCALE = 1000
+PRODUCTS_PER_SCALE = 250
+REVIEWS_PER_SCALE = 1500
+FOLLOWS_PER_USER = 9.0
+FRIENDS_PER_USER = 4.0
+LIKES_PER_USER = 2.4
+
+# number of triples that are formatted and written at once
+WRITE_BATCH_SIZE = 1 << 20
+
+
+def skewed_choice(rng, number_of_entities, size, skew):
+    """
+    Draw entities with a Zipf-like distribution: the entity with rank r is drawn with a probability proportional to 1 / r^skew
+    The ranks are assigned to the entities in a random order, so the popular entities are spread over the indices
+
+    Parameters
+    ----------
+    rng : np.random.Generator
+        Seeded random generator
+    number_of_entities : int
+        Number of entities (indices 1 to number_of_entities)
+    size : int
+        Number of draws
+    skew : float
+        Exponent of the distribution (0 draws uniformly)
+
+    Returns
+    -------
+    np.ndarray
+        Indices of the drawn entities
+    """
+    if skew == 0:
+        return rng.integers(1, number_of_entities + 1, size)
+    weights = 1.0 / np.arange(1, number_of_entities + 1) ** skew
+    ranks = np.searchsorted(np.cumsum(weights / weights.sum()), rng.random(size), side='right')
+    ranks = np.minimum(ranks, number_of_entities - 1)
+    return rng.permutation(number_of_entities)[ranks] + 1
+
+
+def generate_triples(scale_factor=1, skew=1.0, seed=0):
+    """
+    Generate the follows, friendOf, likes and hasReview triples of a WatDiv-like social network
+    Users follow and are friends with other users, users like products and products have reviews
+    The subjects and objects of follows, friendOf and likes are drawn with the given skew (a few users and products have a very
+    high degree), every review belongs to one product
+
+    Parameters
+    ----------
+    scale_factor : float
+        Size of the dataset, the number of entities and triples grows linearly with it
+    skew : float
+        Skew of the degree distribution (0 for uniform degrees)
+    seed : int
+        Seed of the random generator, the same parameters always generate the same triples
+
+    Returns
+    -------
+    dict
+        Dictionary with the property names as keys and tuples (subject type, subject indices, object type, object indices) as values
+    """
+    rng = np.random.default_rng(seed)
+    users = max(int(USERS_PER_SCALE * scale_factor), 2)
+    products = max(int(PRODUCTS_PER_SCALE * scale_factor), 1)
+    reviews = max(int(REVIEWS_PER_SCALE * scale_factor), 1)
+
+    triples = {}
+    for property_name, per_user in [('follows', FOLLOWS_PER_USER), ('friendOf', FRIENDS_PER_USER)]:
+        size = int(users * per_user)
+        triples[property_name] = ('User', skewed_choice(rng, users, size, skew), 'User', skewed_choice(rng, users, size, skew))
+
+    size = int(users * LIKES_PER_USER)
+    triples['likes'] = ('User', skewed_choice(rng, users, size, skew), 'Product', skewed_choice(rng, products, size, skew))
+
+    triples['hasReview'] = ('Product', skewed_choice(rng, products, reviews, skew), 'Review', np.arange(1, reviews + 1))
+    return triples
+
+
+def generate_dataset(data_path, scale_factor=1, skew=1.0, seed=0):
+    """
+    Generate a WatDiv-like dataset and write it in the format of the 100k.txt dataset (prefixed names separated by tabs)
+
+    Parameters
+    ----------
+    data_path : str
+        Path of the data file
+    scale_factor : float
+        Size of the dataset (1 is about 17000 triples)
+    skew : float
+        Skew of the degree distribution (0 for uniform degrees)
+    seed : int
+        Seed of the random generator
+
+    Returns
+    -------
+    int
+        Number of triples
+    """
+    number_of_triples = 0
+    with open(data_path, 'w') as data_file:
+        for property_name, (subject_type, subjects, object_type, objects) in generate_triples(scale_factor, skew, seed).items():
+            prefix = 'rev' if property_name == 'hasReview' else 'wsdbm'
+            for start in range(0, len(subjects), WRITE_BATCH_SIZE):
+                data_file.writelines(
+                    f"wsdbm:{subject_type}{subject}\t{prefix}:{property_name}\twsdbm:{object_type}{object} .\n"
+                    for subject, object in zip(subjects[start:start + WRITE_BATCH_SIZE].tolist(), objects[start:start + WRITE_BATCH_SIZE].tolist())
+                )
+            number_of_triples += len(subjects)
+    return number_of_triples
+
+
+if __name__ == '__main__':
+    number_of_triples = generate_dataset('data/generated.txt', scale_factor=1, skew=1.0, seed=0)
+    print("Number of triples: ", number_of_triples)
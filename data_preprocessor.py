@@ -1,127 +1,328 @@
+from array import array
 from collections import defaultdict
+import multiprocessing
+import os
+
+import numpy as np
+
+from data_structures import PropertyTable
+from ntriples_reader import BlockReader, compression_format
+from optimizer import PropertyStatistics
+from profiler import DISABLED_PROFILER
+from term_dictionary import TermDictionary, split_term_bytes
+import dataset_cache
 
 class DataPreprocessor():
     
-    def __init__(self, data_path, properties):
+    def __init__(self, data_path, properties, cache_path=None, workers=1, profiler=DISABLED_PROFILER, selection=None):
         """
         Initialize the data preprocessor and preprocess the data
         
         Parameters
         ----------
         data_path : str
-            Path to the data file
+            Path to the data file (N-Triples, optionally compressed with gzip, bzip2 or zstd, see ntriples_reader.py)
         properties : list
             List of relevant properties
+        cache_path : str
+            Path to the binary cache of the encoded dataset (see dataset_cache.py)
+            If the cache is valid for the data file, it is memory-mapped instead of parsing the data file, otherwise it is written after parsing
+        workers : int
+            Number of worker processes that parse the data file (1 parses the data file in this process)
+        profiler : Profiler
+            Profiler that measures the steps of the ingestion (see profiler.py), disabled by default
+        selection : TripleSelection
+            Selection of the triples that are loaded (see sparql.TripleSelection), triples that do not match it are neither
+            encoded nor stored. The cache is only used if it was written with the same selection (all triples if None)
 
         """
         self.data_path = data_path
         self.properties = properties
-        # property_tables_int contains for each property a list of objects and for each object a list of subjects
-        self.property_tables_int = {property_name: defaultdict(list) for property_name in properties}
+        self.selection = selection
+        self.profiler = profiler
+        # property_pairs contains for each property the subjects and objects of its triples as compact integer arrays
+        # it is only used while partitioning the data and afterwards replaced by the columnar property tables
+        self.property_pairs = {property_name: (array('i'), array('i')) for property_name in properties}
 
-        # for each unique subject and for each unique object in the data, the rdf_dict has a unique index
-        self.rdf_dict = defaultdict()
+        # property_tables contains for each property a columnar property table (see data_structures.PropertyTable)
+        self.property_tables = {}
+        # the dictionary version of the property tables is only built when property_tables_int is accessed
+        self._property_tables_int = None
+        # statistics contains for each property the statistics of its property table (see optimizer.PropertyStatistics)
+        # they are collected when the property tables are built and used by the cost-based optimizer
+        self.statistics = {}
 
-        # the rdf_dict_reversed has for each index the corresponding subject or object
-        # this is used to get the subject or object strings from the respective index
-        self.rdf_dict_reversed = defaultdict()
+        # while the data is partitioned, the rdf_dict has a provisional index for each unique subject and for each unique object
+        # (the keys are the UTF-8 encoded terms as they are read from the data file)
+        self.rdf_dict = defaultdict()
 
-        # preprocess the data by partitioning the data into different property tables
-        self.partition_data()
-        # fill rdf_dict_reversed so that it contains the indices as keys and the corresponding subjects and objects as values
-        self.reverse_dict()
+        # the term_dictionary has the final index of each subject and object (see term_dictionary.TermDictionary)
+        # it is used to get the subject or object strings from the respective index and the other way round
+        self.term_dictionary = None
 
+        with profiler.operator('ingestion', data=data_path) as ingestion:
+            self.ingest(cache_path, workers)
+            ingestion.output_rows = sum(len(property_table) for property_table in self.property_tables.values())
 
-    def partition_data(self):
-        """
-        Partition the data (triples) into different property tables
-        Property tables are here represented as a dictionary with the property name as key and a dictionary as value
-        The dictionary as value contains the objects as keys and a list of subjects as values
+    def ingest(self, cache_path, workers):
         """
+        Load the encoded dataset from the cache or parse the data file, build the term dictionary and the property tables
+        and write the cache
 
-        # open the data file and read line by line
-        with open(self.data_path, 'r') as data_file:
-            for line in data_file:
-                # remove the newline character
-                line = line.strip('\n.')
+        Parameters
+        ----------
+        cache_path : str
+            Path to the binary cache of the encoded dataset (None if no cache is used)
+        workers : int
+            Number of worker processes that parse the data file
+        """
+        # load the encoded dataset from the cache if it is valid for the data file
+        if cache_path is not None:
+            with self.profiler.operator('load_cache', path=cache_path) as operator:
+                cached_dataset = dataset_cache.load_cache(cache_path, self.data_path, self.properties, self.selection_key())
+                if cached_dataset is not None:
+                    self.term_dictionary, self.property_tables, self.statistics = cached_dataset
+                    operator.output_rows = sum(len(property_table) for property_table in self.property_tables.values())
+            if cached_dataset is not None:
+                return
 
-                # split the line into subject, property and object
-                subject, property, *object = line.split()
-                # join the object list into a string seperated by space
-                object = ' '.join(object)
+        # preprocess the data by partitioning the data into different property tables
+        with self.profiler.operator('partition_data', workers=workers) as operator:
+            if workers > 1:
+                self.partition_data_parallel(workers)
+            else:
+                self.partition_data()
+            operator.output_rows = sum(len(subjects) for subjects, _ in self.property_pairs.values())
+        # build the term dictionary and replace the provisional indices by the indices of the term dictionary
+        with self.profiler.operator('build_term_dictionary', lambda: [len(self.rdf_dict)]) as operator:
+            self.build_term_dictionary()
+            operator.output_rows = len(self.term_dictionary)
+        # build the columnar property tables from the partitioned data
+        with self.profiler.operator('build_property_tables', lambda: [len(subjects) for subjects, _ in self.property_pairs.values()]) as operator:
+            self.build_property_tables()
+            operator.output_rows = sum(len(property_table) for property_table in self.property_tables.values())
 
-                # remove the prefix of the subject, property and object
-                subject = self.remove_prefix(subject)
-                property = self.remove_prefix(property)
-                object = self.remove_prefix(object)
+        # write the encoded dataset to the cache so that the next run does not need to parse the data file
+        if cache_path is not None:
+            with self.profiler.operator('write_cache', path=cache_path):
+                dataset_cache.write_cache(cache_path, self.data_path, self.term_dictionary, self.property_tables, self.statistics,
+                                          self.selection_key())
 
-                # check if the property is in the list of relevant properties
-                if property in self.properties:
-                    # add the subject and object of the triple to the corresponding property table
-                    self.add_to_dict(subject, object)
-                    # get the corresponding indices of the subject and object
-                    subject_int, object_int = self.rdf_dict[subject], self.rdf_dict[object]
+    def selection_key(self):
+        """
+        Description of the selection of the triples that is stored in the cache (None if all triples are loaded)
+        """
+        return None if self.selection is None else self.selection.key()
 
-                    # add the subject to the list of subjects of the object in the corresponding property table
-                    self.property_tables_int[property][object_int].append(subject_int)
 
-        # print(self.partion_tables)
+    def partition_data(self):
+        """
+        Partition the data (triples) into different property tables
+        The subjects and objects of the triples of each property are collected in two integer arrays (property_pairs)
+        The data file is read (and decompressed) block by block in a background thread and the blocks are parsed as bytes
+        (see encode_lines), so no line is decoded to a string
+        """
+        # local names of the properties as they are written in the data (every distinct property is split only once)
+        property_names = {}
+        with BlockReader(self.data_path) as reader:
+            for block in reader:
+                encode_lines(block, set(self.properties), self.selection, self.rdf_dict, self.property_pairs, property_names)
 
-    def remove_prefix(self, string):
+    def partition_data_parallel(self, workers):
         """
-        Remove the prefix of the given string from the data and return the string without the prefix
+        Partition the data (triples) into different property tables with a pool of worker processes
+        The data file is split into byte ranges that start and end at line boundaries, every worker parses its byte ranges
+        and encodes the terms with its own local indices (see parse_chunk). A compressed data file cannot be split, so it is
+        decompressed in a background thread and its blocks are sent to the workers (see parse_block)
+        The chunks are merged in the order of the file, so the terms get the same indices as with partition_data
 
         Parameters
         ----------
-        string : str
-            String from the data
-
-        Returns
-        -------
-        str
-            String without the prefix
+        workers : int
+            Number of worker processes
         """
+        with multiprocessing.Pool(workers) as pool, BlockReader(self.data_path) as reader:
+            if compression_format(self.data_path) is None:
+                # use more chunks than workers so that all workers are busy until the end
+                boundaries = chunk_boundaries(self.data_path, workers * 4)
+                chunks = [(self.data_path, start, end, self.properties, self.selection) for start, end in zip(boundaries[:-1], boundaries[1:])]
+                results = pool.imap(parse_chunk, chunks)
+            else:
+                results = pool.imap(parse_block, ((block, self.properties, self.selection) for block in reader))
 
-        # check if the string is from the watdiv.10M.nt dataset (subject and object are surrounded by < and >)
-        if string[-1] == '>':
-            string = string[:-1]
+            # imap returns the chunks in the order of the file while the workers continue parsing
+            for terms, fragments in results:
+                # map the local indices of the chunk to global indices (new terms get the next free index)
+                global_indices = np.empty(len(terms) + 1, dtype=np.int32)
+                for local_index, term in enumerate(terms, start=1):
+                    if term not in self.rdf_dict:
+                        self.rdf_dict[term] = len(self.rdf_dict) + 1
+                    global_indices[local_index] = self.rdf_dict[term]
 
-            # traverse the string from the end
-            for index, char in enumerate(string[::-1]):
-                # when the first non-digit and non-alphabet character is found, return the string from this index
-                if not char.isdigit() and not char.isalpha():
-                    return string[-index:]
-        
-        # the data is from the 100k.txt dataset
-        # check if the string is a value (surrounded by ")
-        elif string[-1] == '"':
-            return string
-        else:
-            # return the string after the first occurence of :
-            return string[string.find(':') + 1:]
-        
-    def add_to_dict(self, subject, object):
+                # add the subjects and objects of the chunk to the arrays of the corresponding property
+                for property, (local_subjects, local_objects) in fragments.items():
+                    subjects, objects = self.property_pairs[property]
+                    subjects.frombytes(global_indices[local_subjects].tobytes())
+                    objects.frombytes(global_indices[local_objects].tobytes())
+
+    def build_term_dictionary(self):
+        """
+        Build the term dictionary from the rdf_dict and replace the provisional indices in property_pairs by the indices of the term dictionary
+        The rdf_dict is freed afterwards
         """
-        Add the subject and object to the rdf_dict if they are not already in the dictionary
+        self.term_dictionary, remap = TermDictionary.build(self.rdf_dict)
+        for property_name, (subjects, objects) in self.property_pairs.items():
+            self.property_pairs[property_name] = (
+                array('i', remap[np.frombuffer(subjects, dtype=np.int32)].tobytes()),
+                array('i', remap[np.frombuffer(objects, dtype=np.int32)].tobytes()),
+            )
+        self.rdf_dict = defaultdict()
 
-        Parameters
-        ----------
-        subject : str
-            Subject of the triple
-        object : str
-            Object of the triple
+    def build_property_tables(self):
         """
-        if subject not in self.rdf_dict:
-            self.rdf_dict[subject] = len(self.rdf_dict) + 1
-        if object not in self.rdf_dict:
-            self.rdf_dict[object] = len(self.rdf_dict) + 1
+        Build the columnar property tables (sorted int32 arrays with CSR indices in both directions) from the partitioned data
+        and collect their statistics
+        The integer arrays of the partitioning are freed afterwards
+        """
+        for property_name, (subjects, objects) in self.property_pairs.items():
+            self.property_tables[property_name] = PropertyTable(subjects, objects)
+            self.statistics[property_name] = PropertyStatistics.from_property_table(self.property_tables[property_name])
+        self.property_pairs = {property_name: (array('i'), array('i')) for property_name in self.properties}
+        self._property_tables_int = None
 
-    def reverse_dict(self):
+    @property
+    def property_tables_int(self):
         """
-        Fill the rdf_dict_reversed so that it contains the indices as keys and the corresponding subjects or objects as values
+        Dictionary version of the property tables: for each property a dictionary with the objects as keys and lists of subjects as values
+        It is built from the columnar property tables on first access
         """
-        for key, value in self.rdf_dict.items():
-            self.rdf_dict_reversed[value] = key
+        if self._property_tables_int is None:
+            self._property_tables_int = {property_name: property_table.to_dict()
+                                         for property_name, property_table in self.property_tables.items()}
+        return self._property_tables_int
+
+
+def chunk_boundaries(data_path, number_of_chunks):
+    """
+    Split the data file into byte ranges of roughly equal size that start and end at line boundaries
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the data file
+    number_of_chunks : int
+        Number of byte ranges
+
+    Returns
+    -------
+    list
+        Sorted byte offsets, chunk i is the byte range from boundaries[i] to boundaries[i + 1]
+    """
+    file_size = os.path.getsize(data_path)
+    boundaries = [0]
+    with open(data_path, 'rb') as data_file:
+        for chunk in range(1, number_of_chunks):
+            # move the approximate boundary to the start of the next line
+            data_file.seek(max(file_size * chunk // number_of_chunks - 1, boundaries[-1]))
+            data_file.readline()
+            boundary = min(data_file.tell(), file_size)
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    if boundaries[-1] < file_size:
+        boundaries.append(file_size)
+    return boundaries
+
+
+def encode_lines(block, properties, selection, term_indices, property_pairs, property_names):
+    """
+    Parse the lines of a block of the data file and encode the subjects and objects of the relevant triples
+    The lines are split as bytes and the terms are used as keys of term_indices without decoding them, only the properties
+    are decoded (once per distinct property) and the terms of triples that are checked by the selection
+
+    Parameters
+    ----------
+    block : bytes
+        Complete lines of the data file
+    properties : set
+        Relevant properties
+    selection : TripleSelection
+        Selection of the triples that are loaded (None for all triples)
+    term_indices : dict
+        Index of every term (new terms get the next index, starting with 1)
+    property_pairs : dict
+        Dictionary with the property names as keys and tuples of two integer arrays (subjects and objects) as values
+    property_names : dict
+        Local names of the properties as they are written in the data (filled while parsing)
+    """
+    for line in block.split(b'\n'):
+        # remove the dot at the end of the triple and split the line into subject, property and object
+        terms = line.rstrip(b' \t\r.').split()
+        if len(terms) < 3:
+            continue
+        property = property_names.get(terms[1])
+        if property is None:
+            property = property_names[terms[1]] = split_term_bytes(terms[1])[1].decode('utf-8')
+        if property not in properties:
+            continue
+
+        subject = terms[0]
+        # literals may contain spaces
+        object = terms[2] if len(terms) == 3 else b' '.join(terms[2:])
+        if selection is not None and selection.restricts(property) and not selection.matches(property, subject.decode('utf-8'), object.decode('utf-8')):
+            continue
+        subjects, objects = property_pairs[property]
+        subjects.append(term_indices.setdefault(subject, len(term_indices) + 1))
+        objects.append(term_indices.setdefault(object, len(term_indices) + 1))
+
+
+def parse_chunk(chunk):
+    """
+    Parse a byte range of the data file (runs in a worker process of partition_data_parallel)
+    The terms are encoded with local indices (1 to n in the order of their first occurrence in the chunk)
+
+    Parameters
+    ----------
+    chunk : tuple
+        Path to the data file, start and end of the byte range, list of relevant properties and selection of the triples (or None)
+
+    Returns
+    -------
+    terms : list
+        Terms of the chunk, the term with local index i is stored at position i - 1
+    fragments : dict
+        Dictionary with the property names as keys and tuples of two int32 arrays (local indices of the subjects and objects) as values
+    """
+    data_path, start, end, properties, selection = chunk
+
+    with open(data_path, 'rb') as data_file:
+        data_file.seek(start)
+        block = data_file.read(end - start)
+    return parse_block((block, properties, selection))
+
+
+def parse_block(task):
+    """
+    Parse a block of complete lines of the data file (runs in a worker process of partition_data_parallel)
+
+    Parameters
+    ----------
+    task : tuple
+        Block (bytes), list of relevant properties and selection of the triples (or None)
+
+    Returns
+    -------
+    tuple
+        Terms and fragments of the block (see parse_chunk)
+    """
+    block, properties, selection = task
+
+    local_dict = {}
+    fragments = {property_name: (array('i'), array('i')) for property_name in properties}
+    encode_lines(block, set(properties), selection, local_dict, fragments, {})
+
+    fragments = {property_name: (np.frombuffer(subjects, dtype=np.int32), np.frombuffer(objects, dtype=np.int32))
+                 for property_name, (subjects, objects) in fragments.items()}
+    return list(local_dict), fragments
 
 
 if __name__ == '__main__':
@@ -1,15 +1,464 @@
 from collections import defaultdict
 
+import numpy as np
+
 class HashMap():
     """
-    Hash map implementation
+    Hash map implementation (dictionary of lists, replaced by IntHashTable in the joins and kept as baseline for benchmark_hash_table.py)
     """
 
     def __init__(self):
         self.hash_table = defaultdict(list)
-    
+
     def insert(self, key, value):
         self.hash_table[key].append(value)
 
     def get(self, key):
-        return self.hash_table[key]
\ No newline at end of file
+        return self.hash_table[key]
+
+
+def hash_function(integer):
+    """
+    Hash function for the hash join (taken from: https://stackoverflow.com/questions/664014/what-integer-hash-function-are-good-that-accepts-an-integer-hash-key)
+
+    Parameters
+    ----------
+    integer : int
+        Integer that should be hashed
+
+    Returns
+    -------
+    integer : int
+        Hash of the integer
+
+    """
+    integer = ((integer >> 16) ^ integer) * 0x45d9f3b
+    integer = ((integer >> 16) ^ integer) * 0x45d9f3b
+    integer = (integer >> 16) ^ integer
+    return integer
+
+
+def hash_array(integers):
+    """
+    Vectorized version of hash_function for a whole array of integers
+    The integers are folded to 32 bits first and every step is done modulo 2^32
+
+    Parameters
+    ----------
+    integers : np.ndarray
+        Integers that should be hashed
+
+    Returns
+    -------
+    np.ndarray
+        Hashes of the integers (uint64 array with values below 2^32)
+    """
+    mask = np.uint64(0xffffffff)
+    integers = np.asarray(integers).astype(np.uint64)
+    # fold the upper 32 bits into the lower 32 bits (join keys of two variables use all 64 bits)
+    integers = (integers >> np.uint64(32)) ^ (integers & mask)
+    integers = (((integers >> np.uint64(16)) ^ integers) * np.uint64(0x45d9f3b)) & mask
+    integers = (((integers >> np.uint64(16)) ^ integers) * np.uint64(0x45d9f3b)) & mask
+    integers = (integers >> np.uint64(16)) ^ integers
+    return integers
+
+
+class IntHashTable():
+    """
+    Array-backed hash table for integer keys with open addressing and linear probing
+    The distinct keys are stored in an array of slots, the rows of every key are stored next to each other in a second array
+    (CSR layout), so a key with many rows needs one slot only. Build and probe work on whole arrays of keys at once: in every
+    round all pending keys look at their next slot, so the number of rounds is the length of the longest probe sequence
+    With radix_bits > 0, the slots are split into 2^radix_bits sub-tables (selected by the upper bits of the hash) that are
+    small enough to stay in the cache, and the keys are processed sub-table by sub-table
+    """
+
+    # the table has at least twice as many slots as keys (load factor at most 0.5)
+    LOAD_FACTOR = 0.5
+
+    def __init__(self, keys, radix_bits=0):
+        """
+        Build the hash table
+
+        Parameters
+        ----------
+        keys : np.ndarray
+            Integer keys of the build side (the row of a key is its index in the array)
+        radix_bits : int
+            Number of hash bits that select the sub-table (0 for a single table)
+        """
+        keys = np.asarray(keys)
+        self.radix_bits = radix_bits
+        hashes = hash_array(keys)
+
+        # all sub-tables have the same power of two size, large enough for the largest sub-table
+        partitions = self.partitions(hashes)
+        largest_partition = int(np.bincount(partitions).max()) if len(keys) else 0
+        sub_capacity = 1
+        while sub_capacity * self.LOAD_FACTOR < max(largest_partition, 1):
+            sub_capacity *= 2
+        self.sub_mask = np.uint64(sub_capacity - 1)
+        capacity = sub_capacity << radix_bits
+
+        self.slot_keys = np.zeros(capacity, dtype=keys.dtype)
+        self.occupied = np.zeros(capacity, dtype=bool)
+        # length of the longest probe sequence (probing stops after it)
+        self.max_probe_length = 0
+
+        # insert the keys in rounds, equal keys end up in the same slot
+        key_slots = np.empty(len(keys), dtype=np.int64)
+        pending = self.partition_order(partitions)
+        steps = np.zeros(len(keys), dtype=np.uint64)
+        while len(pending):
+            slots = self.slots(hashes[pending], partitions[pending], steps[pending])
+            occupied = self.occupied[slots]
+            found = occupied & (self.slot_keys[slots] == keys[pending])
+            key_slots[pending[found]] = slots[found]
+
+            # of all keys that want the same empty slot, the first one gets it (the others check the slot again)
+            empty = np.nonzero(~occupied)[0]
+            empty_slots, first = np.unique(slots[empty], return_index=True)
+            winners = empty[first]
+            self.slot_keys[empty_slots] = keys[pending[winners]]
+            self.occupied[empty_slots] = True
+            key_slots[pending[winners]] = empty_slots
+
+            # keys that found a slot with another key continue with the next slot
+            collided = occupied & ~found
+            steps[pending[collided]] += np.uint64(1)
+            done = found
+            done[winners] = True
+            pending = pending[~done]
+            if len(pending):
+                self.max_probe_length = max(self.max_probe_length, int(steps[pending].max()))
+
+        # group the rows by slot, the rows of slot i are rows[slot_offsets[i]:slot_offsets[i + 1]]
+        self.rows = np.argsort(key_slots, kind='stable')
+        self.slot_offsets = np.zeros(capacity + 1, dtype=np.int64)
+        np.cumsum(np.bincount(key_slots, minlength=capacity), out=self.slot_offsets[1:])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def partitions(self, hashes):
+        """
+        Sub-table of every hash (the upper radix_bits of the 32 bit hash)
+        """
+        if not self.radix_bits:
+            return np.zeros(len(hashes), dtype=np.int64)
+        return (hashes >> np.uint64(32 - self.radix_bits)).astype(np.int64)
+
+    def partition_order(self, partitions):
+        """
+        Order in which the keys are processed (sub-table by sub-table if the table is radix-partitioned)
+        """
+        if not self.radix_bits:
+            return np.arange(len(partitions))
+        return np.argsort(partitions, kind='stable')
+
+    def slots(self, hashes, partitions, steps):
+        """
+        Slot of every key after the given number of steps of linear probing (within the sub-table of the key)
+        """
+        sub_capacity = int(self.sub_mask) + 1
+        return partitions * sub_capacity + ((hashes + steps) & self.sub_mask).astype(np.int64)
+
+    def lookup(self, probe_keys):
+        """
+        Find the slot of every probe key
+
+        Parameters
+        ----------
+        probe_keys : np.ndarray
+            Keys that are looked up
+
+        Returns
+        -------
+        np.ndarray
+            Slot of every probe key (-1 if the key is not contained in the hash table)
+        """
+        probe_keys = np.asarray(probe_keys)
+        hashes = hash_array(probe_keys)
+        partitions = self.partitions(hashes)
+        probe_slots = np.full(len(probe_keys), -1, dtype=np.int64)
+
+        pending = self.partition_order(partitions)
+        for step in range(self.max_probe_length + 1):
+            if not len(pending):
+                break
+            slots = self.slots(hashes[pending], partitions[pending], np.uint64(step))
+            occupied = self.occupied[slots]
+            found = occupied & (self.slot_keys[slots] == probe_keys[pending])
+            probe_slots[pending[found]] = slots[found]
+            # an empty slot ends the probe sequence, the key is not contained
+            pending = pending[occupied & ~found]
+        return probe_slots
+
+    def contains(self, probe_keys):
+        """
+        Check which probe keys are contained in the hash table
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array, True if the probe key is contained
+        """
+        return self.lookup(probe_keys) >= 0
+
+    def probe(self, probe_keys):
+        """
+        Probe the hash table with an array of keys
+
+        Parameters
+        ----------
+        probe_keys : np.ndarray
+            Keys of the probe side
+
+        Returns
+        -------
+        build_indices : np.ndarray
+            Row of the build key of every match
+        probe_indices : np.ndarray
+            Index of the probe key of every match (in increasing order)
+        """
+        probe_slots = self.lookup(probe_keys)
+        matched = np.nonzero(probe_slots >= 0)[0]
+        starts = self.slot_offsets[probe_slots[matched]]
+        counts = self.slot_offsets[probe_slots[matched] + 1] - starts
+        range_indices, positions = expand_ranges(starts, counts)
+        return self.rows[positions], matched[range_indices]
+
+
+def match_sorted_keys(sorted_keys, probe_keys):
+    """
+    Find all matches of the probe keys in a sorted array of keys (the sorted array may contain duplicates)
+
+    Parameters
+    ----------
+    sorted_keys : np.ndarray
+        Sorted array of keys
+    probe_keys : np.ndarray
+        Keys that are looked up in the sorted array
+
+    Returns
+    -------
+    probe_indices : np.ndarray
+        Index of the probe key of every match
+    positions : np.ndarray
+        Position in the sorted array of every match
+    """
+    # every probe key matches the range [start, end) of the sorted keys
+    start = np.searchsorted(sorted_keys, probe_keys, side='left')
+    end = np.searchsorted(sorted_keys, probe_keys, side='right')
+    return expand_ranges(start, end - start)
+
+
+def expand_ranges(starts, counts):
+    """
+    Enumerate all positions of a list of ranges [starts[i], starts[i] + counts[i])
+
+    Parameters
+    ----------
+    starts : np.ndarray
+        Start of every range
+    counts : np.ndarray
+        Length of every range
+
+    Returns
+    -------
+    range_indices : np.ndarray
+        Index of the range of every position
+    positions : np.ndarray
+        All positions of all ranges (the positions of a range are stored one after another)
+    """
+    range_indices = np.repeat(np.arange(len(counts)), counts)
+    # the positions of a range are written one after another, starting at group_starts
+    group_starts = np.cumsum(counts) - counts
+    positions = np.arange(counts.sum()) - np.repeat(group_starts - starts, counts)
+    return range_indices, positions
+
+
+def gather_ranges(source, starts, lengths):
+    """
+    Concatenate the ranges source[starts[i]:starts[i] + lengths[i]] of a byte array (all ranges at once)
+
+    Parameters
+    ----------
+    source : np.ndarray
+        uint8 array the ranges are taken from
+    starts : np.ndarray
+        Start of every range
+    lengths : np.ndarray
+        Length of every range
+
+    Returns
+    -------
+    data : np.ndarray
+        uint8 array with the ranges one after another
+    offsets : np.ndarray
+        Range i is stored at data[offsets[i]:offsets[i + 1]]
+    """
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    positions = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - starts, lengths)
+    return source[positions], offsets
+
+
+def compressed_rows(sorted_keys):
+    """
+    Build the compressed sparse row (CSR) index of a sorted array of keys
+
+    Parameters
+    ----------
+    sorted_keys : np.ndarray
+        Sorted array of keys
+
+    Returns
+    -------
+    keys : np.ndarray
+        Distinct keys
+    offsets : np.ndarray
+        The entries of keys[i] are stored at the positions offsets[i] to offsets[i + 1] (exclusive)
+    """
+    keys, starts = np.unique(sorted_keys, return_index=True)
+    offsets = np.append(starts, len(sorted_keys)).astype(np.int64)
+    return keys, offsets
+
+
+class PropertyTable():
+    """
+    Columnar property table
+    The triples are stored twice as int32 arrays, once sorted by (subject, object) and once sorted by (object, subject)
+    Both orders have a CSR index, so the objects of a subject and the subjects of an object can be found with a binary search
+    Duplicate triples are removed (a property table is a set of triples)
+    """
+
+    # names of the arrays of a property table (used to store and load the property table without rebuilding it)
+    ARRAYS = ('subjects', 'objects', 'subject_keys', 'subject_offsets', 'os_objects', 'os_subjects', 'object_keys', 'object_offsets')
+
+    def __init__(self, subjects, objects):
+        """
+        Initialize the property table and build the sorted arrays and the CSR indices
+
+        Parameters
+        ----------
+        subjects : array-like
+            Integer encodings of the subjects of the triples
+        objects : array-like
+            Integer encodings of the objects of the triples (same length as subjects)
+        """
+        subjects = np.asarray(subjects, dtype=np.int32)
+        objects = np.asarray(objects, dtype=np.int32)
+
+        # subject -> objects: triples sorted by subject and then by object
+        order = np.lexsort((objects, subjects))
+        subjects, objects = subjects[order], objects[order]
+        # remove duplicate triples (equal neighbours after sorting)
+        unique = np.ones(len(subjects), dtype=bool)
+        unique[1:] = (subjects[1:] != subjects[:-1]) | (objects[1:] != objects[:-1])
+        self.subjects = subjects = subjects[unique]
+        self.objects = objects = objects[unique]
+        self.subject_keys, self.subject_offsets = compressed_rows(self.subjects)
+
+        # object -> subjects: triples sorted by object and then by subject
+        order = np.lexsort((subjects, objects))
+        self.os_objects = objects[order]
+        self.os_subjects = subjects[order]
+        self.object_keys, self.object_offsets = compressed_rows(self.os_objects)
+
+    @classmethod
+    def from_dict(cls, property_table_int):
+        """
+        Create a columnar property table from a dictionary with the objects as keys and lists of subjects as values
+
+        Parameters
+        ----------
+        property_table_int : dict
+            Dictionary that contains for each object a list of subjects
+
+        Returns
+        -------
+        PropertyTable
+            Columnar property table
+        """
+        subjects = [subject for subjects in property_table_int.values() for subject in subjects]
+        objects = [object for object, subjects in property_table_int.items() for _ in subjects]
+        return cls(subjects, objects)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Create a property table from already sorted and indexed arrays (e.g. memory-mapped arrays of the dataset cache)
+        The arrays are used as they are, nothing is copied or sorted
+
+        Parameters
+        ----------
+        arrays : dict
+            Dictionary that contains an array for each name in PropertyTable.ARRAYS
+
+        Returns
+        -------
+        PropertyTable
+            Property table that uses the given arrays
+        """
+        property_table = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(property_table, name, arrays[name])
+        return property_table
+
+    def __len__(self):
+        return len(self.subjects)
+
+    def objects_of(self, subject):
+        """
+        Get the objects of a subject
+
+        Parameters
+        ----------
+        subject : int
+            Integer encoding of the subject
+
+        Returns
+        -------
+        np.ndarray
+            Sorted objects of the subject (empty if the subject does not occur in the table)
+        """
+        index = np.searchsorted(self.subject_keys, subject)
+        if index == len(self.subject_keys) or self.subject_keys[index] != subject:
+            return self.objects[:0]
+        return self.objects[self.subject_offsets[index]:self.subject_offsets[index + 1]]
+
+    def subjects_of(self, object):
+        """
+        Get the subjects of an object
+
+        Parameters
+        ----------
+        object : int
+            Integer encoding of the object
+
+        Returns
+        -------
+        np.ndarray
+            Sorted subjects of the object (empty if the object does not occur in the table)
+        """
+        index = np.searchsorted(self.object_keys, object)
+        if index == len(self.object_keys) or self.object_keys[index] != object:
+            return self.os_subjects[:0]
+        return self.os_subjects[self.object_offsets[index]:self.object_offsets[index + 1]]
+
+    def to_dict(self):
+        """
+        Convert the property table into a dictionary with the objects as keys and lists of subjects as values
+
+        Returns
+        -------
+        dict
+            Dictionary that contains for each object a list of subjects
+        """
+        property_table_int = defaultdict(list)
+        subjects = self.os_subjects.tolist()
+        offsets = self.object_offsets.tolist()
+        for index, object in enumerate(self.object_keys.tolist()):
+            property_table_int[object] = subjects[offsets[index]:offsets[index + 1]]
+        return property_table_int
@@ -0,0 +1,161 @@
+import json
+import mmap
+import os
+
+import numpy as np
+
+from data_structures import PropertyTable
+from optimizer import PropertyStatistics
+from term_dictionary import TermDictionary
+
+# every cache file starts with the magic bytes and the length of the JSON header
+MAGIC = b'ADBISDS1'
+VERSION = 3
+# arrays are stored at offsets that are a multiple of ALIGNMENT bytes
+ALIGNMENT = 64
+
+
+def source_signature(data_path):
+    """
+    Get the size and the modification time of the data file, the cache is only valid for the same values
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the data file
+
+    Returns
+    -------
+    tuple
+        Size in bytes and modification time in nanoseconds
+    """
+    stat = os.stat(data_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def write_cache(cache_path, data_path, term_dictionary, property_tables, statistics, selection=None):
+    """
+    Write the dictionary-encoded dataset (term dictionary, columnar property tables and their statistics) to a binary cache file
+    The file is written to a temporary file first and then renamed, so other processes never see a partially written cache
+
+    Parameters
+    ----------
+    cache_path : str
+        Path to the cache file
+    data_path : str
+        Path to the data file the dataset was loaded from
+    term_dictionary : TermDictionary
+        Term dictionary of the subjects and objects
+    property_tables : dict
+        Dictionary with the property names as keys and the columnar property tables as values
+    statistics : dict
+        Dictionary with the property names as keys and the statistics of the property tables as values (stored in the header)
+    selection : str
+        Description of the selection of the triples the dataset was loaded with (None if all triples were loaded)
+    """
+    arrays = {}
+
+    for name in TermDictionary.ARRAYS:
+        arrays[f'terms/{name}'] = np.ascontiguousarray(getattr(term_dictionary, name))
+
+    for property_name, property_table in property_tables.items():
+        for name in PropertyTable.ARRAYS:
+            arrays[f'tables/{property_name}/{name}'] = np.ascontiguousarray(getattr(property_table, name))
+
+    # compute the position of every array in the file
+    source_size, source_mtime_ns = source_signature(data_path)
+    header = {
+        'version': VERSION,
+        'source_size': source_size,
+        'source_mtime_ns': source_mtime_ns,
+        'properties': list(property_tables),
+        'selection': selection,
+        'namespaces': term_dictionary.namespaces,
+        'statistics': {property_name: property_statistics.to_dict() for property_name, property_statistics in statistics.items()},
+        'arrays': {},
+    }
+    position = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = [position, array.dtype.str, len(array)]
+        position += _aligned(array.nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _aligned(len(MAGIC) + 8 + len(header_bytes))
+
+    temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as cache_file:
+        cache_file.write(MAGIC)
+        cache_file.write(len(header_bytes).to_bytes(8, 'little'))
+        cache_file.write(header_bytes)
+        for name, array in arrays.items():
+            cache_file.seek(data_start + header['arrays'][name][0])
+            cache_file.write(array.tobytes())
+        # make sure the file has its full size even if the last array is empty
+        cache_file.truncate(data_start + position)
+    os.replace(temporary_path, cache_path)
+
+
+def load_cache(cache_path, data_path, properties, selection=None):
+    """
+    Load the dictionary-encoded dataset from a cache file via mmap
+    All arrays are read-only views of the mapped file (zero-copy), so several processes share the same pages
+
+    Parameters
+    ----------
+    cache_path : str
+        Path to the cache file
+    data_path : str
+        Path to the data file, the cache is only used if size and modification time of the data file did not change
+    properties : list
+        List of relevant properties, the cache is only used if it contains all of them
+    selection : str
+        Description of the selection of the triples, the cache is only used if it was written with the same selection
+
+    Returns
+    -------
+    tuple or None
+        Term dictionary (TermDictionary), the property tables (dict of PropertyTable) and their statistics (dict of PropertyStatistics)
+        None if the cache file does not exist or is not valid for the data file
+    """
+    if not os.path.exists(cache_path):
+        return None
+
+    with open(cache_path, 'rb') as cache_file:
+        if cache_file.read(len(MAGIC)) != MAGIC:
+            return None
+        header_length = int.from_bytes(cache_file.read(8), 'little')
+        header = json.loads(cache_file.read(header_length).decode('utf-8'))
+
+        if header['version'] != VERSION:
+            return None
+        if (header['source_size'], header['source_mtime_ns']) != source_signature(data_path):
+            return None
+        if not set(properties) <= set(header['properties']):
+            return None
+        if header.get('selection') != selection:
+            return None
+
+        # the mapping stays valid after the file is closed
+        mapped_file = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    data_start = _aligned(len(MAGIC) + 8 + header_length)
+
+    def array(name):
+        position, dtype, length = header['arrays'][name]
+        if length == 0:
+            return np.empty(0, dtype=np.dtype(dtype))
+        return np.frombuffer(mapped_file, dtype=np.dtype(dtype), count=length, offset=data_start + position)
+
+    term_dictionary = TermDictionary.from_arrays(header['namespaces'], {name: array(f'terms/{name}') for name in TermDictionary.ARRAYS})
+    property_tables = {
+        property_name: PropertyTable.from_arrays({name: array(f'tables/{property_name}/{name}') for name in PropertyTable.ARRAYS})
+        for property_name in properties
+    }
+    statistics = {property_name: PropertyStatistics.from_dict(header['statistics'][property_name]) for property_name in properties}
+    return term_dictionary, property_tables, statistics
+
+
+def _aligned(size):
+    """
+    Round the size up to the next multiple of ALIGNMENT
+    """
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
@@ -0,0 +1,269 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from data_structures import match_sorted_keys
+from grace_hash_join import DEFAULT_MEMORY_BUDGET
+
+# inputs are read in chunks, a chunk uses at most this fraction of the memory budget
+CHUNK_FRACTION = 8
+MIN_CHUNK_ROWS = 1024
+
+
+def chunk_rows(columns, memory_budget):
+    """
+    Number of rows of a chunk of the columns that uses a small fraction of the memory budget
+    """
+    bytes_per_row = sum(column.dtype.itemsize for column in columns)
+    return max(memory_budget // (CHUNK_FRACTION * bytes_per_row), MIN_CHUNK_ROWS)
+
+
+def read_chunks(columns, memory_budget):
+    """
+    Read columns (e.g. memory-mapped arrays) in chunks of rows
+
+    Parameters
+    ----------
+    columns : list
+        Arrays with the same length
+    memory_budget : int
+        Memory budget in bytes
+
+    Yields
+    ------
+    list
+        Chunk of every column
+    """
+    rows = chunk_rows(columns, memory_budget)
+    for start in range(0, len(columns[0]), rows):
+        yield [np.asarray(column[start:start + rows]) for column in columns]
+
+
+def generate_runs(columns, memory_budget, directory):
+    """
+    Run generation of the external merge sort: the input is read in chunks that fit into the memory budget, every chunk is
+    sorted by its first column and written to its own run files (one binary file per column)
+
+    Parameters
+    ----------
+    columns : list
+        Columns of the input, the first column is the sort key
+    memory_budget : int
+        Memory budget in bytes
+    directory : str
+        Directory of the run files
+
+    Returns
+    -------
+    list
+        Sorted runs, every run is a list of memory-mapped columns
+    """
+    bytes_per_row = sum(column.dtype.itemsize for column in columns)
+    # the chunk, its sort order and the sorted copy have to fit into the memory budget
+    rows = max(memory_budget // (3 * bytes_per_row), MIN_CHUNK_ROWS)
+
+    runs = []
+    for start in range(0, len(columns[0]), rows):
+        chunk = [np.asarray(column[start:start + rows]) for column in columns]
+        order = np.argsort(chunk[0], kind='stable')
+        run = []
+        for index, column in enumerate(chunk):
+            path = os.path.join(directory, f'run_{len(runs)}_{index}.bin')
+            column[order].tofile(path)
+            run.append(np.memmap(path, dtype=column.dtype, mode='r', shape=(len(order),)))
+        runs.append(run)
+    return runs
+
+
+def merge_runs(runs, memory_budget):
+    """
+    k-way merge of sorted runs, the runs are read block by block
+    In every step, the smallest last key of the current blocks is the bound: all rows with a key up to the bound are in the
+    current blocks, so they can be merged (sorted) in memory and returned, the run of the bound moves on to its next block
+
+    Parameters
+    ----------
+    runs : list
+        Sorted runs, every run is a list of columns (sorted by the first column)
+    memory_budget : int
+        Memory budget in bytes
+
+    Yields
+    ------
+    list
+        Sorted chunk of every column, the chunks are sorted one after another
+    """
+    if not runs:
+        return
+    block_rows = max(chunk_rows(runs[0], memory_budget) // len(runs), MIN_CHUNK_ROWS)
+    positions = [0] * len(runs)
+
+    while True:
+        blocks = [[column[position:position + block_rows] for column in run]
+                  for run, position in zip(runs, positions) if position < len(run[0])]
+        active = [index for index, (run, position) in enumerate(zip(runs, positions)) if position < len(run[0])]
+        if not blocks:
+            return
+
+        bound = min(block[0][-1] for block in blocks)
+        parts = []
+        for index, block in zip(active, blocks):
+            count = int(np.searchsorted(block[0], bound, side='right'))
+            parts.append([np.asarray(column[:count]) for column in block])
+            positions[index] += count
+
+        merged = [np.concatenate(columns) for columns in zip(*parts)]
+        order = np.argsort(merged[0], kind='stable')
+        yield [column[order] for column in merged]
+
+
+def external_sort(columns, memory_budget=DEFAULT_MEMORY_BUDGET, spill_directory=None):
+    """
+    Sort columns by their first column, inputs that do not fit into the memory budget are sorted with an external merge sort
+    (run generation and k-way merge of the runs on disk)
+
+    Parameters
+    ----------
+    columns : list
+        Columns of the input, the first column is the sort key
+    memory_budget : int
+        Memory budget in bytes
+    spill_directory : str
+        Directory for the run files (the default temporary directory if None)
+
+    Yields
+    ------
+    list
+        Sorted chunk of every column, the chunks are sorted one after another
+    """
+    columns = list(columns)
+    if sum(column.nbytes for column in columns) * 3 <= memory_budget:
+        columns = [np.asarray(column) for column in columns]
+        order = np.argsort(columns[0], kind='stable')
+        yield [column[order] for column in columns]
+        return
+
+    directory = tempfile.mkdtemp(prefix='external_sort_', dir=spill_directory)
+    try:
+        yield from merge_runs(generate_runs(columns, memory_budget, directory), memory_budget)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class SortedStream():
+    """
+    Buffer over a stream of sorted chunks (used by merge_join)
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.columns = None
+        self.exhausted = False
+
+    def __len__(self):
+        return 0 if self.columns is None else len(self.columns[0])
+
+    def fill(self):
+        """
+        Append the next chunk of the stream to the buffer
+        """
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.exhausted = True
+        elif self.columns is None or not len(self):
+            self.columns = list(chunk)
+        else:
+            self.columns = [np.concatenate([buffered, column]) for buffered, column in zip(self.columns, chunk)]
+
+    def limit(self):
+        """
+        Last key of the buffer (None if the stream is exhausted, then the buffer contains all remaining keys)
+        """
+        return None if self.exhausted else self.columns[0][-1]
+
+    def take(self, bound):
+        """
+        Remove the rows with a key below the bound from the buffer (all rows if bound is None) and return them
+        """
+        count = len(self) if bound is None else int(np.searchsorted(self.columns[0], bound, side='left'))
+        taken = [column[:count] for column in self.columns]
+        self.columns = [column[count:] for column in self.columns]
+        return taken
+
+
+def merge_join(left_chunks, right_chunks):
+    """
+    Streaming merge join of two streams of chunks that are sorted by their first column (the join key)
+    Only the rows with keys below the smaller last key of both buffers are joined, because all rows with these keys are already
+    in the buffers. The buffer that ends with this key is extended with its next chunk
+
+    Parameters
+    ----------
+    left_chunks : iterable
+        Sorted chunks (lists of columns) of the left input
+    right_chunks : iterable
+        Sorted chunks (lists of columns) of the right input
+
+    Yields
+    ------
+    left_rows : list
+        Columns of the left side of a chunk of matches
+    right_rows : list
+        Columns of the right side of the same matches
+    """
+    left, right = SortedStream(left_chunks), SortedStream(right_chunks)
+    while True:
+        for stream in (left, right):
+            while not len(stream) and not stream.exhausted:
+                stream.fill()
+        if not len(left) or not len(right):
+            return
+
+        limits = [limit for limit in (left.limit(), right.limit()) if limit is not None]
+        bound = min(limits) if limits else None
+        left_rows, right_rows = left.take(bound), right.take(bound)
+        if len(left_rows[0]) and len(right_rows[0]):
+            left_indices, right_indices = match_sorted_keys(right_rows[0], left_rows[0])
+            yield [column[left_indices] for column in left_rows], [column[right_indices] for column in right_rows]
+        if bound is None:
+            return
+
+        # the streams that end with the bound need more rows to complete the rows of the bound
+        for stream in (left, right):
+            if stream.limit() == bound:
+                stream.fill()
+
+
+def external_sort_merge_join(left_columns, right_columns, memory_budget=DEFAULT_MEMORY_BUDGET, spill_directory=None,
+                             left_sorted=False, right_sorted=False):
+    """
+    Sort merge join for inputs beyond the memory budget: inputs that are not sorted by the join key are sorted with the external
+    merge sort, then both sorted streams are merged without loading them completely
+
+    Parameters
+    ----------
+    left_columns : list
+        Columns of the left input, the first column contains the join keys
+    right_columns : list
+        Columns of the right input, the first column contains the join keys
+    memory_budget : int
+        Memory budget in bytes
+    spill_directory : str
+        Directory for the run files (the default temporary directory if None)
+    left_sorted : bool
+        True if the left input is already sorted by the join key (e.g. the SO or OS index of a property table)
+    right_sorted : bool
+        True if the right input is already sorted by the join key
+
+    Yields
+    ------
+    left_rows : list
+        Columns of the left side of a chunk of matches
+    right_rows : list
+        Columns of the right side of the same matches
+    """
+    left_chunks = read_chunks(left_columns, memory_budget) if left_sorted else external_sort(left_columns, memory_budget, spill_directory)
+    right_chunks = read_chunks(right_columns, memory_budget) if right_sorted else external_sort(right_columns, memory_budget, spill_directory)
+    yield from merge_join(left_chunks, right_chunks)
@@ -0,0 +1,229 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from data_structures import IntHashTable, hash_array
+
+# default memory budget of the partitioned hash join in bytes
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+# memory of one build row in the in-memory hash table (two slots with key and offset at load factor 0.5, the row and its hash)
+BYTES_PER_BUILD_ROW = 48
+# a partition is split with 8 bits of the 32 bit hash, so there are at most 256 partitions per level and 4 levels
+PARTITION_BITS = 8
+MAX_DEPTH = 32 // PARTITION_BITS
+# inputs are read and partitioned in chunks, a chunk uses at most this fraction of the memory budget
+CHUNK_FRACTION = 8
+MIN_CHUNK_ROWS = 1024
+
+
+class SpillFiles():
+    """
+    Spill files of the partitions of one side of a join
+    Every column of every partition is stored in its own binary file, chunks are appended to the end of the files
+    """
+
+    def __init__(self, directory, name, number_of_partitions, dtypes):
+        """
+        Initialize the (still empty) spill files
+
+        Parameters
+        ----------
+        directory : str
+            Directory of the spill files
+        name : str
+            Name of the side of the join (part of the file names)
+        number_of_partitions : int
+            Number of partitions
+        dtypes : list
+            dtype of every column
+        """
+        self.directory = directory
+        self.name = name
+        self.dtypes = list(dtypes)
+        self.lengths = [0] * number_of_partitions
+
+    def path(self, partition, column):
+        return os.path.join(self.directory, f'{self.name}_{partition}_{column}.bin')
+
+    def append(self, partition, columns):
+        """
+        Append rows to a partition
+
+        Parameters
+        ----------
+        partition : int
+            Number of the partition
+        columns : list
+            One array for each column (all arrays have the same length)
+        """
+        for column, values in enumerate(columns):
+            with open(self.path(partition, column), 'ab') as spill_file:
+                np.ascontiguousarray(values, dtype=self.dtypes[column]).tofile(spill_file)
+        self.lengths[partition] += len(columns[0])
+
+    def read(self, partition):
+        """
+        Read a partition, the spill files are memory-mapped so that the partition can be read chunk by chunk
+
+        Parameters
+        ----------
+        partition : int
+            Number of the partition
+
+        Returns
+        -------
+        list
+            One array for each column
+        """
+        length = self.lengths[partition]
+        if not length:
+            return [np.empty(0, dtype=dtype) for dtype in self.dtypes]
+        return [np.memmap(self.path(partition, column), dtype=dtype, mode='r', shape=(length,))
+                for column, dtype in enumerate(self.dtypes)]
+
+    def remove(self, partition):
+        """
+        Delete the spill files of a partition
+        """
+        if self.lengths[partition]:
+            for column in range(len(self.dtypes)):
+                os.remove(self.path(partition, column))
+
+
+def partitioned_hash_join(build_columns, probe_columns, memory_budget=DEFAULT_MEMORY_BUDGET, spill_directory=None, hybrid=False):
+    """
+    Memory-budgeted hash join (Grace hash join, or hybrid hash join if hybrid is True)
+    If the hash table of the build side fits into the memory budget, the join is done in memory. Otherwise both sides are
+    hash-partitioned into spill files (chunk by chunk) and every pair of partitions is joined in memory. Partitions that are
+    still too large are partitioned again with the next bits of the hash
+    The hybrid variant keeps the first partition of the build side in memory and joins the rows of the first partition of the
+    probe side while the probe side is partitioned, so this partition is never written to disk
+    The inputs can be memory-mapped arrays (e.g. of the dataset cache), they are only read in chunks
+
+    Parameters
+    ----------
+    build_columns : list
+        Columns of the build side, the first column contains the join keys
+    probe_columns : list
+        Columns of the probe side, the first column contains the join keys
+    memory_budget : int
+        Memory budget in bytes
+    spill_directory : str
+        Directory for the spill files (the default temporary directory if None)
+    hybrid : bool
+        If True, the hybrid hash join is used
+
+    Yields
+    ------
+    build_rows : list
+        Columns of the build side of a chunk of matches
+    probe_rows : list
+        Columns of the probe side of the same matches
+    """
+    directory = tempfile.mkdtemp(prefix='hash_join_', dir=spill_directory)
+    try:
+        yield from _partitioned_join(list(build_columns), list(probe_columns), memory_budget, directory, hybrid, 0)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _partitioned_join(build_columns, probe_columns, memory_budget, directory, hybrid, depth):
+    """
+    Join one pair of (partitions of) inputs, see partitioned_hash_join
+    """
+    build_rows = len(build_columns[0])
+    if build_rows * BYTES_PER_BUILD_ROW <= memory_budget or depth == MAX_DEPTH:
+        yield from _in_memory_join(build_columns, probe_columns, memory_budget)
+        return
+
+    # every partition of the build side should use at most half of the memory budget
+    number_of_partitions = 2
+    while number_of_partitions < 2 ** PARTITION_BITS and build_rows * BYTES_PER_BUILD_ROW / number_of_partitions > memory_budget // 2:
+        number_of_partitions *= 2
+    resident_partition = 0 if hybrid else None
+
+    # partition the build side, the resident partition of the hybrid hash join stays in memory
+    build_spill = SpillFiles(directory, f'build_{depth}', number_of_partitions, [column.dtype for column in build_columns])
+    resident_parts = []
+    for chunk in _chunks(build_columns, memory_budget):
+        for partition, part in _split_by_partition(chunk, depth, number_of_partitions):
+            if partition == resident_partition:
+                resident_parts.append(part)
+            else:
+                build_spill.append(partition, part)
+
+    resident_columns, resident_table = None, None
+    if resident_parts:
+        resident_columns = [np.concatenate(columns) for columns in zip(*resident_parts)]
+        resident_table = IntHashTable(resident_columns[0])
+    del resident_parts
+
+    # partition the probe side, the rows of the resident partition are joined right away
+    probe_spill = SpillFiles(directory, f'probe_{depth}', number_of_partitions, [column.dtype for column in probe_columns])
+    for chunk in _chunks(probe_columns, memory_budget):
+        for partition, part in _split_by_partition(chunk, depth, number_of_partitions):
+            if partition != resident_partition:
+                probe_spill.append(partition, part)
+            elif resident_table is not None:
+                build_indices, probe_indices = resident_table.probe(part[0])
+                if len(build_indices):
+                    yield [column[build_indices] for column in resident_columns], [column[probe_indices] for column in part]
+    resident_columns, resident_table = None, None
+
+    # join the spilled partitions one after another
+    for partition in range(number_of_partitions):
+        if partition == resident_partition:
+            continue
+        if build_spill.lengths[partition] and probe_spill.lengths[partition]:
+            partition_build_columns = build_spill.read(partition)
+            if build_spill.lengths[partition] == build_rows:
+                # all keys have the same hash bits, partitioning again does not make the partition smaller
+                yield from _in_memory_join(partition_build_columns, probe_spill.read(partition), memory_budget)
+            else:
+                yield from _partitioned_join(partition_build_columns, probe_spill.read(partition), memory_budget, directory, hybrid, depth + 1)
+        build_spill.remove(partition)
+        probe_spill.remove(partition)
+
+
+def _in_memory_join(build_columns, probe_columns, memory_budget):
+    """
+    Join with an in-memory hash table of the build side, the probe side is read in chunks
+    """
+    if not len(build_columns[0]):
+        return
+    build_columns = [np.asarray(column) for column in build_columns]
+    table = IntHashTable(build_columns[0])
+    for chunk in _chunks(probe_columns, memory_budget):
+        build_indices, probe_indices = table.probe(chunk[0])
+        if len(build_indices):
+            yield [column[build_indices] for column in build_columns], [column[probe_indices] for column in chunk]
+
+
+def _chunks(columns, memory_budget):
+    """
+    Read the columns in chunks of rows that use a small fraction of the memory budget
+    """
+    bytes_per_row = sum(column.dtype.itemsize for column in columns)
+    chunk_rows = max(memory_budget // (CHUNK_FRACTION * bytes_per_row), MIN_CHUNK_ROWS)
+    for start in range(0, len(columns[0]), chunk_rows):
+        yield [np.asarray(column[start:start + chunk_rows]) for column in columns]
+
+
+def _split_by_partition(columns, depth, number_of_partitions):
+    """
+    Split a chunk of rows into the partitions of their join keys
+    The partition of a key on a level uses the next bits of its hash, starting with the upper bits (the hash table of a partition
+    uses the lower bits to find the slot of a key)
+    """
+    shift = 32 - PARTITION_BITS * (depth + 1)
+    partitions = (hash_array(columns[0]) >> np.uint64(shift)) & np.uint64(number_of_partitions - 1)
+    order = np.argsort(partitions, kind='stable')
+    ends = np.cumsum(np.bincount(partitions.astype(np.int64), minlength=number_of_partitions))
+    start = 0
+    for partition, end in enumerate(ends.tolist()):
+        if end > start:
+            rows = order[start:end]
+            yield partition, [column[rows] for column in columns]
+        start = end
@@ -0,0 +1,485 @@
+import numpy as np
+
+from data_structures import PropertyTable
+from query_engine import sum_by_key
+
+# the inserted and deleted triples of a property table are merged into a new property table when they are more than this
+# fraction of the property table (and at least MIN_COMPACTION_ROWS)
+COMPACTION_FRACTION = 0.1
+MIN_COMPACTION_ROWS = 4096
+
+
+def pair_codes(subjects, objects):
+    """
+    Pack subjects and objects into one int64 code per triple, the codes of a property table sorted by (subject, object) are sorted
+    """
+    return (np.asarray(subjects, dtype=np.int64) << 32) | np.asarray(objects, dtype=np.int64)
+
+
+def csr_neighbours(keys, offsets, values, lookup):
+    """
+    Neighbours of several keys in a CSR index at once
+
+    Parameters
+    ----------
+    keys : np.ndarray
+        Sorted keys of the CSR index
+    offsets : np.ndarray
+        The values of keys[i] are stored at the positions offsets[i] to offsets[i + 1] (exclusive)
+    values : np.ndarray
+        Values of the CSR index
+    lookup : np.ndarray
+        Keys whose values are looked up
+
+    Returns
+    -------
+    positions : np.ndarray
+        Position in lookup of every neighbour
+    neighbours : np.ndarray
+        Values of the looked up keys
+    """
+    if not len(keys) or not len(lookup):
+        return np.empty(0, dtype=np.int64), values[:0]
+    index = np.minimum(np.searchsorted(keys, lookup), len(keys) - 1)
+    found = keys[index] == lookup
+    starts = np.where(found, offsets[index], 0)
+    counts = np.where(found, offsets[index + 1] - offsets[index], 0)
+    positions = np.repeat(np.arange(len(lookup)), counts)
+    # position of every neighbour within the range of its key
+    ranks = np.arange(len(positions)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return positions, values[np.repeat(starts, counts) + ranks]
+
+
+class DeltaPropertyTable():
+    """
+    Property table that supports inserts and deletes: the triples of the immutable columnar property table (base) that were deleted
+    and the triples that were inserted are kept next to it and are merged into a new base by compact()
+    The inserted triples are a small PropertyTable, so the lookups of the base and of the inserted triples use the same CSR indices
+    """
+
+    def __init__(self, property_table):
+        """
+        Parameters
+        ----------
+        property_table : PropertyTable
+            Columnar property table of the loaded data
+        """
+        self.base = property_table
+        # codes (see pair_codes) of the base triples, built on the first update
+        self._base_codes = None
+        self.inserted = set()
+        self.deleted = set()
+        self.clear_indices()
+
+    def clear_indices(self):
+        # the arrays of the inserted and deleted triples are rebuilt on their next use
+        self._inserted_codes = None
+        self._inserted_table = None
+        self._deleted_codes = None
+
+    def __len__(self):
+        return len(self.base) - len(self.deleted) + len(self.inserted)
+
+    @property
+    def base_codes(self):
+        if self._base_codes is None:
+            self._base_codes = pair_codes(self.base.subjects, self.base.objects)
+        return self._base_codes
+
+    @property
+    def inserted_codes(self):
+        if self._inserted_codes is None:
+            self._inserted_codes = np.sort(np.fromiter(self.inserted, dtype=np.int64, count=len(self.inserted)))
+        return self._inserted_codes
+
+    @property
+    def inserted_table(self):
+        if self._inserted_table is None:
+            codes = self.inserted_codes
+            self._inserted_table = PropertyTable((codes >> 32).astype(np.int32), (codes & 0xFFFFFFFF).astype(np.int32))
+        return self._inserted_table
+
+    @property
+    def deleted_codes(self):
+        if self._deleted_codes is None:
+            self._deleted_codes = np.sort(np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted)))
+        return self._deleted_codes
+
+    def in_base(self, codes):
+        position = np.minimum(np.searchsorted(self.base_codes, codes), max(len(self.base_codes) - 1, 0))
+        return self.base_codes[position] == codes if len(self.base_codes) else np.zeros(len(codes), dtype=bool)
+
+    def contains(self, codes):
+        """
+        Check for several triples at once if they are in the property table
+
+        Parameters
+        ----------
+        codes : np.ndarray
+            Codes of the triples (see pair_codes)
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array, True for the triples of the property table
+        """
+        deleted = np.isin(codes, self.deleted_codes)
+        inserted = np.isin(codes, self.inserted_codes)
+        return (self.in_base(codes) & ~deleted) | inserted
+
+    def update(self, subjects, objects, sign):
+        """
+        Insert (sign 1) or delete (sign -1) triples, inserting a triple of the table or deleting a triple that is not in the
+        table does not change the table (a property table is a set of triples)
+
+        Parameters
+        ----------
+        subjects : np.ndarray
+            Subjects of the triples
+        objects : np.ndarray
+            Objects of the triples
+        sign : int
+            1 for inserts, -1 for deletes
+
+        Returns
+        -------
+        np.ndarray
+            Sorted distinct codes of the triples that changed the table
+        """
+        codes = np.unique(pair_codes(subjects, objects))
+        present = self.contains(codes)
+        codes = codes[~present] if sign > 0 else codes[present]
+        in_base = self.in_base(codes)
+
+        for code, base_triple in zip(codes.tolist(), in_base.tolist()):
+            if sign > 0 and base_triple:
+                self.deleted.discard(code)
+            elif sign > 0:
+                self.inserted.add(code)
+            elif base_triple:
+                self.deleted.add(code)
+            else:
+                self.inserted.discard(code)
+        if len(codes):
+            self.clear_indices()
+        return codes
+
+    def neighbours(self, lookup, forward=True):
+        """
+        Objects of several subjects (forward) or subjects of several objects (backward) at once
+
+        Parameters
+        ----------
+        lookup : np.ndarray
+            Subjects (forward) or objects (backward)
+        forward : bool
+            If True, the objects of the subjects are returned, otherwise the subjects of the objects
+
+        Returns
+        -------
+        positions : np.ndarray
+            Position in lookup of every neighbour
+        neighbours : np.ndarray
+            Neighbours of the looked up terms
+        """
+        results = []
+        for table in (self.base, self.inserted_table):
+            if forward:
+                positions, neighbours = csr_neighbours(table.subject_keys, table.subject_offsets, table.objects, lookup)
+                codes = pair_codes(lookup[positions], neighbours)
+            else:
+                positions, neighbours = csr_neighbours(table.object_keys, table.object_offsets, table.os_subjects, lookup)
+                codes = pair_codes(neighbours, lookup[positions])
+            if table is self.base and self.deleted:
+                keep = ~np.isin(codes, self.deleted_codes)
+                positions, neighbours = positions[keep], neighbours[keep]
+            results.append((positions, neighbours))
+        return np.concatenate([positions for positions, _ in results]), np.concatenate([neighbours for _, neighbours in results])
+
+    def triples(self):
+        """
+        Subjects and objects of all triples of the table
+        """
+        keep = ~np.isin(self.base_codes, self.deleted_codes) if self.deleted else slice(None)
+        inserted = self.inserted_table
+        return (np.concatenate([self.base.subjects[keep], inserted.subjects]),
+                np.concatenate([self.base.objects[keep], inserted.objects]))
+
+    def needs_compaction(self):
+        changes = len(self.inserted) + len(self.deleted)
+        return changes >= MIN_COMPACTION_ROWS and changes > COMPACTION_FRACTION * len(self.base)
+
+    def compact(self):
+        """
+        Merge the inserted and deleted triples into a new base property table
+
+        Returns
+        -------
+        PropertyTable
+            New base property table
+        """
+        self.base = PropertyTable(*self.triples())
+        self._base_codes = None
+        self.inserted, self.deleted = set(), set()
+        self.clear_indices()
+        return self.base
+
+
+class IncrementalView():
+    """
+    Incrementally maintained path query p_1 ⋈ p_2 ⋈ ... ⋈ p_n with p_i.object = p_(i+1).subject (e.g. the query of the assignment)
+    For every term v the view keeps two count vectors (indexed by the dense term indices):
+        forward[i][v]: number of paths through the first i property tables that end at v (forward[0] is 1 for every term)
+        backward[i][v]: number of paths through the property tables i to n that start at v (backward[n] is 1 for every term)
+    The number of results is the sum of forward[n] and a triple (s, o) of p_i is in the Yannakakis-reduced table of p_i if
+    forward[i][s] > 0 and backward[i + 1][o] > 0
+    The count vectors are linear in every property table, so a change of p_i is propagated with the delta rules
+        Δforward[i + 1] = forward[i] ⋈ Δp_i,  Δforward[j + 1] = Δforward[j] ⋈ p_j for j > i
+        Δbackward[i] = Δp_i ⋈ backward[i + 1],  Δbackward[j] = p_j ⋈ Δbackward[j + 1] for j < i
+    so the cost of an update is proportional to the number of paths through the changed triples, not to the size of the data
+    """
+
+    def __init__(self, preprocessor, properties=('follows', 'friendOf', 'likes', 'hasReview')):
+        """
+        Build the count vectors from the loaded property tables
+
+        Parameters
+        ----------
+        preprocessor : DataPreprocessor
+            Preprocessor that contains the property tables, compacted property tables replace its property tables
+        properties : list
+            Properties of the path in the order of the path (every property at most once)
+        """
+        if len(set(properties)) != len(properties):
+            raise ValueError("Every property can occur only once in the path")
+        self.preprocessor = preprocessor
+        self.properties = list(properties)
+        self.tables = [DeltaPropertyTable(preprocessor.property_tables[property_name]) for property_name in self.properties]
+        self.term_dictionary = preprocessor.term_dictionary
+        # number of terms the count vectors are built for (see grow)
+        self.number_of_terms = len(self.term_dictionary)
+
+        n = len(self.tables)
+        size = self.number_of_terms + 1
+        self.forward = [np.ones(size, dtype=np.int64)] + [None] * n
+        for i, table in enumerate(self.tables):
+            self.forward[i + 1] = np.zeros(size, dtype=np.int64)
+            np.add.at(self.forward[i + 1], table.base.objects, self.forward[i][table.base.subjects])
+        self.backward = [None] * n + [np.ones(size, dtype=np.int64)]
+        for i in reversed(range(n)):
+            table = self.tables[i]
+            self.backward[i] = np.zeros(size, dtype=np.int64)
+            np.add.at(self.backward[i], table.base.subjects, self.backward[i + 1][table.base.objects])
+        self.count = int(self.forward[n].sum())
+
+        # bookkeeping of the current batch (see apply)
+        self.old_forward = None
+        self.old_backward = None
+        self.batch_codes = None
+
+    def encode(self, term):
+        """
+        Index of a term, terms that are not in the term dictionary are added to it (see TermDictionary.add), so the compacted
+        property tables that replace the property tables of the preprocessor can be decoded by every query on it
+        """
+        index = self.term_dictionary.add(term)
+        self.number_of_terms = len(self.term_dictionary)
+        return index
+
+    def grow(self):
+        """
+        Extend the count vectors to the new terms
+        """
+        size = self.number_of_terms + 1
+        n = len(self.tables)
+        for vectors, empty_path in ((self.forward, 0), (self.backward, n)):
+            for i, vector in enumerate(vectors):
+                if len(vector) < size:
+                    # the paths of length 0 (forward[0] and backward[n]) start and end at every term
+                    fill = 1 if i == empty_path else 0
+                    vectors[i] = np.concatenate([vector, np.full(size - len(vector), fill, dtype=np.int64)])
+
+    def apply(self, insertions=(), deletions=()):
+        """
+        Apply a batch of triple insertions and deletions (the deletions first) and maintain the count and the reduced tables
+        Triples of other properties than the properties of the path are ignored
+
+        Parameters
+        ----------
+        insertions : iterable
+            Inserted triples (subject, property without prefix, object), the terms are written like in the data
+        deletions : iterable
+            Deleted triples (subject, property without prefix, object), triples with unknown terms are ignored
+
+        Returns
+        -------
+        dict
+            'count': number of results after the batch, 'count_delta': change of the number of results,
+            'reduced': for every property the triples that were added to and removed from its reduced table (two tuples of
+            subject and object arrays)
+        """
+        count = self.count
+        self.old_forward = [[] for _ in self.forward]
+        self.old_backward = [[] for _ in self.backward]
+        self.batch_codes = [{'inserted': [], 'deleted': []} for _ in self.tables]
+
+        for triples, sign in ((deletions, -1), (insertions, 1)):
+            grouped = {property_name: ([], []) for property_name in self.properties}
+            for subject, property_name, object in triples:
+                if property_name not in grouped:
+                    continue
+                if sign < 0:
+                    # a triple with a term that is not in the term dictionary is not in the property tables
+                    subject, object = self.term_dictionary.get(subject), self.term_dictionary.get(object)
+                    if subject is None or object is None:
+                        continue
+                else:
+                    subject, object = self.encode(subject), self.encode(object)
+                grouped[property_name][0].append(subject)
+                grouped[property_name][1].append(object)
+            if sign > 0:
+                self.grow()
+            for property_name, (subjects, objects) in grouped.items():
+                if subjects:
+                    self.update(self.properties.index(property_name), np.array(subjects, dtype=np.int32), np.array(objects, dtype=np.int32), sign)
+
+        reduced = {property_name: self.reduced_changes(i) for i, property_name in enumerate(self.properties)}
+        for property_name, table in zip(self.properties, self.tables):
+            if table.needs_compaction():
+                self.preprocessor.property_tables[property_name] = table.compact()
+        self.old_forward = self.old_backward = self.batch_codes = None
+        return {'count': self.count, 'count_delta': self.count - count, 'reduced': reduced}
+
+    def update(self, i, subjects, objects, sign):
+        """
+        Insert or delete triples of the i-th property table of the path and propagate the change of the count vectors
+
+        Parameters
+        ----------
+        i : int
+            Position of the property table in the path
+        subjects : np.ndarray
+            Subjects of the triples
+        objects : np.ndarray
+            Objects of the triples
+        sign : int
+            1 for inserts, -1 for deletes
+        """
+        codes = self.tables[i].update(subjects, objects, sign)
+        if self.batch_codes is not None:
+            self.batch_codes[i]['inserted' if sign > 0 else 'deleted'].append(codes)
+        subjects, objects = (codes >> 32).astype(np.int32), (codes & 0xFFFFFFFF).astype(np.int32)
+        n = len(self.tables)
+
+        # forward: Δforward[i + 1] = forward[i] ⋈ Δp_i, then through the following property tables
+        nodes, deltas = sum_by_key(objects, sign * self.forward[i][subjects])
+        for level in range(i + 1, n + 1):
+            nonzero = deltas != 0
+            nodes, deltas = nodes[nonzero], deltas[nonzero]
+            if not len(nodes):
+                break
+            self.change(self.forward, self.old_forward, level, nodes, deltas)
+            if level == n:
+                self.count += int(deltas.sum())
+                break
+            positions, neighbours = self.tables[level].neighbours(nodes, forward=True)
+            nodes, deltas = sum_by_key(neighbours, deltas[positions])
+
+        # backward: Δbackward[i] = Δp_i ⋈ backward[i + 1], then through the preceding property tables
+        nodes, deltas = sum_by_key(subjects, sign * self.backward[i + 1][objects])
+        for level in range(i, -1, -1):
+            nonzero = deltas != 0
+            nodes, deltas = nodes[nonzero], deltas[nonzero]
+            if not len(nodes):
+                break
+            self.change(self.backward, self.old_backward, level, nodes, deltas)
+            if level == 0:
+                break
+            positions, neighbours = self.tables[level - 1].neighbours(nodes, forward=False)
+            nodes, deltas = sum_by_key(neighbours, deltas[positions])
+
+    @staticmethod
+    def change(vectors, old_values, level, nodes, deltas):
+        """
+        Add the deltas to a count vector and remember the values before the batch (see reduced_changes)
+        """
+        if old_values is not None:
+            old_values[level].append((nodes, vectors[level][nodes]))
+        vectors[level][nodes] += deltas
+
+    @staticmethod
+    def values_before(vectors, old_values, level, nodes):
+        """
+        Values of a count vector before the batch
+        """
+        values = vectors[level][nodes].copy()
+        # the first recorded value of a node is its value before the batch, so the records are applied in reverse order
+        for changed_nodes, changed_values in reversed(old_values[level]):
+            position = np.minimum(np.searchsorted(changed_nodes, nodes), len(changed_nodes) - 1)
+            found = changed_nodes[position] == nodes
+            values[found] = changed_values[position[found]]
+        return values
+
+    def flipped(self, vectors, old_values, level):
+        """
+        Terms whose count in a count vector changed between zero and non-zero in the batch
+        """
+        if not old_values[level]:
+            return np.empty(0, dtype=np.int32)
+        nodes = np.unique(np.concatenate([changed_nodes for changed_nodes, _ in old_values[level]]))
+        before = self.values_before(vectors, old_values, level, nodes)
+        return nodes[(before > 0) != (vectors[level][nodes] > 0)].astype(np.int32)
+
+    def reduced_changes(self, i):
+        """
+        Triples that were added to and removed from the reduced table of the i-th property table in the batch
+        Only triples of the batch and triples of terms whose forward or backward count changed between zero and non-zero can change
+
+        Returns
+        -------
+        tuple
+            Subjects and objects of the added triples, subjects and objects of the removed triples
+        """
+        table = self.tables[i]
+        inserted = np.concatenate(self.batch_codes[i]['inserted'] or [np.empty(0, dtype=np.int64)])
+        deleted = np.concatenate(self.batch_codes[i]['deleted'] or [np.empty(0, dtype=np.int64)])
+
+        candidates = [inserted, deleted]
+        subjects = self.flipped(self.forward, self.old_forward, i)
+        positions, objects = table.neighbours(subjects, forward=True)
+        candidates.append(pair_codes(subjects[positions], objects))
+        objects = self.flipped(self.backward, self.old_backward, i + 1)
+        positions, subjects = table.neighbours(objects, forward=False)
+        candidates.append(pair_codes(subjects, objects[positions]))
+        codes = np.unique(np.concatenate(candidates))
+        subjects, objects = (codes >> 32).astype(np.int32), (codes & 0xFFFFFFFF).astype(np.int32)
+
+        exists = table.contains(codes)
+        existed = (exists & ~np.isin(codes, inserted)) | np.isin(codes, deleted)
+        member = exists & (self.forward[i][subjects] > 0) & (self.backward[i + 1][objects] > 0)
+        was_member = (existed & (self.values_before(self.forward, self.old_forward, i, subjects) > 0)
+                      & (self.values_before(self.backward, self.old_backward, i + 1, objects) > 0))
+        added, removed = member & ~was_member, was_member & ~member
+        return (subjects[added], objects[added]), (subjects[removed], objects[removed])
+
+    def reduced_table(self, property_name):
+        """
+        Yannakakis-reduced table of a property (the triples that are part of at least one result)
+
+        Returns
+        -------
+        tuple
+            Subjects and objects of the reduced table
+        """
+        i = self.properties.index(property_name)
+        subjects, objects = self.tables[i].triples()
+        mask = (self.forward[i][subjects] > 0) & (self.backward[i + 1][objects] > 0)
+        return subjects[mask], objects[mask]
+
+    def property_table(self, property_name):
+        """
+        Current property table of a property (the inserted and deleted triples are merged into it)
+        """
+        i = self.properties.index(property_name)
+        self.preprocessor.property_tables[property_name] = self.tables[i].compact()
+        return self.tables[i].base
@@ -1,45 +1,157 @@
-from collections import defaultdict
 import time
-import sys
 
-from data_structures import HashMap
+import numpy as np
+
+from bitmaps import RoaringBitmap, semi_join_mask
+from data_structures import IntHashTable, expand_ranges, match_sorted_keys
 from data_preprocessor import DataPreprocessor
+from external_sort import external_sort_merge_join
+from grace_hash_join import DEFAULT_MEMORY_BUDGET, partitioned_hash_join
+from leapfrog_triejoin import TrieIndex, leapfrog_triejoin
+from parallel_join import ParallelJoinPipeline
+from profiler import DISABLED_PROFILER
+from result_writer import ResultWriter
+
+# number of result tuples that are decoded and written at once by collect_results
+RESULT_BATCH_SIZE = 65536
+# variables of the results of the query of the assignment (follows.subject, follows.object, friendOf.object, likes.object and hasReview.object)
+RESULT_VARIABLES = ['?user1', '?user2', '?user3', '?product', '?review']
+# join algorithms of the query of the assignment that are supported by JoinAlgorithm
+ALGORITHM_TYPES = ('hash_join', 'grace_hash_join', 'hybrid_hash_join', 'sort_merge_join', 'leapfrog_triejoin')
+
+
+def hash_join_indices(build_keys, probe_keys):
+    """
+    Vectorized hash join of two arrays of join keys
+    The build keys are inserted into an open-addressing hash table (see data_structures.IntHashTable), all probe keys are looked up at once
+
+    Parameters
+    ----------
+    build_keys : np.ndarray
+        Join keys of the relation that is used as hash table
+    probe_keys : np.ndarray
+        Join keys of the relation that probes the hash table
+
+    Returns
+    -------
+    build_indices : np.ndarray
+        Index of the build key of every match
+    probe_indices : np.ndarray
+        Index of the probe key of every match
+    """
+    return IntHashTable(build_keys).probe(probe_keys)
+
+
+def sort_merge_join_indices(left_keys, right_keys, left_sorted=False, right_sorted=False):
+    """
+    Vectorized sort merge join of two arrays of join keys
+    Both arrays are sorted (unless they are already sorted) and the sorted left keys are merged into the sorted right keys with a binary search
+
+    Parameters
+    ----------
+    left_keys : np.ndarray
+        Join keys of the left relation
+    right_keys : np.ndarray
+        Join keys of the right relation
+    left_sorted : bool
+        True if the left keys are already sorted (e.g. taken from the SO or OS index of a property table)
+    right_sorted : bool
+        True if the right keys are already sorted
+
+    Returns
+    -------
+    left_indices : np.ndarray
+        Index of the left key of every match
+    right_indices : np.ndarray
+        Index of the right key of every match
+    """
+    left_order = np.arange(len(left_keys)) if left_sorted else np.argsort(left_keys, kind='stable')
+    right_order = np.arange(len(right_keys)) if right_sorted else np.argsort(right_keys, kind='stable')
+
+    probe_indices, positions = match_sorted_keys(right_keys[right_order], left_keys[left_order])
+    return left_order[probe_indices], right_order[positions]
+
 
 class JoinAlgorithm():
-    def __init__(self, algorithm_type, preprocessor : DataPreprocessor, output_path, use_yannakakis):
+    def __init__(self, algorithm_type, preprocessor : DataPreprocessor, output_path, use_yannakakis,
+                 memory_budget=DEFAULT_MEMORY_BUDGET, spill_directory=None, workers=1, profiler=DISABLED_PROFILER,
+                 semi_join_filter='isin', output_format='text'):
         """
         Initialize the join algorithm
 
         Parameters
         ----------
         algorithm_type : str
-            Type of the join algorithm
+            Type of the join algorithm ('hash_join', 'grace_hash_join', 'hybrid_hash_join', 'sort_merge_join' or 'leapfrog_triejoin')
         preprocessor : DataPreprocessor
             Preprocessor that contains the property tables
         output_path : str   
             Path to the output file
         use_yannakakis : bool
             If True, yannakakis algorithm is used
+        memory_budget : int
+            Memory budget in bytes of the hash tables of the grace and the hybrid hash join (see grace_hash_join.py) and of the
+            sort merge join (larger inputs are merged in a stream, see external_sort.py)
+        spill_directory : str
+            Directory of the spill files of the grace and the hybrid hash join (the default temporary directory if None)
+        workers : int
+            Number of worker processes, with more than one worker the semi-joins and joins are executed partition-parallel
+            (see parallel_join.py)
+        profiler : Profiler
+            Profiler that measures the semi-joins, the joins and the collection of the results (see profiler.py), disabled by default
+        semi_join_filter : str
+            Membership test of the semi-joins of the yannakakis reduction: 'isin', 'bitmap' (compressed bitmaps of the subjects, the
+            reduction of follows intersects two bitmaps) or 'bloom' (Bloom filter pre-filtering, see bitmaps.py)
+        output_format : str
+            Format of the output file written by collect_results (see result_writer.OUTPUT_FORMATS)
         """
+        # checked before the worker processes are started, an unknown type must not run as a hash join in the parallel mode
+        if algorithm_type not in ALGORITHM_TYPES:
+            raise ValueError("Algorithm type not supported")
         self.algorithm_type = algorithm_type
+        self.semi_join_filter = semi_join_filter
+        self.output_format = output_format
+        self.profiler = profiler
         self.output_path = output_path
-        self.property_tables_int = preprocessor.property_tables_int
-        self.rdf_dict = preprocessor.rdf_dict_reversed
-
-        # map the objects to the subjects of the property tables
-        self.map_objects_to_subjects(use_yannakakis)
+        self.memory_budget = memory_budget
+        self.spill_directory = spill_directory
+        self.property_tables = preprocessor.property_tables
+        self.term_dictionary = preprocessor.term_dictionary
+
+        # the pool of worker processes of the partition-parallel execution (None if only one worker is used)
+        self.pipeline = None
+        with profiler.operator('reduction', yannakakis=use_yannakakis, workers=workers):
+            if workers > 1:
+                self.pipeline = ParallelJoinPipeline(self.property_tables, workers)
+                try:
+                    self.map_objects_to_subjects_parallel(use_yannakakis)
+                except BaseException:
+                    # the caller never gets the object, so it cannot close the pool
+                    self.close()
+                    raise
+            else:
+                # map the objects to the subjects of the property tables
+                self.map_objects_to_subjects(use_yannakakis)
 
     def run(self):
-        print("Start running hash join")
+        print(f"Start running {self.algorithm_type}")
         start_time = time.time()
 
-        if self.algorithm_type == "hash_join":
-            self.hash_join()
-        elif self.algorithm_type == "sort_merge_join":
-            self.sort_merge_join()
-        else:
-            raise ValueError("Algorithm type not supported")
-        
+        with self.profiler.operator('join', algorithm=self.algorithm_type):
+            if self.pipeline is not None:
+                try:
+                    self.parallel_join()
+                finally:
+                    self.close()
+            elif self.algorithm_type in ("hash_join", "grace_hash_join", "hybrid_hash_join"):
+                self.hash_join()
+            elif self.algorithm_type == "sort_merge_join":
+                self.sort_merge_join()
+            elif self.algorithm_type == "leapfrog_triejoin":
+                self.leapfrog_triejoin()
+            else:
+                raise ValueError("Algorithm type not supported")
+
         end_time = time.time()
         print("Finish running")
         print("Time: ", end_time - start_time)
@@ -55,22 +167,24 @@ class JoinAlgorithm():
         size : dict
             Dictionary that contains the size (size of subjects and objects) of each property table
         """
+        if self.pipeline is not None:
+            return self.sizes
+
         # get all subjects in the property table follows
-        subjects_of_follows = set(subject for subject_lists in self.property_tables_int['follows'].values() for subject in subject_lists)
-        number_of_subjects_follows = len(subjects_of_follows)
+        number_of_subjects_follows = len(self.property_tables['follows'].subject_keys)
 
         # return the size of each property table (number of subjects and objects using subjects_of_...)
         return {
             'follows': (number_of_subjects_follows, len(self.objects_of_follows)),
-            'friendOf': (len(self.subjects_of_friendOf), sum(len(objects) for objects in self.subjects_of_friendOf.values())),
-            'likes': (len(self.subjects_of_likes), sum(len(objects) for objects in self.subjects_of_likes.values())),
-            'hasReview': (len(self.subjects_of_hasReview), sum(len(objects) for objects in self.subjects_of_hasReview.values())),
+            'friendOf': (len(np.unique(self.subjects_of_friendOf[0])), len(self.subjects_of_friendOf[1])),
+            'likes': (len(np.unique(self.subjects_of_likes[0])), len(self.subjects_of_likes[1])),
+            'hasReview': (len(np.unique(self.subjects_of_hasReview[0])), len(self.subjects_of_hasReview[1])),
         }
 
     def map_objects_to_subjects(self, use_yannakakis):
         """
-        Create a dictionary for each property table so that it contains the subjects as keys and a list of objects as values
-        This is done for the property tables follows, likes, friendOf and hasReview
+        Select the subjects and objects of the property tables follows, likes, friendOf and hasReview that take part in the joins
+        Each subjects_of_... is a tuple of a subject array and an object array sorted by subject (taken from the columnar property tables)
         The property table hasReview is not handled specially with yannakakis because it is the last property table in the query
 
         Parameters
@@ -80,230 +194,331 @@ class JoinAlgorithm():
             This is done to reduce the size of the property tables and therefore the memory usage and time
         """
 
-        # build the property table for hasReview
-        self.subjects_of_hasReview = defaultdict(set)
-        for obj, subjects in self.property_tables_int['hasReview'].items():
-            for subj in subjects:
-                self.subjects_of_hasReview[subj].add(obj)
+        # the property table for hasReview is used as it is
+        hasReview = self.property_tables['hasReview']
+        self.subjects_of_hasReview = (hasReview.subjects, hasReview.objects)
 
         # build the property table for likes considering the relation
         # likes.object = hasReview.subject
-        self.subjects_of_likes = defaultdict(set)
-        for obj, subjects in self.property_tables_int['likes'].items():
-            if use_yannakakis:
-                # check if the object of likes is a subject of hasReview (all done for the indices)
-                if obj in self.subjects_of_hasReview:
-                    # if yes, add these subjects of likes as keys to the dictionary and the object as value
-                    for subj in subjects:
-                        self.subjects_of_likes[subj].add(obj)
-            else:
-                for subj in subjects:
-                    self.subjects_of_likes[subj].add(obj)
+        self.subjects_of_likes = self.semi_join('likes', self.subjects_of_hasReview[0], use_yannakakis)
 
         # build the property table for friendOf considering the relation
         # friendOf.object = likes.subject
-        self.subjects_of_friendOf = defaultdict(set)
-        for obj, subjects in self.property_tables_int['friendOf'].items():
-            if use_yannakakis:
-                if obj in self.subjects_of_likes:
-                    for subj in subjects:
-                        self.subjects_of_friendOf[subj].add(obj)
-            else:
-                for subj in subjects:
-                    self.subjects_of_friendOf[subj].add(obj)
+        self.subjects_of_friendOf = self.semi_join('friendOf', self.subjects_of_likes[0], use_yannakakis)
 
         # build the property table for follows considering the relation
         # friendOf.subject = follows.object
-        self.objects_of_follows = set()
-        for obj, subjects in self.property_tables_int['follows'].items():
-            if use_yannakakis:
-                if obj in self.subjects_of_friendOf:
-                    self.objects_of_follows.add(obj)
-            else:
-                self.objects_of_follows.add(obj)
+        self.objects_of_follows = self.property_tables['follows'].object_keys
+        if use_yannakakis:
+            with self.profiler.operator('semi_join', lambda: [len(self.objects_of_follows), len(self.subjects_of_friendOf[0])], property='follows') as operator:
+                self.objects_of_follows = self.reduce_keys_of_follows(self.subjects_of_friendOf[0])
+                operator.output_rows = len(self.objects_of_follows)
 
-        print("hasReview:", len(self.subjects_of_hasReview))
-        print("likes:", len(self.subjects_of_likes))
-        print("friendOf:", len(self.subjects_of_friendOf))
-        print("follows:", len(self.objects_of_follows))
+    def map_objects_to_subjects_parallel(self, use_yannakakis):
+        """
+        Partition-parallel version of map_objects_to_subjects: every worker process reduces one partition of a property table
+        Only the subjects of the reduced property tables are collected, the row masks of the reduced partitions stay in the
+        shared memory of the workers and are used by the joins
 
+        Parameters
+        ----------
+        use_yannakakis : bool
+            If True, the property tables are reduced like in map_objects_to_subjects
+        """
+        hasReview, likes, friendOf = (self.property_tables[name] for name in ('hasReview', 'likes', 'friendOf'))
+        if use_yannakakis:
+            with self.profiler.operator('semi_join', lambda: [len(likes), len(hasReview.subject_keys)], property='likes') as operator:
+                subjects_of_likes, number_of_likes = self.pipeline.semi_join('likes', hasReview.subject_keys, self.semi_join_filter)
+                operator.output_rows = number_of_likes
+            with self.profiler.operator('semi_join', lambda: [len(friendOf), len(subjects_of_likes)], property='friendOf') as operator:
+                subjects_of_friendOf, number_of_friendOf = self.pipeline.semi_join('friendOf', subjects_of_likes, self.semi_join_filter)
+                operator.output_rows = number_of_friendOf
+        else:
+            subjects_of_likes, number_of_likes = likes.subject_keys, len(likes)
+            subjects_of_friendOf, number_of_friendOf = friendOf.subject_keys, len(friendOf)
+
+        self.objects_of_follows = self.property_tables['follows'].object_keys
+        if use_yannakakis:
+            with self.profiler.operator('semi_join', lambda: [len(self.objects_of_follows), len(subjects_of_friendOf)], property='follows') as operator:
+                self.objects_of_follows = self.reduce_keys_of_follows(subjects_of_friendOf)
+                operator.output_rows = len(self.objects_of_follows)
+
+        self.sizes = {
+            'follows': (len(self.property_tables['follows'].subject_keys), len(self.objects_of_follows)),
+            'friendOf': (len(subjects_of_friendOf), number_of_friendOf),
+            'likes': (len(subjects_of_likes), number_of_likes),
+            'hasReview': (len(hasReview.subject_keys), len(hasReview)),
+        }
+
+    def semi_join(self, property_name, subjects_of_next_table, use_yannakakis):
+        """
+        Keep the triples of a property table whose object is a subject of the next property table of the query
+
+        Parameters
+        ----------
+        property_name : str
+            Name of the columnar property table that should be filtered
+        subjects_of_next_table : np.ndarray
+            Subjects of the next property table of the query
+        use_yannakakis : bool
+            If False, the property table is not filtered
+
+        Returns
+        -------
+        tuple
+            Subjects and objects (sorted by subject) of the triples that were kept
+        """
+        property_table = self.property_tables[property_name]
+        if not use_yannakakis:
+            return property_table.subjects, property_table.objects
+
+        with self.profiler.operator('semi_join', lambda: [len(property_table), len(subjects_of_next_table)], property=property_name) as operator:
+            # check for all objects at once if they are subjects of the next property table (all done for the indices)
+            mask = semi_join_mask(property_table.objects, subjects_of_next_table, self.semi_join_filter)
+            subjects, objects = property_table.subjects[mask], property_table.objects[mask]
+            operator.output_rows = len(subjects)
+        return subjects, objects
+
+    def reduce_keys_of_follows(self, subjects_of_friendOf):
+        """
+        Keep the distinct objects of follows that are subjects of friendOf
+        With the bitmap filter both sides are compressed bitmaps and the semi-join is their intersection (word by word for the
+        dense containers), the object keys of follows are already sorted and distinct
+
+        Parameters
+        ----------
+        subjects_of_friendOf : np.ndarray
+            Subjects of the (reduced) property table friendOf
+
+        Returns
+        -------
+        np.ndarray
+            Sorted objects of follows that take part in the joins
+        """
+        object_keys = self.property_tables['follows'].object_keys
+        if self.semi_join_filter != 'bitmap':
+            return object_keys[semi_join_mask(object_keys, subjects_of_friendOf, self.semi_join_filter)]
+        objects = RoaringBitmap.from_array(object_keys, is_sorted=True) & RoaringBitmap.from_array(subjects_of_friendOf)
+        return objects.to_array().astype(object_keys.dtype)
 
     def hash_join(self):
         """
         Hash join for the query of the assignment
         """
-        print("Start running hash join")
-        start_time = time.time()
         # first join: follows.object = friendOf.subject
-        objects_of_friendsOf = self.hash_join_single(self.objects_of_follows, self.subjects_of_friendOf)
+        objects_of_friendsOf = self.hash_join_single(self.objects_of_follows, self.subjects_of_friendOf, 'friendOf')
         # second join: first join resulting objects = likes.subject
-        objects_of_likes = self.hash_join_single(objects_of_friendsOf, self.subjects_of_likes)
+        objects_of_likes = self.hash_join_single(objects_of_friendsOf, self.subjects_of_likes, 'likes')
         # third join: second join resulting objects = hasReview.subject
-        objects_of_hasReview = self.hash_join_single(objects_of_likes, self.subjects_of_hasReview)
-        end_time = time.time()
-        print("Finish running")
-        print("Time: ", end_time - start_time)
-        print("Size in GB: ", sys.getsizeof(objects_of_hasReview) / 1000 / 1000 / 1000)
+        objects_of_hasReview = self.hash_join_single(objects_of_likes, self.subjects_of_hasReview, 'hasReview')
 
         # TODO: UNCOMMENT THIS LINE TO WRITE THE RESULTS TO A FILE
         # self.collect_results(objects_of_hasReview)
 
-    def hash_join_single(self, objects_from_left_join_table, subjects_objects_of_right_join_table):
+    def parallel_join(self):
         """
-        Hash join for a single property table
-
-        Parameters
-        ----------
-        objects : set
-            Property table that should be joined and will be used as hash table
-        subjects_objects : dict
-            Property table that should be joined
+        Partition-parallel version of hash_join, sort_merge_join and leapfrog_triejoin for the query of the assignment
+        The join keys of every join are hash-partitioned, every worker process joins its keys with its partition of the property
+        table (the grace and the hybrid hash join use the in-memory hash join, a partition is only a part of the data)
+        """
+        if self.algorithm_type == "leapfrog_triejoin":
+            with self.profiler.operator('leapfrog_triejoin', lambda: [len(self.objects_of_follows)], workers=self.pipeline.workers) as operator:
+                objects_of_hasReview = self.pipeline.leapfrog_triejoin(self.objects_of_follows)
+                operator.output_rows = len(objects_of_hasReview)
+        else:
+            join_type = "sort_merge_join" if self.algorithm_type == "sort_merge_join" else "hash_join"
+            # follows.object = friendOf.subject, then the previous join result object = likes.subject and = hasReview.subject
+            objects_of_hasReview = self.objects_of_follows
+            for property_name in ['friendOf', 'likes', 'hasReview']:
+                with self.profiler.operator(join_type, lambda: [len(objects_of_hasReview), len(self.property_tables[property_name])],
+                                            property=property_name, workers=self.pipeline.workers) as operator:
+                    objects_of_hasReview = self.pipeline.join(join_type, property_name, objects_of_hasReview)
+                    operator.output_rows = len(objects_of_hasReview)
+        return objects_of_hasReview
+
+    def close(self):
+        """
+        Stop the worker processes of the partition-parallel execution and release the shared memory
+        """
+        if self.pipeline is not None:
+            self.pipeline.close()
+            self.pipeline = None
 
-        Returns
-        -------
-        result : set
-            Result of the hash join
+    def __enter__(self):
+        return self
 
-        """
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-        # create a hash table for the property table given in objects
-        hash_table = HashMap()
-        for object in objects_from_left_join_table:
-            # calculate the hash of the object
-            hash = self.hash_function(object)
-            # insert the object with hash into the hash table
-            hash_table.insert(hash, object)
-
-        # probe hash table
-        result = set()
-        # iterate over the subjects and objects of the property table (subjects_objects) that should be joined
-        for subject, objects_from_right_join_table in subjects_objects_of_right_join_table.items():
-            # calculate the hash of the subject
-            hash = self.hash_function(subject)
-            # get the objects of the hash table with the same hash
-            hashed_objects = hash_table.get(hash)
-            # if the actual subject index is in the returned list associated with the hash (because of hash collisions)
-            if subject in hashed_objects:
-                # store the objects of the right join table in the result that are given by the join
-                result.update(objects_from_right_join_table)
-
-        # return the result of the hash join (only the objects)
-        return result
-    
-    def hash_function(self, integer):
+    def hash_join_single(self, objects_from_left_join_table, subjects_objects_of_right_join_table, property_name=None):
         """
-        Hash function for the hash join (taken from: https://stackoverflow.com/questions/664014/what-integer-hash-function-are-good-that-accepts-an-integer-hash-key)
+        Hash join for a single property table
+        The grace and the hybrid hash join partition both sides into spill files if the hash table does not fit into the memory budget
 
         Parameters
         ----------
-        integer : int
-            Integer that should be hashed
+        objects : np.ndarray
+            Distinct objects of the left join table, they are used as hash table
+        subjects_objects : tuple
+            Subjects and objects of the property table that should be joined
+        property_name : str
+            Name of the property table (only shown by the profiler)
 
         Returns
         -------
-        integer : int
-            Hash of the integer
+        result : np.ndarray
+            Result of the hash join (sorted distinct objects of the right join table)
 
         """
-        integer = ((integer >> 16) ^ integer) * 0x45d9f3b
-        integer = ((integer >> 16) ^ integer) * 0x45d9f3b
-        integer = (integer >> 16) ^ integer
-        return integer
-
-
+        subjects, objects = subjects_objects_of_right_join_table
+
+        with self.profiler.operator(self.algorithm_type, lambda: [len(objects_from_left_join_table), len(subjects)], property=property_name) as operator:
+            if self.algorithm_type in ("grace_hash_join", "hybrid_hash_join"):
+                # only the distinct objects of every chunk of matches are kept, so the memory of the result stays small as well
+                results = [np.unique(probe_rows[1]) for _, probe_rows in partitioned_hash_join(
+                    [objects_from_left_join_table], [subjects, objects], self.memory_budget, self.spill_directory,
+                    hybrid=self.algorithm_type == "hybrid_hash_join")]
+                result = np.unique(np.concatenate(results)) if results else np.empty(0, dtype=objects.dtype)
+            else:
+                # build a hash table for the objects of the left table and probe it with all subjects of the right table at once
+                _, probe_indices = hash_join_indices(objects_from_left_join_table, subjects)
+                # the result of the hash join (only the objects)
+                result = np.unique(objects[probe_indices])
+            operator.output_rows = len(result)
+        return result
+    
     def sort_merge_join(self):
         """
         Sort merge join for the query of the assignment
         First sort the property tables of the join and then merge them
+        The subjects of the property tables are already sorted (columnar property tables) and the join results are sorted by np.unique
         """
-        print("Start running sort merge join")
-        start_time = time.time()
-
         # join follows.object = friendOf.subject
-        objects_of_friendsOf = self.merge(sorted(self.objects_of_follows), 
-                                            sorted(self.subjects_of_friendOf.items(), key=lambda item: item[0]))
+        objects_of_friendsOf = self.merge(self.objects_of_follows, self.subjects_of_friendOf, 'friendOf')
 
         # join previous join result object = likes.subject
-        objects_of_likes = self.merge(sorted(objects_of_friendsOf), 
-                                            sorted(self.subjects_of_likes.items(), key=lambda item: item[0]))
+        objects_of_likes = self.merge(objects_of_friendsOf, self.subjects_of_likes, 'likes')
 
         # join previous join result object = hasReview.subject
-        objects_of_hasReview = self.merge(sorted(objects_of_likes), 
-                                                sorted(self.subjects_of_hasReview.items(), key=lambda item: item[0]))
-        end_time = time.time()
-        print("Finish running")
-        print("Time: ", end_time - start_time)
-        print("Size in GB: ", sys.getsizeof(objects_of_hasReview) / 1000 / 1000 / 1000)
+        objects_of_hasReview = self.merge(objects_of_likes, self.subjects_of_hasReview, 'hasReview')
+
+        # TODO: UNCOMMENT THIS LINE TO WRITE THE RESULTS TO A FILE
+        # self.collect_results(objects_of_hasReview)
+
+    def leapfrog_triejoin(self):
+        """
+        Leapfrog triejoin for the query of the assignment
+        The property tables are used as trie indices (they are already sorted by subject and object) and the variables are bound in
+        the order of the query, so only the objects of follows, friendOf, likes and hasReview are bound (like in the other joins)
+        """
+        variable_order = ['follows_object', 'friendOf_object', 'likes_object', 'hasReview_object']
+        tries = [
+            TrieIndex(('follows_object',), self.objects_of_follows),
+            TrieIndex(('follows_object', 'friendOf_object'), *self.subjects_of_friendOf),
+            TrieIndex(('friendOf_object', 'likes_object'), *self.subjects_of_likes),
+            TrieIndex(('likes_object', 'hasReview_object'), *self.subjects_of_hasReview),
+        ]
+        # only the objects of hasReview are part of the result, so the other variables are dropped as soon as possible
+        with self.profiler.operator('leapfrog_triejoin', lambda: [len(self.objects_of_follows), len(self.subjects_of_friendOf[0]),
+                                                          len(self.subjects_of_likes[0]), len(self.subjects_of_hasReview[0])]) as operator:
+            objects_of_hasReview, = leapfrog_triejoin(tries, variable_order, ['hasReview_object'])
+            operator.output_rows = len(objects_of_hasReview)
 
         # TODO: UNCOMMENT THIS LINE TO WRITE THE RESULTS TO A FILE
         # self.collect_results(objects_of_hasReview)
 
-    def merge(self, objects, subjects_objects):
+    def merge(self, objects, subjects_objects, property_name=None):
         """
-        Merge two sorted lists
+        Merge two sorted arrays
+        Both inputs arrive sorted (the objects are distinct and sorted, the subjects come from the SO index of the property table,
+        which is sorted by subject), so no sort is needed. If the property table is larger than the memory budget, it is merged
+        chunk by chunk
 
         Parameters
         ----------
-        objects : list
-            Sorted list of objects
-        subjects_objects : list
-            Sorted list of tuples of subjects and objects
+        objects : np.ndarray
+            Sorted array of distinct objects
+        subjects_objects : tuple
+            Subjects (sorted) and objects of the property table that should be joined
+        property_name : str
+            Name of the property table (only shown by the profiler)
 
         Returns
         -------
-        result : set
-            Result of the merge
+        result : np.ndarray
+            Result of the merge (sorted distinct objects of the right table)
         """
-        result = set()
-        index_left_table, index_right_table = 0, 0
-
-        # iterate over the sorted lists and compare the subject and object integer encodings
-        while index_left_table < len(objects) and index_right_table < len(subjects_objects):
-            # get the subject and object integer encoding of the left and right table given the table indices
-            subj, obj = objects[index_left_table], subjects_objects[index_right_table][0]
-
-            # check if the subject and object integer encodings are equal
-            if subj == obj:
-                # if yes, add the objects of the right table to the result
-                result.update(subjects_objects[index_right_table][1])
-                # increase both table indices
-                index_left_table += 1
-                index_right_table += 1
-
-            # check if subject integer encoding is larger than object integer encoding --> increase right table index
-            elif subj > obj:
-                index_right_table += 1
-
-            # increase left table index
+        subjects, right_objects = subjects_objects
+
+        with self.profiler.operator('sort_merge_join', lambda: [len(objects), len(subjects)], property=property_name) as operator:
+            if subjects.nbytes + right_objects.nbytes > self.memory_budget:
+                # only the distinct objects of every chunk of matches are kept
+                results = [np.unique(right_rows[1]) for _, right_rows in external_sort_merge_join(
+                    [objects], [subjects, right_objects], self.memory_budget, self.spill_directory, left_sorted=True, right_sorted=True)]
+                result = np.unique(np.concatenate(results)) if results else np.empty(0, dtype=right_objects.dtype)
             else:
-                index_left_table += 1
-
+                # find for every object of the left table the range of equal subjects in the right table with a binary search
+                _, positions = match_sorted_keys(subjects, objects)
+                result = np.unique(right_objects[positions])
+            operator.output_rows = len(result)
         return result
     
     def collect_results(self, objects_of_hasReview):
         """
         Find the corresponding subjects of the given objects that are results of the join(s)
-        Write the results to a file as requested by the query in the assignment
+        Write the results to a file as requested by the query in the assignment (in the output format of the join algorithm)
 
         Parameters
         ----------
-        objects_of_hasReview : set
+        objects_of_hasReview : np.ndarray
             Resulting objects of the join(s)
         """
+        # write the results to a file in batches, every column of a batch is decoded at once by the term dictionary
+        with self.profiler.operator('collect_results', lambda: [len(objects_of_hasReview)], path=self.output_path, format=self.output_format) as operator:
+            with ResultWriter(self.output_path, RESULT_VARIABLES, self.term_dictionary, self.output_format) as writer:
+                for batch in self.result_batches(objects_of_hasReview):
+                    writer.write(batch)
+            operator.output_rows = writer.rows
+
+    def result_batches(self, objects_of_hasReview):
+        """
+        Traverse the join results backwards to find the corresponding subjects
+        This saves a lot of memory because the join results are much smaller than the property tables
+        Every step extends all rows of a batch at once with the subjects of their first column (from the OS index of the next
+        property table), batches with more than RESULT_BATCH_SIZE rows are split before they are extended. The results are
+        returned in the same order as by nested loops over the subjects
+
+        Parameters
+        ----------
+        objects_of_hasReview : np.ndarray
+            Resulting objects of the join(s)
 
-        # traverse the join results backwards to find the corresponding subjects
-        # this saves a lot of memory because the join results are much smaller than the property tables
-        generator = (
-            (follows_subject, follows_object, friendOf_object, likes_object, hasReview_object)
-            for hasReview_object in objects_of_hasReview 
-            for likes_object in self.property_tables_int['hasReview'][hasReview_object] 
-            for friendOf_object in self.property_tables_int['likes'][likes_object] 
-            for follows_object in self.property_tables_int['friendOf'][friendOf_object] 
-            for follows_subject in self.property_tables_int['follows'][follows_object] 
-        )
-
-        # write the results to a file
-        with open(self.output_path, 'w') as self.output:
-            for element in generator:
-                result = " ".join([self.rdf_dict[singlet] for singlet in element])
-                self.output.write(result + '\n')
\ No newline at end of file
+        Returns
+        -------
+        generator
+            Batches of results, one array for each of RESULT_VARIABLES
+        """
+        property_tables = [self.property_tables[name] for name in ('hasReview', 'likes', 'friendOf', 'follows')]
+        # stack of the batches that are not complete yet (the number of property tables they were extended with and their columns)
+        stack = [(0, [np.asarray(objects_of_hasReview, dtype=np.int32)])]
+        while stack:
+            depth, columns = stack.pop()
+            if depth == len(property_tables):
+                yield columns
+                continue
+            if len(columns[0]) > RESULT_BATCH_SIZE:
+                # the second half is pushed first, so the first half is extended first
+                middle = len(columns[0]) // 2
+                stack.append((depth, [column[middle:] for column in columns]))
+                stack.append((depth, [column[:middle] for column in columns]))
+                continue
+
+            property_table = property_tables[depth]
+            if not len(property_table.object_keys):
+                continue
+            index = np.minimum(np.searchsorted(property_table.object_keys, columns[0]), len(property_table.object_keys) - 1)
+            found = property_table.object_keys[index] == columns[0]
+            starts = property_table.object_offsets[index]
+            counts = np.where(found, property_table.object_offsets[index + 1] - starts, 0)
+            rows, positions = expand_ranges(starts, counts)
+            stack.append((depth + 1, [property_table.os_subjects[positions]] + [column[rows] for column in columns]))
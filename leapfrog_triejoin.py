@@ -0,0 +1,306 @@
+import numpy as np
+
+from data_structures import compressed_rows, expand_ranges
+
+
+class TrieIndex():
+    """
+    Sorted trie index of a relation with one or two variables
+    The first level contains the sorted distinct values of the first variable, the second level contains for every value of the
+    first level the sorted values of the second variable (CSR layout, like the columnar property tables)
+    The variables of a trie are ordered by the variable order of the join
+    """
+
+    def __init__(self, variables, first, second=None):
+        """
+        Initialize the trie index
+
+        Parameters
+        ----------
+        variables : tuple
+            One or two variables, in the variable order of the join
+        first : np.ndarray
+            Values of the first variable (sorted, for two variables sorted by first and then by second value)
+        second : np.ndarray
+            Values of the second variable (None for a trie with one variable)
+        """
+        self.variables = tuple(variables)
+        if second is None:
+            self.keys = np.unique(first)
+            self.values = None
+            return
+
+        self.keys, self.offsets = compressed_rows(first)
+        self.values = second
+        # the pairs packed into one 64 bit integer, sorted (used to check if a pair is contained in the trie)
+        self.pairs = (first.astype(np.int64) << 32) | second.astype(np.int64)
+
+    @classmethod
+    def from_csr(cls, variables, keys, offsets, values, pairs):
+        """
+        Create a trie index with two variables from its arrays (e.g. arrays in shared memory), nothing is computed or copied
+
+        Parameters
+        ----------
+        variables : tuple
+            Two variables, in the variable order of the join
+        keys : np.ndarray
+            Sorted distinct values of the first variable
+        offsets : np.ndarray
+            The values below keys[i] are stored at values[offsets[i]:offsets[i + 1]]
+        values : np.ndarray
+            Values of the second variable
+        pairs : np.ndarray
+            Sorted pairs of both variables packed into one 64 bit integer
+
+        Returns
+        -------
+        TrieIndex
+            Trie index that uses the given arrays
+        """
+        trie = cls.__new__(cls)
+        trie.variables = tuple(variables)
+        trie.keys, trie.offsets, trie.values, trie.pairs = keys, offsets, values, pairs
+        return trie
+
+    @classmethod
+    def from_property_table(cls, property_table, subject_variable, object_variable, variable_order):
+        """
+        Create a trie index from a columnar property table without sorting (the SO or the OS order of the table is used)
+
+        Parameters
+        ----------
+        property_table : PropertyTable
+            Columnar property table
+        subject_variable : str
+            Variable of the subject
+        object_variable : str
+            Variable of the object
+        variable_order : list
+            Variable order of the join
+
+        Returns
+        -------
+        TrieIndex
+            Trie index over the property table
+        """
+        if subject_variable == object_variable:
+            mask = property_table.subjects == property_table.objects
+            return cls((subject_variable,), property_table.subjects[mask])
+        if variable_order.index(subject_variable) < variable_order.index(object_variable):
+            return cls((subject_variable, object_variable), property_table.subjects, property_table.objects)
+        return cls((object_variable, subject_variable), property_table.os_objects, property_table.os_subjects)
+
+    @classmethod
+    def from_columns(cls, variables, columns, variable_order):
+        """
+        Create a trie index from the columns of a relation (the columns are sorted if they are not sorted already)
+
+        Parameters
+        ----------
+        variables : tuple
+            Variables of the relation (one or two)
+        columns : list
+            One integer array for each variable
+        variable_order : list
+            Variable order of the join
+
+        Returns
+        -------
+        TrieIndex
+            Trie index over the relation
+        """
+        if len(variables) == 1:
+            return cls(variables, columns[0])
+
+        if variable_order.index(variables[0]) > variable_order.index(variables[1]):
+            variables, columns = variables[::-1], columns[::-1]
+        first, second = columns
+        pairs = (first.astype(np.int64) << 32) | second.astype(np.int64)
+        if len(pairs) and np.any(pairs[1:] < pairs[:-1]):
+            order = np.argsort(pairs, kind='stable')
+            first, second = first[order], second[order]
+        return cls(variables, first, second)
+
+    def ranges(self, bindings, number_of_rows):
+        """
+        Get the candidates of the trie for the variable of the current level for every row of the frontier
+
+        Parameters
+        ----------
+        bindings : dict
+            Values of the already bound variables (one array per variable, one value per row)
+        number_of_rows : int
+            Number of rows of the frontier
+
+        Returns
+        -------
+        candidates : np.ndarray
+            Sorted array that contains the candidates
+        starts : np.ndarray
+            Start of the candidates of every row in candidates
+        counts : np.ndarray
+            Number of candidates of every row
+        """
+        if self.variables[0] not in bindings:
+            # first level: every row has all values of the first variable as candidates
+            return self.keys, np.zeros(number_of_rows, dtype=np.int64), np.full(number_of_rows, len(self.keys), dtype=np.int64)
+
+        # second level: the candidates are the values below the bound value of the first variable
+        if not len(self.keys):
+            no_candidates = np.zeros(number_of_rows, dtype=np.int64)
+            return self.values, no_candidates, no_candidates
+        bound = bindings[self.variables[0]]
+        index = np.minimum(np.searchsorted(self.keys, bound), len(self.keys) - 1)
+        starts = self.offsets[index]
+        counts = np.where(self.keys[index] == bound, self.offsets[index + 1] - starts, 0)
+        return self.values, starts, counts
+
+    def contains(self, bindings, row_indices, values):
+        """
+        Check for candidate values of the current level if they are contained in the trie
+
+        Parameters
+        ----------
+        bindings : dict
+            Values of the already bound variables (one array per variable, one value per row)
+        row_indices : np.ndarray
+            Row of the frontier of every candidate value
+        values : np.ndarray
+            Candidate values of the variable of the current level
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array, True if the candidate value is contained in the trie
+        """
+        if self.variables[0] not in bindings:
+            return is_in_sorted(self.keys, values)
+
+        pairs = (bindings[self.variables[0]][row_indices].astype(np.int64) << 32) | values.astype(np.int64)
+        return is_in_sorted(self.pairs, pairs)
+
+
+def is_in_sorted(sorted_values, values):
+    """
+    Check with a binary search which values are contained in a sorted array
+
+    Parameters
+    ----------
+    sorted_values : np.ndarray
+        Sorted array
+    values : np.ndarray
+        Values that are looked up
+
+    Returns
+    -------
+    np.ndarray
+        Boolean array, True if the value is contained in the sorted array
+    """
+    if not len(sorted_values):
+        return np.zeros(len(values), dtype=bool)
+    index = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    return sorted_values[index] == values
+
+
+def choose_variable_order(query):
+    """
+    Choose the variable order of the join with a greedy heuristic
+    The variable that occurs in the most triple patterns comes first, then always the variable that is connected to the most
+    triple patterns with already chosen variables (so that the tries are used on their second level as early as possible)
+
+    Parameters
+    ----------
+    query : list
+        List of triple patterns (subject, property, object), constant subjects and objects are not part of the variable order
+
+    Returns
+    -------
+    list
+        Variable order
+    """
+    variables = []
+    for subject, _, object in query:
+        for term in (subject, object):
+            if term.startswith('?') and term not in variables:
+                variables.append(term)
+
+    order = []
+    while len(order) < len(variables):
+        def score(variable):
+            patterns = [pattern for pattern in query if variable in (pattern[0], pattern[2])]
+            connected = sum(1 for pattern in patterns if pattern[0] in order or pattern[2] in order)
+            return connected, len(patterns)
+        order.append(max((variable for variable in variables if variable not in order), key=score))
+    return order
+
+
+def leapfrog_triejoin(tries, variable_order, output_variables=None):
+    """
+    Worst-case optimal join of the given trie indices (works for cyclic queries)
+    The variables are bound one after another in the variable order. For every partial result (row of the frontier) and the
+    next variable, the values of the trie with the fewest candidates are enumerated and looked up in the other tries of the
+    variable with a binary search (the leapfrog intersection of the sorted candidate lists). All rows of the frontier are
+    extended at once, level by level
+    Variables that are not part of the output and not needed by the tries of later variables are dropped as early as possible
+
+    Parameters
+    ----------
+    tries : list
+        Trie indices of the triple patterns
+    variable_order : list
+        Variable order of the join, every variable of the tries must occur in it
+    output_variables : list
+        Variables of the result (all variables of the variable order if None), the result is distinct on these variables
+        if some variables are dropped
+
+    Returns
+    -------
+    list
+        One integer array for each output variable
+    """
+    if output_variables is None:
+        output_variables = list(variable_order)
+
+    bindings = {}
+    number_of_rows = 1
+    for depth, variable in enumerate(variable_order):
+        participating = [trie for trie in tries if variable in trie.variables]
+        ranges = [trie.ranges(bindings, number_of_rows) for trie in participating]
+
+        # every row enumerates the candidates of the trie with the fewest candidates
+        chosen = np.argmin(np.stack([counts for _, _, counts in ranges]), axis=0)
+
+        row_parts, value_parts = [], []
+        for index, (candidates, starts, counts) in enumerate(ranges):
+            rows = np.nonzero(chosen == index)[0]
+            row_indices, positions = expand_ranges(starts[rows], counts[rows])
+            row_indices = rows[row_indices]
+            values = candidates[positions]
+
+            # keep the candidates that are contained in all other tries of the variable
+            for other_index, other in enumerate(participating):
+                if other_index != index:
+                    mask = other.contains(bindings, row_indices, values)
+                    row_indices, values = row_indices[mask], values[mask]
+            row_parts.append(row_indices)
+            value_parts.append(values)
+
+        row_indices = np.concatenate(row_parts)
+        bindings = {bound_variable: column[row_indices] for bound_variable, column in bindings.items()}
+        bindings[variable] = np.concatenate(value_parts)
+        number_of_rows = len(row_indices)
+
+        # drop the variables that are not needed anymore and remove the duplicate rows this creates
+        later_variables = set(other for trie in tries for other in trie.variables
+                              if any(later in trie.variables for later in variable_order[depth + 1:]))
+        needed = [bound_variable for bound_variable in bindings if bound_variable in output_variables or bound_variable in later_variables]
+        if len(needed) < len(bindings):
+            if needed and number_of_rows:
+                distinct_rows = np.unique(np.stack([bindings[bound_variable] for bound_variable in needed]), axis=1)
+                bindings = {bound_variable: distinct_rows[index] for index, bound_variable in enumerate(needed)}
+            else:
+                bindings = {bound_variable: bindings[bound_variable][:min(number_of_rows, 1)] for bound_variable in needed}
+            number_of_rows = len(next(iter(bindings.values()))) if bindings else min(number_of_rows, 1)
+
+    return [bindings[variable] for variable in output_variables]
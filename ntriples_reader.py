@@ -0,0 +1,166 @@
+import bz2
+import gzip
+import queue
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    # zstandard is optional, it is only needed for .zst files
+    zstandard = None
+
+# number of decompressed bytes that are read at once
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+# number of blocks the reader thread may read ahead (the buffer holds at most this many blocks)
+DEFAULT_BUFFERED_BLOCKS = 4
+# the compression format is detected from the first bytes of the file (not from its name)
+GZIP_MAGIC = b'\x1f\x8b'
+BZIP2_MAGIC = b'BZh'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def compression_format(data_path):
+    """
+    Detect the compression format of a data file from its magic bytes
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the data file
+
+    Returns
+    -------
+    str
+        'gzip', 'bz2', 'zstd' or None if the file is not compressed
+    """
+    with open(data_path, 'rb') as data_file:
+        magic = data_file.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if magic.startswith(BZIP2_MAGIC):
+        return 'bz2'
+    if magic.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+
+def open_data_file(data_path):
+    """
+    Open a (compressed) data file as binary stream of the decompressed bytes
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the data file (N-Triples, optionally compressed with gzip, bzip2 or zstd)
+
+    Returns
+    -------
+    file object
+        Binary stream of the decompressed data
+    """
+    compression = compression_format(data_path)
+    if compression == 'gzip':
+        return gzip.open(data_path, 'rb')
+    if compression == 'bz2':
+        return bz2.open(data_path, 'rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError(f"{data_path} is compressed with zstd, reading it needs the zstandard package (pip install zstandard)")
+        return zstandard.ZstdDecompressor().stream_reader(open(data_path, 'rb'), closefd=True)
+    return open(data_path, 'rb')
+
+
+class BlockReader():
+    """
+    Streaming reader of a (compressed) data file that returns blocks of complete lines as bytes
+    A background thread reads and decompresses the file into a bounded queue, so the decompression (which releases the GIL)
+    overlaps with the parsing of the previous blocks and at most buffered_blocks blocks are held in memory
+
+        with BlockReader('data/watdiv.10M.nt.gz') as reader:
+            for block in reader:
+                for line in block.split(b'\\n'):
+                    ...
+    """
+
+    def __init__(self, data_path, block_size=DEFAULT_BLOCK_SIZE, buffered_blocks=DEFAULT_BUFFERED_BLOCKS):
+        """
+        Parameters
+        ----------
+        data_path : str
+            Path to the data file
+        block_size : int
+            Number of decompressed bytes that are read at once
+        buffered_blocks : int
+            Maximum number of blocks that are read ahead
+        """
+        self.data_path = data_path
+        self.block_size = block_size
+        self.blocks = queue.Queue(maxsize=buffered_blocks)
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+        return False
+
+    def read_blocks(self):
+        """
+        Read the data file block by block into the queue (runs in the background thread)
+        The end of the file is marked with None, an exception is passed on to the consumer
+        """
+        try:
+            with open_data_file(self.data_path) as data_file:
+                while not self.stopped.is_set():
+                    block = data_file.read(self.block_size)
+                    if not block:
+                        break
+                    self.put(block)
+            self.put(None)
+        except Exception as error:
+            self.put(error)
+
+    def put(self, item):
+        # wait for free space in the queue, but stop waiting if the consumer closed the reader
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def __iter__(self):
+        """
+        Blocks of complete lines (every block ends with a newline, except the last block if the file does not end with one)
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.read_blocks, daemon=True)
+            self.thread.start()
+
+        remainder = b''
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                break
+            if isinstance(block, Exception):
+                raise block
+            # the incomplete last line of the block is completed by the next block
+            end = block.rfind(b'\n') + 1
+            if not end:
+                remainder += block
+                continue
+            yield remainder + block[:end]
+            remainder = block[end:]
+        if remainder:
+            yield remainder
+
+    def close(self):
+        """
+        Stop the background thread (also if not all blocks were read)
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
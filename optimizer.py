@@ -0,0 +1,508 @@
+import math
+
+import numpy as np
+
+# cost of one row in the different operators (in arbitrary units, only the ratios matter)
+HASH_BUILD_COST = 2.0
+HASH_PROBE_COST = 1.0
+SORT_COST = 0.5
+MERGE_COST = 1.0
+OUTPUT_COST = 1.0
+SEMI_JOIN_COST = 1.0
+
+# number of heavy hitters (values with the highest degree) that are kept for every property
+TOP_K = 16
+
+
+class PropertyStatistics():
+    """
+    Statistics of a property table that are collected when the property table is built
+    """
+
+    # names of the statistics (used to store and load the statistics with the dataset cache)
+    FIELDS = ('triples', 'distinct_subjects', 'distinct_objects', 'subject_degree_histogram', 'object_degree_histogram',
+              'heavy_subjects', 'heavy_objects')
+
+    def __init__(self, triples, distinct_subjects, distinct_objects, subject_degree_histogram, object_degree_histogram,
+                 heavy_subjects, heavy_objects):
+        """
+        Initialize the statistics (use PropertyStatistics.from_property_table to collect the statistics of a property table)
+
+        Parameters
+        ----------
+        triples : int
+            Number of triples
+        distinct_subjects : int
+            Number of distinct subjects
+        distinct_objects : int
+            Number of distinct objects
+        subject_degree_histogram : list
+            Number of subjects with a degree in [2^i, 2^(i + 1)) for every bucket i
+        object_degree_histogram : list
+            Number of objects with a degree in [2^i, 2^(i + 1)) for every bucket i
+        heavy_subjects : dict
+            Subjects with the highest degrees (dictionary with the subjects as keys and their degrees as values)
+        heavy_objects : dict
+            Objects with the highest degrees (dictionary with the objects as keys and their degrees as values)
+        """
+        self.triples = triples
+        self.distinct_subjects = distinct_subjects
+        self.distinct_objects = distinct_objects
+        self.subject_degree_histogram = subject_degree_histogram
+        self.object_degree_histogram = object_degree_histogram
+        self.heavy_subjects = heavy_subjects
+        self.heavy_objects = heavy_objects
+
+    @classmethod
+    def from_property_table(cls, property_table, top_k=TOP_K):
+        """
+        Collect the statistics of a columnar property table (the degrees are the differences of its CSR offsets)
+
+        Parameters
+        ----------
+        property_table : PropertyTable
+            Columnar property table
+        top_k : int
+            Number of heavy hitters that are kept for subjects and objects
+
+        Returns
+        -------
+        PropertyStatistics
+            Statistics of the property table
+        """
+        subject_degrees = np.diff(property_table.subject_offsets)
+        object_degrees = np.diff(property_table.object_offsets)
+        return cls(
+            len(property_table),
+            len(property_table.subject_keys),
+            len(property_table.object_keys),
+            degree_histogram(subject_degrees),
+            degree_histogram(object_degrees),
+            heavy_hitters(property_table.subject_keys, subject_degrees, top_k),
+            heavy_hitters(property_table.object_keys, object_degrees, top_k),
+        )
+
+    def to_dict(self):
+        """
+        Convert the statistics to a JSON serializable dictionary
+        """
+        statistics = {name: getattr(self, name) for name in self.FIELDS}
+        statistics['heavy_subjects'] = list(self.heavy_subjects.items())
+        statistics['heavy_objects'] = list(self.heavy_objects.items())
+        return statistics
+
+    @classmethod
+    def from_dict(cls, statistics):
+        """
+        Create the statistics from a dictionary that was created with to_dict
+        """
+        statistics = dict(statistics)
+        statistics['heavy_subjects'] = dict(statistics['heavy_subjects'])
+        statistics['heavy_objects'] = dict(statistics['heavy_objects'])
+        return cls(*(statistics[name] for name in cls.FIELDS))
+
+    def __repr__(self):
+        return (f"PropertyStatistics(triples={self.triples}, distinct_subjects={self.distinct_subjects}, "
+                f"distinct_objects={self.distinct_objects}, max_subject_degree={max(self.heavy_subjects.values(), default=0)}, "
+                f"max_object_degree={max(self.heavy_objects.values(), default=0)})")
+
+
+def degree_histogram(degrees):
+    """
+    Build a histogram of degrees with buckets of exponentially growing size
+
+    Parameters
+    ----------
+    degrees : np.ndarray
+        Degree of every value (at least 1)
+
+    Returns
+    -------
+    list
+        Number of values with a degree in [2^i, 2^(i + 1)) for every bucket i
+    """
+    if not len(degrees):
+        return []
+    return np.bincount(np.log2(degrees).astype(np.int64)).tolist()
+
+
+def heavy_hitters(keys, degrees, top_k):
+    """
+    Find the values with the highest degrees
+
+    Parameters
+    ----------
+    keys : np.ndarray
+        Distinct values
+    degrees : np.ndarray
+        Degree of every value
+    top_k : int
+        Number of values
+
+    Returns
+    -------
+    dict
+        Dictionary with the values as keys and their degrees as values
+    """
+    if len(keys) > top_k:
+        top = np.argpartition(degrees, -top_k)[-top_k:]
+    else:
+        top = np.arange(len(keys))
+    return dict(zip(keys[top].tolist(), degrees[top].tolist()))
+
+
+class RelationEstimate():
+    """
+    Estimated size, number of distinct values per variable and heavy hitters per variable of a (intermediate) relation
+    """
+
+    def __init__(self, size, distinct, heavy, sorted_by=None):
+        """
+        Initialize the estimate
+
+        Parameters
+        ----------
+        size : float
+            Estimated number of rows
+        distinct : dict
+            Estimated number of distinct values of every variable
+        heavy : dict
+            Heavy hitters of every variable (dictionary with the values as keys and their frequencies as values)
+        sorted_by : str
+            Variable the rows are sorted by (None if unknown)
+        """
+        self.size = size
+        self.distinct = distinct
+        self.heavy = heavy
+        self.sorted_by = sorted_by
+
+    @classmethod
+    def from_pattern(cls, pattern, statistics, size):
+        """
+        Create the estimate of the relation of a triple pattern
+
+        Parameters
+        ----------
+        pattern : tuple
+            Triple pattern (subject, property, object), the subject or the object may be a constant
+        statistics : PropertyStatistics
+            Statistics of the property
+        size : int
+            Actual number of rows of the relation
+
+        Returns
+        -------
+        RelationEstimate
+            Estimate of the relation (sorted by the subject like the property tables, a pattern with a constant subject is
+            sorted by its object)
+        """
+        subject, _, object = pattern
+        if subject == object:
+            return cls(size, {subject: size}, {subject: {}}, subject)
+        # constants are not columns of the relation, so two patterns with the same constant are not joined on it
+        distinct, heavy = {}, {}
+        if subject.startswith('?'):
+            distinct[subject] = min(statistics.distinct_subjects, size)
+            heavy[subject] = dict(statistics.heavy_subjects)
+        if object.startswith('?'):
+            distinct[object] = min(statistics.distinct_objects, size)
+            heavy[object] = dict(statistics.heavy_objects)
+        return cls(size, distinct, heavy, subject if subject.startswith('?') else object)
+
+    def semi_join(self, other):
+        """
+        Estimate the semi-join of this relation with another relation (containment assumption: the values of the relation with
+        fewer distinct values are contained in the values of the other relation)
+
+        Parameters
+        ----------
+        other : RelationEstimate
+            Relation that is used to filter this relation
+
+        Returns
+        -------
+        RelationEstimate
+            Estimate of the filtered relation
+        """
+        shared_variables = [variable for variable in self.distinct if variable in other.distinct]
+        fraction = 1.0
+        for variable in shared_variables:
+            fraction *= min(1.0, other.distinct[variable] / max(self.distinct[variable], 1))
+
+        size = self.size * fraction
+        distinct, heavy = {}, {}
+        for variable, count in self.distinct.items():
+            if variable in shared_variables:
+                distinct[variable] = min(count, other.distinct[variable])
+                # only the heavy hitters that are also heavy hitters of the other relation are known to survive
+                heavy[variable] = {value: frequency for value, frequency in self.heavy[variable].items() if value in other.heavy[variable]}
+            else:
+                distinct[variable] = min(count, size)
+                heavy[variable] = {value: frequency * fraction for value, frequency in self.heavy[variable].items()}
+        return RelationEstimate(size, distinct, heavy, self.sorted_by)
+
+    def join(self, other, shared_variables):
+        """
+        Estimate the join of this relation with another relation
+        For a single join variable, the heavy hitters that occur in both relations are estimated exactly and the remaining values
+        with the uniform distribution assumption
+
+        Parameters
+        ----------
+        other : RelationEstimate
+            Relation that is joined
+        shared_variables : list
+            Join variables
+
+        Returns
+        -------
+        RelationEstimate
+            Estimate of the join result
+        """
+        if len(shared_variables) == 1:
+            variable = shared_variables[0]
+            common = [value for value in self.heavy[variable] if value in other.heavy[variable]]
+            heavy_size = sum(self.heavy[variable][value] * other.heavy[variable][value] for value in common)
+            own_rest = max(self.size - sum(self.heavy[variable][value] for value in common), 0)
+            other_rest = max(other.size - sum(other.heavy[variable][value] for value in common), 0)
+            distinct_rest = max(self.distinct[variable] - len(common), other.distinct[variable] - len(common), 1)
+            size = heavy_size + own_rest * other_rest / distinct_rest
+        else:
+            size = self.size * other.size
+            for variable in shared_variables:
+                size /= max(self.distinct[variable], other.distinct[variable], 1)
+
+        distinct, heavy = {}, {}
+        for variable in set(self.distinct) | set(other.distinct):
+            if variable in shared_variables:
+                distinct[variable] = min(self.distinct[variable], other.distinct[variable], size)
+                heavy[variable] = {value: self.heavy[variable][value] * other.heavy[variable][value]
+                                   for value in self.heavy[variable] if value in other.heavy[variable]}
+            else:
+                side = self if variable in self.distinct else other
+                fanout = size / max(side.size, 1)
+                distinct[variable] = min(side.distinct[variable], size)
+                heavy[variable] = {value: frequency * fanout for value, frequency in side.heavy[variable].items()}
+        return RelationEstimate(size, distinct, heavy)
+
+
+class JoinStep():
+    """
+    One join of a query plan
+    """
+
+    def __init__(self, node, method, build_left, shared_variables, estimated_size, cost):
+        self.node = node
+        self.method = method
+        self.build_left = build_left
+        self.shared_variables = shared_variables
+        self.estimated_size = estimated_size
+        self.cost = cost
+        # filled when the plan is executed
+        self.actual_size = None
+
+
+class QueryPlan():
+    """
+    Plan of the cost-based optimizer: Yannakakis reduction yes or no, join order and join method of every join
+    """
+
+    def __init__(self, use_yannakakis, first_node, steps, relation_estimates, cost_with_yannakakis, cost_without_yannakakis):
+        self.use_yannakakis = use_yannakakis
+        self.first_node = first_node
+        self.steps = steps
+        self.relation_estimates = relation_estimates
+        self.cost_with_yannakakis = cost_with_yannakakis
+        self.cost_without_yannakakis = cost_without_yannakakis
+
+    def explain(self, query, relations):
+        """
+        Describe the plan with the estimated and the actual cardinalities
+
+        Parameters
+        ----------
+        query : list
+            List of triple patterns
+        relations : list
+            Relations of the triple patterns (after the reduction, if it was done)
+
+        Returns
+        -------
+        str
+            Description of the plan
+        """
+        lines = [f"Yannakakis reduction: {'yes' if self.use_yannakakis else 'no'} "
+                 f"(estimated cost with {self.cost_with_yannakakis:.0f}, without {self.cost_without_yannakakis:.0f})"]
+        lines.append("Relations:")
+        for node, (pattern, relation) in enumerate(zip(query, relations)):
+            lines.append(f"  {' '.join(pattern)}: estimated {self.relation_estimates[node].size:.0f}, actual {len(relation)}")
+        lines.append("Joins:")
+        lines.append(f"  start with {' '.join(query[self.first_node])}")
+        for number, step in enumerate(self.steps, start=1):
+            method = step.method + (" (build left)" if step.method == "hash_join" and step.build_left else
+                                    " (build right)" if step.method == "hash_join" else "")
+            actual = "-" if step.actual_size is None else step.actual_size
+            lines.append(f"  {number}. {method} with {' '.join(query[step.node])} on {', '.join(step.shared_variables) or 'nothing'}: "
+                         f"estimated {step.estimated_size:.0f}, actual {actual}")
+        return "\n".join(lines)
+
+
+class CostBasedOptimizer():
+    def __init__(self, statistics):
+        """
+        Initialize the cost-based optimizer
+
+        Parameters
+        ----------
+        statistics : dict
+            Dictionary with the property names as keys and the PropertyStatistics as values
+        """
+        self.statistics = statistics
+
+    def optimize(self, query, join_tree, relations, use_yannakakis=None):
+        """
+        Choose the plan with the lowest estimated cost
+
+        Parameters
+        ----------
+        query : list
+            List of triple patterns
+        join_tree : JoinTree
+            Join tree of the query
+        relations : list
+            Relations of the triple patterns (not reduced)
+        use_yannakakis : bool
+            If None, the optimizer decides if the Yannakakis reduction is done, otherwise the given value is used
+
+        Returns
+        -------
+        QueryPlan
+            Plan with the lowest estimated cost
+        """
+        base_estimates = [RelationEstimate.from_pattern(pattern, self.statistics[pattern[1]], len(relation))
+                          for pattern, relation in zip(query, relations)]
+
+        # estimate the relations after the full reduction (same passes as QueryEngine.full_reduction)
+        reduced_estimates = list(base_estimates)
+        reduction_cost = 0.0
+        for node in join_tree.bottom_up_order:
+            parent = join_tree.parent[node]
+            if parent is not None:
+                reduction_cost += self.semi_join_cost(reduced_estimates[parent], reduced_estimates[node])
+                reduced_estimates[parent] = reduced_estimates[parent].semi_join(reduced_estimates[node])
+        for node in join_tree.top_down_order():
+            for child in join_tree.children[node]:
+                reduction_cost += self.semi_join_cost(reduced_estimates[child], reduced_estimates[node])
+                reduced_estimates[child] = reduced_estimates[child].semi_join(reduced_estimates[node])
+
+        first_with, steps_with, cost_with = self.join_order(query, reduced_estimates, False)
+        first_without, steps_without, cost_without = self.join_order(query, base_estimates, True)
+        cost_with += reduction_cost
+
+        if use_yannakakis is None:
+            use_yannakakis = cost_with < cost_without
+        if use_yannakakis:
+            return QueryPlan(True, first_with, steps_with, reduced_estimates, cost_with, cost_without)
+        return QueryPlan(False, first_without, steps_without, base_estimates, cost_with, cost_without)
+
+    def semi_join_cost(self, relation, other):
+        """
+        Estimated cost of a semi-join (both inputs are sorted by np.isin)
+        """
+        return SEMI_JOIN_COST * (sort_cost(relation.size) + sort_cost(other.size))
+
+    def join_order(self, query, estimates, indexed):
+        """
+        Choose the join order greedily: start with the smallest relation and always join the relation (connected to the result
+        so far) with the smallest estimated result, the join method of every join is chosen by its estimated cost
+
+        Parameters
+        ----------
+        query : list
+            List of triple patterns
+        estimates : list
+            Estimates of the relations of the triple patterns
+        indexed : bool
+            True if the relations are not reduced, then they can be taken from the SO or the OS index of their property table
+            and are sorted by the join variable in both cases (see QueryEngine.join_input)
+
+        Returns
+        -------
+        first_node : int
+            Triple pattern the plan starts with
+        steps : list
+            Joins of the plan (JoinStep)
+        cost : float
+            Estimated cost of all joins
+        """
+        remaining = list(range(len(query)))
+        first_node = min(remaining, key=lambda node: estimates[node].size)
+        remaining.remove(first_node)
+        result = estimates[first_node]
+
+        steps, total_cost = [], 0.0
+        while remaining:
+            candidates = [node for node in remaining if any(variable in result.distinct for variable in estimates[node].distinct)]
+            # cross products are only done if the query is not connected
+            candidates = candidates or remaining
+            options = []
+            for node in candidates:
+                shared_variables = [variable for variable in estimates[node].distinct if variable in result.distinct]
+                joined = result.join(estimates[node], shared_variables)
+                options.append((joined.size, node, shared_variables, joined))
+            size, node, shared_variables, joined = min(options, key=lambda option: (option[0], option[1]))
+
+            right = estimates[node]
+            if indexed and len(shared_variables) == 1:
+                right = RelationEstimate(right.size, right.distinct, right.heavy, shared_variables[0])
+            method, build_left, cost = self.join_method(result, right, shared_variables, size)
+            joined.sorted_by = self.sorted_by(method, build_left, result, estimates[node], shared_variables)
+            steps.append(JoinStep(node, method, build_left, shared_variables, size, cost))
+            total_cost += cost
+            result = joined
+            remaining.remove(node)
+        return first_node, steps, total_cost
+
+    def join_method(self, left, right, shared_variables, output_size):
+        """
+        Choose between hash join (with the smaller input as build side) and sort merge join (inputs that are already sorted by
+        the join variable do not need to be sorted)
+
+        Returns
+        -------
+        method : str
+            'hash_join' or 'sort_merge_join'
+        build_left : bool
+            True if the hash table is built for the left input
+        cost : float
+            Estimated cost of the join
+        """
+        build_left = left.size < right.size
+        build, probe = (left, right) if build_left else (right, left)
+        hash_cost = HASH_BUILD_COST * build.size + HASH_PROBE_COST * probe.size + OUTPUT_COST * output_size
+
+        sorted_key = shared_variables[0] if len(shared_variables) == 1 else None
+        merge_cost = MERGE_COST * (left.size + right.size) + OUTPUT_COST * output_size
+        for side in (left, right):
+            if sorted_key is None or side.sorted_by != sorted_key:
+                merge_cost += SORT_COST * sort_cost(side.size)
+
+        if merge_cost < hash_cost:
+            return "sort_merge_join", False, merge_cost
+        return "hash_join", build_left, hash_cost
+
+    def sorted_by(self, method, build_left, left, right, shared_variables):
+        """
+        Variable the join result is sorted by (the sort merge join returns the rows sorted by the join key, the hash join keeps
+        the order of the probe side)
+        """
+        if method == "sort_merge_join":
+            return shared_variables[0] if len(shared_variables) == 1 else None
+        return right.sorted_by if build_left else left.sorted_by
+
+
+def sort_cost(size):
+    """
+    Number of comparisons to sort the given number of rows
+    """
+    return size * math.log2(size) if size > 1 else size
@@ -0,0 +1,374 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from bitmaps import semi_join_mask
+from data_structures import IntHashTable, hash_array, match_sorted_keys
+from leapfrog_triejoin import TrieIndex, leapfrog_triejoin
+
+# arrays are stored in the shared memory block at offsets that are a multiple of ALIGNMENT bytes
+ALIGNMENT = 64
+
+# arrays of the shared memory block, attached once in every worker process (see attach_shared_arrays)
+_shared_arrays = {}
+
+
+def partition_ids(keys, number_of_partitions):
+    """
+    Partition of every join key (hash partitioning, the same keys always end up in the same partition)
+
+    Parameters
+    ----------
+    keys : np.ndarray
+        Join keys
+    number_of_partitions : int
+        Number of partitions
+
+    Returns
+    -------
+    np.ndarray
+        Partition of every key (uint16)
+    """
+    return (hash_array(keys) % np.uint64(number_of_partitions)).astype(np.uint16)
+
+
+def split_keys(keys, number_of_partitions):
+    """
+    Split an array of join keys into its partitions (the order of the keys within a partition is kept)
+
+    Returns
+    -------
+    list
+        Keys of every partition
+    """
+    partitions = partition_ids(keys, number_of_partitions)
+    return [keys[partitions == partition] for partition in range(number_of_partitions)]
+
+
+class SharedArrays():
+    """
+    Named numpy arrays in one shared memory block, worker processes attach to the block instead of receiving pickled copies
+    """
+
+    def __init__(self, arrays):
+        """
+        Create the shared memory block and copy the arrays into it
+
+        Parameters
+        ----------
+        arrays : dict
+            Dictionary with the names as keys and the arrays as values
+        """
+        self.layout = {}
+        position = 0
+        for name, array in arrays.items():
+            self.layout[name] = (position, array.dtype.str, len(array))
+            position += (array.nbytes + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=max(position, 1))
+        for name, array in arrays.items():
+            self.view(self.shared_memory, name)[:] = array
+
+    def view(self, block, name):
+        position, dtype, length = self.layout[name]
+        return np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf, offset=position)
+
+    def descriptor(self):
+        """
+        Name of the shared memory block and position, dtype and length of every array (sent to the worker processes)
+        """
+        return self.shared_memory.name, self.layout
+
+    def close(self):
+        """
+        Release the shared memory block
+        """
+        self.shared_memory.close()
+        self.shared_memory.unlink()
+
+
+def open_shared_block(name):
+    """
+    Open a shared memory block of the main process in a worker process
+    """
+    # the block is owned by the main process, the worker must not unlink it when it exits
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument, the workers share the resource tracker of the main process
+        return shared_memory.SharedMemory(name=name)
+
+
+def attach_shared_arrays(descriptor):
+    """
+    Attach a worker process to the shared memory block (initializer of the process pool)
+
+    Parameters
+    ----------
+    descriptor : tuple
+        Name of the shared memory block and the layout of its arrays (see SharedArrays.descriptor)
+    """
+    name, layout = descriptor
+    block = open_shared_block(name)
+    _shared_arrays.clear()
+    _shared_arrays['block'] = block
+    for array_name, (position, dtype, length) in layout.items():
+        _shared_arrays[array_name] = np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf, offset=position)
+
+
+def partition_rows(property_name, partition, reduced=False):
+    """
+    Rows of a partition of a property table (sorted by subject), optionally only the rows that were kept by the semi-join
+    with the subjects of the next property table of the query (see semi_join_task)
+
+    Parameters
+    ----------
+    property_name : str
+        Name of the property
+    partition : int
+        Number of the partition
+    reduced : bool
+        If True, only the rows of the row mask of the semi-join are returned
+
+    Returns
+    -------
+    tuple
+        Subjects and objects of the rows
+    """
+    offsets = _shared_arrays[f'{property_name}/offsets']
+    start, end = offsets[partition], offsets[partition + 1]
+    subjects = _shared_arrays[f'{property_name}/subjects'][start:end]
+    objects = _shared_arrays[f'{property_name}/objects'][start:end]
+    if reduced:
+        mask = _shared_arrays[f'{property_name}/mask'][start:end]
+        subjects, objects = subjects[mask], objects[mask]
+    return subjects, objects
+
+
+def semi_join_task(task):
+    """
+    Semi-join of a partition of a property table with the subjects of the next property table (runs in a worker process)
+    The subjects of the next property table are read from the shared memory block of the step, the row mask of the partition
+    is stored in the shared memory block of the property tables, so the joins reuse it
+
+    Parameters
+    ----------
+    task : tuple
+        Property name, partition, the descriptor of the shared memory block with the sorted subjects of the next property
+        table (None for no reduction) and the membership test of the semi-join (see bitmaps.semi_join_mask)
+
+    Returns
+    -------
+    subjects : np.ndarray
+        Sorted distinct subjects of the rows that were kept
+    number_of_rows : int
+        Number of rows that were kept
+    """
+    property_name, partition, descriptor, semi_join_filter = task
+    if descriptor is None:
+        subjects, _ = partition_rows(property_name, partition)
+        return np.unique(subjects), len(subjects)
+
+    name, layout = descriptor
+    block = open_shared_block(name)
+    position, dtype, length = layout['reduce_keys']
+    reduce_keys = np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf, offset=position)
+    offsets = _shared_arrays[f'{property_name}/offsets']
+    start, end = offsets[partition], offsets[partition + 1]
+    mask = _shared_arrays[f'{property_name}/mask'][start:end]
+    mask[:] = semi_join_mask(_shared_arrays[f'{property_name}/objects'][start:end], reduce_keys, semi_join_filter)
+    # the view has to be released before the block can be closed
+    del reduce_keys
+    block.close()
+    subjects = _shared_arrays[f'{property_name}/subjects'][start:end][mask]
+    return np.unique(subjects), len(subjects)
+
+
+def join_task(task):
+    """
+    Join the keys of a partition with the (reduced) rows of the same partition of a property table (runs in a worker process)
+
+    Parameters
+    ----------
+    task : tuple
+        Algorithm type, property name, partition, join keys of the partition and if the rows are reduced (see partition_rows)
+
+    Returns
+    -------
+    np.ndarray
+        Sorted distinct objects of the matching rows
+    """
+    algorithm_type, property_name, partition, keys, reduced = task
+    subjects, objects = partition_rows(property_name, partition, reduced)
+    if algorithm_type == "sort_merge_join":
+        # the subjects of a partition are sorted, the keys are sorted distinct objects of the previous join
+        _, positions = match_sorted_keys(subjects, keys)
+    else:
+        _, positions = IntHashTable(keys).probe(subjects)
+    return np.unique(objects[positions])
+
+
+def shared_trie(variables, property_name):
+    """
+    Trie index over the complete property table in subject order from the arrays in shared memory
+    """
+    return TrieIndex.from_csr(variables, *(_shared_arrays[f'{property_name}/trie_{name}'] for name in ('keys', 'offsets', 'values', 'pairs')))
+
+
+def leapfrog_task(task):
+    """
+    Leapfrog triejoin of the assignment query for a partition of the objects of follows (runs in a worker process)
+    The friendOf rows of the partition and the complete likes and hasReview tables are used as trie indices
+
+    Parameters
+    ----------
+    task : tuple
+        Partition, objects of follows in the partition and if the rows of friendOf are reduced
+
+    Returns
+    -------
+    np.ndarray
+        Sorted distinct objects of hasReview
+    """
+    partition, objects_of_follows, reduced = task
+    variable_order = ['follows_object', 'friendOf_object', 'likes_object', 'hasReview_object']
+    tries = [
+        TrieIndex(('follows_object',), objects_of_follows),
+        TrieIndex(('follows_object', 'friendOf_object'), *partition_rows('friendOf', partition, reduced)),
+        shared_trie(('friendOf_object', 'likes_object'), 'likes'),
+        shared_trie(('likes_object', 'hasReview_object'), 'hasReview'),
+    ]
+    objects_of_hasReview, = leapfrog_triejoin(tries, variable_order, ['hasReview_object'])
+    return objects_of_hasReview
+
+
+class ParallelJoinPipeline():
+    """
+    Partition-parallel execution of the semi-joins and joins of the assignment query with a pool of worker processes
+    Every property table is hash-partitioned by subject (within a partition the rows stay sorted by subject) and stored once in
+    shared memory. In every step, the join keys are hash-partitioned the same way, so every worker joins its keys with its
+    partition of the property table, and the results of the workers are merged by the main process
+    The subjects a property table is reduced with are copied into shared memory once per semi-join, and the row masks of the
+    reduced partitions stay in shared memory, so the joins do not repeat the semi-joins
+    """
+
+    def __init__(self, property_tables, workers):
+        """
+        Partition the property tables, copy them into shared memory and start the worker processes
+
+        Parameters
+        ----------
+        property_tables : dict
+            Dictionary with the property names as keys and the columnar property tables as values
+        workers : int
+            Number of worker processes (and partitions)
+        """
+        self.workers = workers
+        arrays = {}
+        for property_name, property_table in property_tables.items():
+            # the stable sort keeps the subject order of the property table within every partition
+            partitions = partition_ids(property_table.subjects, workers)
+            order = np.argsort(partitions, kind='stable')
+            offsets = np.zeros(workers + 1, dtype=np.int64)
+            np.cumsum(np.bincount(partitions, minlength=workers), out=offsets[1:])
+            arrays[f'{property_name}/subjects'] = property_table.subjects[order]
+            arrays[f'{property_name}/objects'] = property_table.objects[order]
+            arrays[f'{property_name}/offsets'] = offsets
+            # rows that were kept by the last semi-join of the property table (see semi_join_task)
+            arrays[f'{property_name}/mask'] = np.ones(len(property_table), dtype=bool)
+            # the trie index of the complete table in subject order (used by the leapfrog triejoin)
+            trie = TrieIndex(('subject', 'object'), property_table.subjects, property_table.objects)
+            for name in ('keys', 'offsets', 'values', 'pairs'):
+                arrays[f'{property_name}/trie_{name}'] = getattr(trie, name)
+
+        self.shared_arrays = SharedArrays(arrays)
+        # property tables whose row masks are the result of a semi-join
+        self.reduced = set()
+        try:
+            self.pool = multiprocessing.Pool(workers, initializer=attach_shared_arrays, initargs=(self.shared_arrays.descriptor(),))
+        except BaseException:
+            self.shared_arrays.close()
+            raise
+
+    def semi_join(self, property_name, reduce_keys, semi_join_filter='isin'):
+        """
+        Semi-join of a property table with the subjects of the next property table, every worker reduces one partition
+
+        Parameters
+        ----------
+        property_name : str
+            Name of the property
+        reduce_keys : np.ndarray
+            Sorted subjects of the next property table (None if the property table is not reduced)
+        semi_join_filter : str
+            Membership test of the semi-join in the workers: 'isin', 'bitmap' or 'bloom' (see bitmaps.semi_join_mask)
+
+        Returns
+        -------
+        subjects : np.ndarray
+            Sorted distinct subjects of the reduced property table
+        number_of_rows : int
+            Number of rows of the reduced property table
+        """
+        if reduce_keys is None:
+            self.reduced.discard(property_name)
+            results = self.pool.map(semi_join_task, [(property_name, partition, None, semi_join_filter) for partition in range(self.workers)])
+        else:
+            step_arrays = SharedArrays({'reduce_keys': np.asarray(reduce_keys)})
+            try:
+                tasks = [(property_name, partition, step_arrays.descriptor(), semi_join_filter) for partition in range(self.workers)]
+                results = self.pool.map(semi_join_task, tasks)
+            finally:
+                step_arrays.close()
+            self.reduced.add(property_name)
+        # the partitions have disjoint subjects
+        subjects = np.sort(np.concatenate([subjects for subjects, _ in results]))
+        return subjects, sum(number_of_rows for _, number_of_rows in results)
+
+    def join(self, algorithm_type, property_name, keys):
+        """
+        Join the distinct objects of the previous join with the subjects of a property table, every worker joins one partition
+        If the property table was reduced by semi_join, only the rows that were kept are joined
+
+        Parameters
+        ----------
+        algorithm_type : str
+            'hash_join' or 'sort_merge_join'
+        property_name : str
+            Name of the property
+        keys : np.ndarray
+            Sorted distinct objects of the previous join
+
+        Returns
+        -------
+        np.ndarray
+            Sorted distinct objects of the join result
+        """
+        reduced = property_name in self.reduced
+        tasks = [(algorithm_type, property_name, partition, partition_keys, reduced)
+                 for partition, partition_keys in enumerate(split_keys(keys, self.workers))]
+        return np.unique(np.concatenate(self.pool.map(join_task, tasks)))
+
+    def leapfrog_triejoin(self, objects_of_follows):
+        """
+        Leapfrog triejoin of the assignment query, every worker joins one partition of the objects of follows (with the rows of
+        friendOf that were kept by semi_join)
+
+        Returns
+        -------
+        np.ndarray
+            Sorted distinct objects of hasReview
+        """
+        reduced = 'friendOf' in self.reduced
+        tasks = [(partition, partition_keys, reduced)
+                 for partition, partition_keys in enumerate(split_keys(objects_of_follows, self.workers))]
+        return np.unique(np.concatenate(self.pool.map(leapfrog_task, tasks)))
+
+    def close(self):
+        """
+        Stop the worker processes and release the shared memory
+        """
+        self.pool.close()
+        self.pool.join()
+        self.shared_arrays.close()
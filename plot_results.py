@@ -1,58 +1,85 @@
+import json
+import sys
+
 import matplotlib.pyplot as plt
 import numpy as np
 
-############################################
-# Plot size of relations with and without Yannakis
-############################################
-has_review_size_without_yannakis = 5159
-has_review_size_with_yannakis = 5159
+# results of benchmark.py
+benchmark_path = sys.argv[1] if len(sys.argv) > 1 else 'output/benchmark.json'
+with open(benchmark_path) as benchmark_file:
+    benchmark = json.load(benchmark_file)
+
+# the size and runtime plots show the largest dataset
+dataset = max(benchmark['datasets'], key=lambda dataset: dataset['triples'])
+algorithms = list(dict.fromkeys(result['algorithm'] for result in dataset['results']))
 
-likes_size_without_yannakis = 23921
-likes_size_with_yannakis = 13457
 
-friend_of_size_without_yannakis = 39781
-friend_of_size_with_yannakis = 39724
+def find_result(results, algorithm_type, use_yannakakis):
+    return next(result for result in results if result['algorithm'] == algorithm_type and result['yannakakis'] == use_yannakakis)
 
-follows_size_without_yannakis = 91200
-follows_size_with_yannakis = 36287
 
+############################################
+# Plot size of relations with and without Yannakis
+############################################
 relations = ['hasReview', 'likes', 'friendOf', 'follows']
 x = np.arange(len(relations))
+# the sizes do not depend on the join algorithm, the number of objects is the size of the relation
+sizes_with_yannakis = find_result(dataset['results'], algorithms[0], True)['sizes']
+sizes_without_yannakis = find_result(dataset['results'], algorithms[0], False)['sizes']
 
 fig = plt.figure()
 ax = fig.add_subplot(111)
-rects = ax.bar(x - 0.125, [has_review_size_with_yannakis, likes_size_with_yannakis, friend_of_size_with_yannakis, follows_size_with_yannakis], color='orange', width=0.25, label='with Yannakis')
+rects = ax.bar(x - 0.125, [sizes_with_yannakis[relation][1] for relation in relations], color='orange', width=0.25, label='with Yannakis')
 ax.bar_label(rects, padding=3, size=10)
-rects = ax.bar(x + 0.125, [has_review_size_without_yannakis, likes_size_without_yannakis, friend_of_size_without_yannakis, follows_size_without_yannakis], color='b', width=0.25, label='without Yannakis')
+rects = ax.bar(x + 0.125, [sizes_without_yannakis[relation][1] for relation in relations], color='b', width=0.25, label='without Yannakis')
 ax.bar_label(rects, padding=3, size=10)
 
 ax.set_ylabel("Relation Size")
 ax.set_xlabel("Relation")
 ax.set_xticks(x, relations)
+ax.set_title(dataset['path'])
 ax.legend(loc='upper left', ncols=2)
 plt.show()
 
 ############################################
-# Plot runtime of hash join and sort-merge join with and without Yannakis
+# Plot median runtime (and the p10 to p90 range) of the join algorithms with and without Yannakis
 ############################################
-runtime_hash_with_yannkis = 0.34
-runtime_hash_without_yannkis = 0.90
-
-runtime_sort_merge_with_yannkis = 0.30
-runtime_sort_merge_without_yannkis = 0.48
-
-algorithms = ['Hash Join', 'Sort Merge Join']
 x = np.arange(len(algorithms))
 
 fig = plt.figure()
 ax = fig.add_subplot(111)
-rects = ax.barh(x - 0.125, [runtime_hash_with_yannkis, runtime_sort_merge_with_yannkis], color='orange', height=0.25, label='with Yannakis')
-ax.bar_label(rects, padding=3, size=10)
-rects = ax.barh(x + 0.125, [runtime_hash_without_yannkis, runtime_sort_merge_without_yannkis], color='b', height=0.25, label='without Yannakis')
-ax.bar_label(rects, padding=3, size=10)
+for offset, use_yannakakis, color, label in [(-0.125, True, 'orange', 'with Yannakis'), (0.125, False, 'b', 'without Yannakis')]:
+    runtimes = [find_result(dataset['results'], algorithm_type, use_yannakakis)['total_time'] for algorithm_type in algorithms]
+    medians = np.array([runtime['median'] for runtime in runtimes])
+    errors = [medians - [runtime['p10'] for runtime in runtimes], [runtime['p90'] for runtime in runtimes] - medians]
+    rects = ax.barh(x + offset, medians, xerr=errors, color=color, height=0.25, label=label)
+    ax.bar_label(rects, labels=[f'{median:.3f}' for median in medians], padding=3, size=10)
 
-ax.set_xlabel("Runtime (s)")
+ax.set_xlabel("Median Runtime (s)")
 ax.set_ylabel("Join Algorithm")
-ax.set_yticks(x, algorithms)
+ax.set_yticks(x, [algorithm_type.replace('_', ' ').title() for algorithm_type in algorithms])
+ax.set_title(dataset['path'])
 ax.legend(loc='upper right', ncols=2)
 plt.show()
+
+############################################
+# Plot median runtime of the join algorithms over the number of triples (if several datasets were benchmarked)
+############################################
+if len(benchmark['datasets']) > 1:
+    datasets = sorted(benchmark['datasets'], key=lambda dataset: dataset['triples'])
+    triples = [dataset['triples'] for dataset in datasets]
+
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    for algorithm_type in algorithms:
+        for use_yannakakis, line_style in [(True, '-'), (False, '--')]:
+            medians = [find_result(dataset['results'], algorithm_type, use_yannakakis)['total_time']['median'] for dataset in datasets]
+            label = f"{algorithm_type.replace('_', ' ').title()} {'with' if use_yannakakis else 'without'} Yannakis"
+            ax.plot(triples, medians, line_style, marker='o', label=label)
+
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_xlabel("Number of Triples")
+    ax.set_ylabel("Median Runtime (s)")
+    ax.legend(loc='upper left')
+    plt.show()
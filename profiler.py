@@ -0,0 +1,223 @@
+import json
+import time
+import tracemalloc
+
+
+class OperatorProfile():
+    """
+    Measurements of one operator (e.g. a semi-join or a join) and of the operators that were executed within it
+    """
+
+    def __init__(self, name, input_rows, details):
+        """
+        Parameters
+        ----------
+        name : str
+            Name of the operator
+        input_rows : list
+            Cardinalities of the inputs of the operator
+        details : dict
+            Additional information about the operator (e.g. the property table or the algorithm)
+        """
+        self.name = name
+        self.input_rows = list(input_rows)
+        self.details = details
+        # the cardinality of the output is set by the operator (None if the operator has no single output)
+        self.output_rows = None
+        self.elapsed = 0.0
+        # peak allocated memory during the operator minus the allocated memory at its start (None without memory tracing)
+        self.memory_delta = None
+        self.children = []
+
+    def to_dict(self):
+        """
+        JSON representation of the operator and its children
+        """
+        return {
+            'name': self.name,
+            'details': self.details,
+            'input_rows': self.input_rows,
+            'output_rows': self.output_rows,
+            'elapsed': self.elapsed,
+            'memory_delta': self.memory_delta,
+            'children': [child.to_dict() for child in self.children],
+        }
+
+    def explain(self, depth=0):
+        """
+        Lines of the EXPLAIN ANALYZE tree of the operator and its children
+        """
+        details = ''.join(f' {key}={value}' for key, value in self.details.items())
+        rows = f"rows: {' x '.join(str(rows) for rows in self.input_rows) or '-'} -> {'-' if self.output_rows is None else self.output_rows}"
+        memory = '' if self.memory_delta is None else f", memory: +{self.memory_delta / 1e6:.2f} MB"
+        lines = [f"{'  ' * depth}{'-> ' if depth else ''}{self.name}{details} ({rows}, time: {self.elapsed * 1000:.2f} ms{memory})"]
+        for child in self.children:
+            lines.extend(child.explain(depth + 1))
+        return lines
+
+
+class DisabledOperator():
+    """
+    Operator of a disabled profiler: entering and leaving it does nothing and the cardinalities that are set are ignored
+    """
+    # the operator is shared by all disabled profilers, so it must not keep the attributes that are set on it
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+
+DISABLED_OPERATOR = DisabledOperator()
+
+
+class ActiveOperator():
+    """
+    Context manager that measures an operator of an enabled profiler
+    """
+
+    def __init__(self, profiler, profile):
+        self.profiler = profiler
+        self.profile = profile
+
+    def __enter__(self):
+        self.profiler.enter(self.profile)
+        return self.profile
+
+    def __exit__(self, *exception):
+        self.profiler.exit(self.profile)
+        return False
+
+
+class Profiler():
+    """
+    Per-operator instrumentation: every operator records its input and output cardinalities, its elapsed time and the peak of the
+    allocated memory (traced with tracemalloc) relative to its start. Operators that are executed within an operator become its
+    children, so the measurements form a tree that is shown as EXPLAIN ANALYZE (explain_analyze) or written as JSON trace (to_json)
+    A disabled profiler returns the same no-op operator for every call, so the instrumentation costs nothing but the call
+    """
+
+    def __init__(self, enabled=True, trace_memory=True):
+        """
+        Parameters
+        ----------
+        enabled : bool
+            If False, nothing is measured
+        trace_memory : bool
+            If True, the peak allocated memory of every operator is traced with tracemalloc (which slows down allocations)
+        """
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        # finished top-level operators and the stack of the operators that are running
+        self.roots = []
+        self.stack = []
+        # peak of the allocated memory of every running operator until its last child started
+        self.peaks = []
+        self.started_tracing = False
+
+    def operator(self, name, input_rows=(), **details):
+        """
+        Measure an operator, use it as context manager and set output_rows of the returned profile:
+
+            with profiler.operator('semi_join', lambda: [len(left), len(right)], property='likes') as operator:
+                result = ...
+                operator.output_rows = len(result)
+
+        Parameters
+        ----------
+        name : str
+            Name of the operator
+        input_rows : list or callable
+            Cardinalities of the inputs of the operator, or a function that returns them (only called if the profiler is enabled)
+        details
+            Additional information about the operator
+
+        Returns
+        -------
+        context manager
+            Context manager that returns the OperatorProfile of the operator
+        """
+        if not self.enabled:
+            return DISABLED_OPERATOR
+        if callable(input_rows):
+            input_rows = input_rows()
+        return ActiveOperator(self, OperatorProfile(name, input_rows, details))
+
+    def enter(self, profile):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            if self.peaks:
+                self.peaks[-1] = max(self.peaks[-1], peak)
+            # the peak is reset for every operator, the peaks of the parents are kept in self.peaks
+            tracemalloc.reset_peak()
+            profile.memory_delta = current
+            self.peaks.append(current)
+
+        if self.stack:
+            self.stack[-1].children.append(profile)
+        else:
+            self.roots.append(profile)
+        self.stack.append(profile)
+        profile.elapsed = time.perf_counter()
+
+    def exit(self, profile):
+        profile.elapsed = time.perf_counter() - profile.elapsed
+        self.stack.pop()
+
+        if self.trace_memory:
+            peak = max(self.peaks.pop(), tracemalloc.get_traced_memory()[1])
+            # memory_delta holds the allocated memory at the start of the operator
+            profile.memory_delta = peak - profile.memory_delta
+            if self.peaks:
+                self.peaks[-1] = max(self.peaks[-1], peak)
+            tracemalloc.reset_peak()
+            if not self.stack and self.started_tracing:
+                tracemalloc.stop()
+                self.started_tracing = False
+
+    def clear(self):
+        """
+        Remove the measurements of the finished operators
+        """
+        self.roots = []
+
+    def explain_analyze(self):
+        """
+        EXPLAIN ANALYZE tree of the measured operators
+
+        Returns
+        -------
+        str
+            One line per operator, the children of an operator are indented below it
+        """
+        return '\n'.join(line for root in self.roots for line in root.explain())
+
+    def to_dict(self):
+        """
+        JSON representation of the measured operators
+        """
+        return {'operators': [root.to_dict() for root in self.roots]}
+
+    def to_json(self, path):
+        """
+        Write the measured operators as JSON trace
+
+        Parameters
+        ----------
+        path : str
+            Path of the JSON file
+        """
+        with open(path, 'w') as trace_file:
+            json.dump(self.to_dict(), trace_file, indent=2)
+
+
+# profiler of the join algorithms and the preprocessor if no profiler is given
+DISABLED_PROFILER = Profiler(enabled=False)
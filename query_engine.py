@@ -0,0 +1,808 @@
+import time
+
+import numpy as np
+
+from data_preprocessor import DataPreprocessor
+from join_algorithms import RESULT_BATCH_SIZE, hash_join_indices, sort_merge_join_indices
+from leapfrog_triejoin import TrieIndex, choose_variable_order, leapfrog_triejoin
+from optimizer import CostBasedOptimizer
+from profiler import DISABLED_PROFILER
+from result_writer import ResultWriter
+
+# join algorithms of the query engine ('cost_based' lets the optimizer choose the join method of every join)
+ALGORITHM_TYPES = ('hash_join', 'sort_merge_join', 'leapfrog_triejoin', 'cost_based')
+
+# the query of the assignment as a list of triple patterns (subject variable, property, object variable)
+# follows.object = friendOf.subject, friendOf.object = likes.subject, likes.object = hasReview.subject
+ASSIGNMENT_QUERY = [
+    ('?user1', 'follows', '?user2'),
+    ('?user2', 'friendOf', '?user3'),
+    ('?user3', 'likes', '?product'),
+    ('?product', 'hasReview', '?review'),
+]
+
+
+class Relation():
+    """
+    Relation of a triple pattern (or of an intermediate join result)
+    The relation is stored column-wise, one integer array for each variable of the relation
+    """
+
+    def __init__(self, variables, columns, sorted_by=None):
+        """
+        Initialize the relation
+
+        Parameters
+        ----------
+        variables : tuple
+            Names of the variables (columns) of the relation
+        columns : list
+            One array of integer encodings for each variable (all arrays have the same length)
+        sorted_by : str
+            Variable the rows are sorted by (None if the order is unknown), sort merge joins on this variable do not sort the relation
+        """
+        self.variables = tuple(variables)
+        self.columns = list(columns)
+        self.sorted_by = sorted_by
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def nbytes(self):
+        """
+        Get the memory used by the columns of the relation
+        """
+        return sum(column.nbytes for column in self.columns)
+
+    def column(self, variable):
+        """
+        Get the column of a variable
+
+        Parameters
+        ----------
+        variable : str
+            Name of the variable
+
+        Returns
+        -------
+        np.ndarray
+            Integer encodings of the variable
+        """
+        return self.columns[self.variables.index(variable)]
+
+    def keys(self, variables):
+        """
+        Get the join keys of the relation for the given variables
+        The values of two variables are packed into one 64 bit integer (the integer encodings are 32 bit integers)
+
+        Parameters
+        ----------
+        variables : list
+            Variables of the join key (at most two because triple patterns have at most two variables)
+
+        Returns
+        -------
+        np.ndarray
+            Join key of every row (int64)
+        """
+        if len(variables) > 2:
+            raise ValueError("Join keys of more than two variables are not supported")
+        keys = np.zeros(len(self), dtype=np.int64)
+        for variable in variables:
+            keys = (keys << 32) | self.column(variable).astype(np.int64)
+        return keys
+
+    def filter(self, mask):
+        """
+        Keep the rows of the relation that are selected by the mask
+
+        Parameters
+        ----------
+        mask : np.ndarray
+            Boolean array (one value per row) or array of row indices
+
+        Returns
+        -------
+        Relation
+            Relation that contains the selected rows
+        """
+        # a boolean mask keeps the order of the rows
+        sorted_by = self.sorted_by if np.asarray(mask).dtype == bool else None
+        return Relation(self.variables, [column[mask] for column in self.columns], sorted_by)
+
+    def semi_join(self, other):
+        """
+        Semi-join of this relation with another relation (self ⋉ other)
+        Only rows of this relation are kept that have a join partner in the other relation
+
+        Parameters
+        ----------
+        other : Relation
+            Relation that is used to filter this relation
+
+        Returns
+        -------
+        Relation
+            Filtered relation (same variables as this relation)
+        """
+        shared_variables = [variable for variable in self.variables if variable in other.variables]
+
+        # check for all rows at once if their join key is present in the other relation
+        return self.filter(np.isin(self.keys(shared_variables), other.keys(shared_variables)))
+
+
+class JoinTree():
+    """
+    Join tree of an acyclic query, built with the GYO reduction
+    Each node of the tree is the index of a triple pattern in the query
+    """
+
+    def __init__(self, query):
+        """
+        Initialize the join tree and build it with the GYO reduction
+
+        Parameters
+        ----------
+        query : list
+            List of triple patterns (subject, property, object), variables start with '?'
+
+        Raises
+        ------
+        ValueError
+            If the query is cyclic
+        """
+        self.query = query
+        self.pattern_variables = [pattern_variables(pattern) for pattern in query]
+
+        # parent of each node (None for the roots) and children of each node
+        self.parent = [None] * len(query)
+        self.children = [[] for _ in query]
+        # roots of the join forest (one root for each connected component of the query)
+        self.roots = []
+        # order in which the GYO reduction removed the nodes, every node is removed before its parent
+        self.bottom_up_order = []
+
+        self.build()
+
+    def build(self):
+        """
+        Build the join tree with the GYO reduction
+        A triple pattern is an ear if all its variables that are shared with other remaining triple patterns are contained in one single other triple pattern (the witness)
+        Ears are removed one after another and become children of their witness
+        If no ear can be found before all triple patterns are removed, the query is cyclic
+        """
+        remaining = list(range(len(self.query)))
+
+        while remaining:
+            for node in remaining:
+                others = [other for other in remaining if other != node]
+                # variables of the node that also occur in other remaining triple patterns
+                shared_variables = set(variable for variable in self.pattern_variables[node]
+                                       if any(variable in self.pattern_variables[other] for other in others))
+
+                if not shared_variables:
+                    # the node is not connected to the remaining triple patterns and becomes a root
+                    self.roots.append(node)
+                    break
+
+                witness = next((other for other in others if shared_variables <= self.pattern_variables[other]), None)
+                if witness is not None:
+                    # the node is an ear and becomes a child of the witness
+                    self.parent[node] = witness
+                    self.children[witness].append(node)
+                    break
+            else:
+                raise ValueError("Query is cyclic, no join tree exists")
+
+            remaining.remove(node)
+            self.bottom_up_order.append(node)
+
+    def rooted_at(self, root):
+        """
+        Root the component of the join tree that contains the given node at this node
+        Every node of a join tree can be its root, the running intersection property does not depend on the root
+
+        Parameters
+        ----------
+        root : int
+            Node that becomes the root
+
+        Returns
+        -------
+        bottom_up_order : list
+            Nodes of the component, every node comes before its parent
+        parent : dict
+            Parent of every node of the component (None for the root)
+        """
+        parent = {root: None}
+        top_down_order = [root]
+        for node in top_down_order:
+            neighbours = self.children[node] + ([self.parent[node]] if self.parent[node] is not None else [])
+            for neighbour in neighbours:
+                if neighbour not in parent:
+                    parent[neighbour] = node
+                    top_down_order.append(neighbour)
+        return top_down_order[::-1], parent
+
+    def top_down_order(self):
+        """
+        Order of the nodes in which every node comes after its parent
+
+        Returns
+        -------
+        list
+            Nodes of the join tree in top-down order
+        """
+        return self.bottom_up_order[::-1]
+
+
+def pattern_variables(pattern):
+    """
+    Get the variables of a triple pattern
+
+    Parameters
+    ----------
+    pattern : tuple
+        Triple pattern (subject, property, object)
+
+    Returns
+    -------
+    set
+        Variables of the triple pattern
+    """
+    subject, _, object = pattern
+    return set(term for term in (subject, object) if term.startswith('?'))
+
+
+def sum_by_key(keys, weights):
+    """
+    Sum up the weights of equal keys
+
+    Parameters
+    ----------
+    keys : np.ndarray
+        Keys (one per weight)
+    weights : np.ndarray
+        int64 weights
+
+    Returns
+    -------
+    distinct_keys : np.ndarray
+        Sorted distinct keys
+    sums : np.ndarray
+        Sum of the weights of every distinct key
+    """
+    if not len(keys):
+        return keys, weights
+    order = np.argsort(keys, kind='stable')
+    distinct_keys, starts = np.unique(keys[order], return_index=True)
+    return distinct_keys, np.add.reduceat(weights[order], starts)
+
+
+class QueryEngine():
+    def __init__(self, algorithm_type, preprocessor : DataPreprocessor, query, output_path=None, use_yannakakis=True,
+                 profiler=DISABLED_PROFILER, cache=None, filters=(), output_format='text'):
+        """
+        Initialize the query engine for an arbitrary acyclic query (or an arbitrary cyclic query for the leapfrog triejoin)
+        The join tree is built and the relations of the triple patterns are loaded (and fully reduced if Yannakakis is used)
+
+        Parameters
+        ----------
+        algorithm_type : str
+            Type of the join algorithm ('hash_join', 'sort_merge_join', 'leapfrog_triejoin' or 'cost_based')
+            'cost_based' lets the cost-based optimizer choose the join order and the join method of every join (see optimizer.py)
+        preprocessor : DataPreprocessor
+            Preprocessor that contains the property tables
+        query : list
+            List of triple patterns (subject, property, object), subject and object are variables or terms as written in the data
+        output_path : str
+            Path to the output file
+        use_yannakakis : bool
+            If True, the full (bottom-up and top-down) Yannakakis semi-join reduction is done before the joins
+            If None, the cost-based optimizer decides if the reduction is worth its cost (the other algorithms always reduce)
+            Cyclic queries have no join tree, so they are never reduced
+        profiler : Profiler
+            Profiler that measures the semi-joins, the joins and the collection of the results (see profiler.py), disabled by default
+        cache : LRUCache
+            Cache of the semi-join results (see query_server.py), queries with the same subtrees of the join tree reuse the
+            reduced relations of each other (None if nothing is cached)
+        filters : list
+            Filters of single variables (see sparql.Filter), every relation that contains the variable of a filter only keeps the
+            rows whose value matches it
+        output_format : str
+            Format of the output file written by collect_results (see result_writer.OUTPUT_FORMATS)
+        """
+        self.algorithm_type = algorithm_type
+        self.profiler = profiler
+        self.cache = cache
+        self.output_path = output_path
+        self.output_format = output_format
+        self.query = query
+        self.filters = list(filters)
+        self.property_tables = preprocessor.property_tables
+        self.term_dictionary = preprocessor.term_dictionary
+
+        try:
+            self.join_tree = JoinTree(query)
+        except ValueError:
+            # only the worst-case optimal join can run cyclic queries
+            if algorithm_type != "leapfrog_triejoin":
+                raise
+            self.join_tree = None
+        # variables of the query in the order of their first occurrence (used for the output)
+        self.variables = []
+        for subject, _, object in query:
+            for term in (subject, object):
+                if term.startswith('?') and term not in self.variables:
+                    self.variables.append(term)
+
+        self.relations = [self.load_relation(pattern) for pattern in query]
+        # the lineage of a relation describes how it was computed: the triple pattern and the semi-joins that reduced it
+        # relations with the same lineage have the same rows, so the lineage is the key of the semi-join results in the cache
+        self.lineage = [tuple(pattern) + tuple(filter.key() for filter in self.filters if filter.variable in pattern) for pattern in query]
+
+        # the plan of the cost-based optimizer (None for the other algorithms)
+        self.plan = None
+        if algorithm_type == "cost_based":
+            self.plan = CostBasedOptimizer(preprocessor.statistics).optimize(query, self.join_tree, self.relations, use_yannakakis)
+            use_yannakakis = self.plan.use_yannakakis
+        elif use_yannakakis is None:
+            use_yannakakis = True
+
+        self.reduced = use_yannakakis and self.join_tree is not None
+        if self.reduced:
+            with profiler.operator('full_reduction', lambda: [len(relation) for relation in self.relations]) as operator:
+                self.full_reduction()
+                operator.output_rows = sum(len(relation) for relation in self.relations)
+
+    def load_relation(self, pattern, sorted_by=None):
+        """
+        Load the relation of a triple pattern from the columnar property tables
+        The rows are taken from the SO index (sorted by subject) or from the OS index (sorted by object) of the property table,
+        so nothing is sorted. A constant subject or object selects its range of the CSR index, the filters of the variables are
+        applied afterwards
+
+        Parameters
+        ----------
+        pattern : tuple
+            Triple pattern (subject, property, object), at least one of subject and object is a variable
+        sorted_by : str
+            If it is the object variable, the rows are sorted by object, otherwise by subject
+
+        Returns
+        -------
+        Relation
+            Relation with one column for each distinct variable of the triple pattern
+        """
+        subject, property, object = pattern
+        if property not in self.property_tables:
+            raise ValueError(f"Property {property} was not loaded by the preprocessor")
+
+        property_table = self.property_tables[property]
+        if not subject.startswith('?') and not object.startswith('?'):
+            raise ValueError("Triple patterns without variables are not supported")
+        if not subject.startswith('?'):
+            # constants that do not occur in the data have no index and match nothing
+            subject_index = self.term_dictionary.get(subject)
+            objects = property_table.objects[:0] if subject_index is None else property_table.objects_of(subject_index)
+            relation = Relation((object,), [objects], object)
+        elif not object.startswith('?'):
+            object_index = self.term_dictionary.get(object)
+            subjects = property_table.os_subjects[:0] if object_index is None else property_table.subjects_of(object_index)
+            relation = Relation((subject,), [subjects], subject)
+        elif subject == object:
+            # the same variable is used twice, so only the triples with equal subject and object match
+            mask = property_table.subjects == property_table.objects
+            relation = Relation((subject,), [property_table.subjects[mask]], subject)
+        elif sorted_by == object:
+            relation = Relation((subject, object), [property_table.os_subjects, property_table.os_objects], object)
+        else:
+            relation = Relation((subject, object), [property_table.subjects, property_table.objects], subject)
+
+        for filter in self.filters:
+            if filter.variable in relation.variables:
+                relation = relation.filter(filter.mask(relation.column(filter.variable), self.term_dictionary))
+        return relation
+
+    def join_input(self, node, left):
+        """
+        Get the relation of a triple pattern for the join with the join result so far
+        A relation that was not reduced and is joined on its object is taken from the OS index of the property table, so the
+        sort merge join does not need to sort it (the hash join does not depend on the order)
+
+        Parameters
+        ----------
+        node : int
+            Index of the triple pattern
+        left : Relation
+            Join result so far
+
+        Returns
+        -------
+        Relation
+            Relation of the triple pattern
+        """
+        relation = self.relations[node]
+        shared_variables = [variable for variable in relation.variables if variable in left.variables]
+        if self.reduced or len(shared_variables) != 1 or relation.sorted_by == shared_variables[0]:
+            return relation
+        return self.load_relation(self.query[node], sorted_by=shared_variables[0])
+
+    def full_reduction(self):
+        """
+        Full Yannakakis semi-join reduction over the join tree
+        In the bottom-up pass every parent is reduced by its children, in the top-down pass every child is reduced by its parent
+        Afterwards no relation contains dangling tuples (tuples that are not part of any result)
+        """
+        # bottom-up pass: parent = parent ⋉ child
+        for node in self.join_tree.bottom_up_order:
+            parent = self.join_tree.parent[node]
+            if parent is not None:
+                self.relations[parent] = self.semi_join(parent, node)
+
+        # top-down pass: child = child ⋉ parent
+        for node in self.join_tree.top_down_order():
+            for child in self.join_tree.children[node]:
+                self.relations[child] = self.semi_join(child, node)
+
+    def semi_join(self, node, other):
+        """
+        Semi-join of the relation of a triple pattern with the relation of another triple pattern (one step of full_reduction)
+        The lineage of the relation is extended by the semi-join, the result is taken from the cache if it contains the lineage
+
+        Parameters
+        ----------
+        node : int
+            Index of the triple pattern whose relation is reduced
+        other : int
+            Index of the triple pattern whose relation reduces it
+
+        Returns
+        -------
+        Relation
+            Rows of the relation that have a join partner in the other relation
+        """
+        self.lineage[node] = ('semi_join', self.lineage[node], self.lineage[other])
+        if self.cache is not None:
+            relation = self.cache.get(self.lineage[node])
+            if relation is not None:
+                return relation
+
+        relation = self.relations[node]
+        with self.profiler.operator('semi_join', lambda: [len(relation), len(self.relations[other])], pattern=' '.join(self.query[node])) as operator:
+            relation = relation.semi_join(self.relations[other])
+            operator.output_rows = len(relation)
+        if self.cache is not None:
+            self.cache.put(self.lineage[node], relation, relation.nbytes())
+        return relation
+
+    def get_info(self):
+        """
+        Get information about the size of the relations of the triple patterns
+        Calling this method only returns valid results after the relations were loaded (in init)
+
+        Returns
+        -------
+        size : dict
+            Dictionary that contains the number of rows of the relation of each triple pattern
+        """
+        return {pattern: len(relation) for pattern, relation in zip(self.query, self.relations)}
+
+    def run(self):
+        print(f"Start running {self.algorithm_type}")
+        start_time = time.time()
+
+        if self.algorithm_type == "hash_join":
+            join_function = self.hash_join
+        elif self.algorithm_type == "sort_merge_join":
+            join_function = self.sort_merge_join
+        elif self.algorithm_type == "leapfrog_triejoin":
+            join_function = None
+        elif self.algorithm_type == "cost_based":
+            join_function = None
+        else:
+            raise ValueError("Algorithm type not supported")
+
+        with self.profiler.operator('join', algorithm=self.algorithm_type) as operator:
+            if self.algorithm_type == "leapfrog_triejoin":
+                # the leapfrog triejoin joins all relations at once
+                self.results = Relation(self.variables, self.leapfrog_triejoin())
+            else:
+                if join_function is None:
+                    # the plan of the cost-based optimizer determines the join order and the join method of every join
+                    result = self.execute_plan()
+                else:
+                    # join the relations along the join tree, every relation is joined after its parent
+                    order = self.join_tree.top_down_order()
+                    result = self.relations[order[0]]
+                    for node in order[1:]:
+                        result = self.profiled_join(join_function, result, node, self.join_input(node, result))
+
+                # bring the columns into the order of the query variables
+                self.results = Relation(self.variables, [result.column(variable) for variable in self.variables])
+            operator.output_rows = len(self.results)
+
+        end_time = time.time()
+        print("Finish running")
+        print("Time: ", end_time - start_time)
+        print("Number of results: ", len(self.results))
+        return end_time - start_time
+
+    def count(self, group_by=None):
+        """
+        Count the results of the query without materializing them (COUNT(*), optionally grouped by one variable)
+        The count is computed by dynamic programming over the join tree: every tuple gets the number of results of its subtree
+        (the product over the children of the summed weights of the matching child tuples), so the cost is linear in the size of
+        the relations (up to sorting) and independent of the number of results
+        For group_by, the tree is rooted at a triple pattern that contains the variable and the weights of the root are summed per value
+        Cyclic queries have no join tree, their results are computed with the leapfrog triejoin and counted
+        The counts are exact as long as they fit into 64 bit integers
+
+        Parameters
+        ----------
+        group_by : str
+            Variable whose values are the groups (None for a single count)
+
+        Returns
+        -------
+        int or tuple
+            Number of results, or the sorted distinct values of the variable and the number of results for each value
+        """
+        if self.join_tree is None:
+            columns = self.leapfrog_triejoin()
+            if group_by is None:
+                return len(columns[0])
+            return sum_by_key(columns[self.variables.index(group_by)], np.ones(len(columns[0]), dtype=np.int64))
+
+        # number of results of the components of the query that do not contain the group variable
+        total = 1
+        groups = None
+        for component_root in self.join_tree.roots:
+            bottom_up_order, parent = self.join_tree.rooted_at(component_root)
+            group_nodes = [node for node in bottom_up_order if group_by in self.relations[node].variables]
+            if group_nodes:
+                bottom_up_order, parent = self.join_tree.rooted_at(group_nodes[0])
+
+            # every tuple starts with the weight 1, the weights of the children are multiplied into the weights of their parent
+            weights = {node: np.ones(len(self.relations[node]), dtype=np.int64) for node in bottom_up_order}
+            for node in bottom_up_order:
+                if parent[node] is None:
+                    continue
+                child, parent_relation = self.relations[node], self.relations[parent[node]]
+                shared_variables = [variable for variable in child.variables if variable in parent_relation.variables]
+                keys, sums = sum_by_key(child.keys(shared_variables), weights[node])
+                parent_keys = parent_relation.keys(shared_variables)
+                if not len(keys):
+                    weights[parent[node]][:] = 0
+                    continue
+                index = np.minimum(np.searchsorted(keys, parent_keys), len(keys) - 1)
+                weights[parent[node]] *= np.where(keys[index] == parent_keys, sums[index], 0)
+
+            root = bottom_up_order[-1]
+            if group_nodes:
+                groups = sum_by_key(self.relations[root].column(group_by), weights[root])
+            else:
+                total *= int(weights[root].sum())
+
+        if group_by is None:
+            return total
+        if groups is None:
+            raise ValueError(f"Variable {group_by} does not occur in the query")
+        # values without results (dangling tuples if the relations were not reduced) are not part of the groups
+        values, counts = groups
+        counts = counts * total
+        return values[counts > 0], counts[counts > 0]
+
+    def execute_plan(self):
+        """
+        Join the relations in the order and with the join methods of the plan of the cost-based optimizer
+        The actual size of every join result is stored in the plan (see explain)
+
+        Returns
+        -------
+        Relation
+            Join result
+        """
+        result = self.relations[self.plan.first_node]
+        for step in self.plan.steps:
+            if step.method == "hash_join":
+                result = self.profiled_join(self.hash_join, result, step.node, self.relations[step.node], build_left=step.build_left)
+            else:
+                result = self.profiled_join(self.sort_merge_join, result, step.node, self.join_input(step.node, result))
+            step.actual_size = len(result)
+        return result
+
+    def profiled_join(self, join_function, left, node, right, **options):
+        """
+        Join the join result so far with the relation of a triple pattern and measure the join with the profiler
+
+        Parameters
+        ----------
+        join_function : method
+            hash_join or sort_merge_join
+        left : Relation
+            Join result so far
+        node : int
+            Index of the triple pattern
+        right : Relation
+            Relation of the triple pattern
+        options
+            Further arguments of the join function
+
+        Returns
+        -------
+        Relation
+            Join result
+        """
+        with self.profiler.operator(join_function.__name__, lambda: [len(left), len(right)], pattern=' '.join(self.query[node])) as operator:
+            result = join_function(left, right, **options)
+            operator.output_rows = len(result)
+        return result
+
+    def explain(self):
+        """
+        Describe the plan of the cost-based optimizer with the estimated cardinalities next to the actual cardinalities
+        The actual sizes of the join results are only known after run() was called
+
+        Returns
+        -------
+        str
+            Description of the plan
+        """
+        if self.plan is None:
+            raise ValueError("Only the cost_based algorithm has a plan")
+        return self.plan.explain(self.query, self.relations)
+
+    def hash_join(self, left, right, build_left=False):
+        """
+        Hash join of two relations on their shared variables
+        By default the right relation (the next relation of the join tree) is used as hash table and the left relation (the join
+        result so far) probes it
+
+        Parameters
+        ----------
+        left : Relation
+            Join result so far
+        right : Relation
+            Relation that should be joined
+        build_left : bool
+            If True, the left relation is used as hash table and the right relation probes it
+
+        Returns
+        -------
+        Relation
+            Result of the hash join
+        """
+        shared_variables = [variable for variable in right.variables if variable in left.variables]
+        if build_left:
+            left_indices, right_indices = hash_join_indices(left.keys(shared_variables), right.keys(shared_variables))
+        else:
+            right_indices, left_indices = hash_join_indices(right.keys(shared_variables), left.keys(shared_variables))
+        # the matches are in the order of the probe side
+        return self.combine(left, right, left_indices, right_indices, right.sorted_by if build_left else left.sorted_by)
+
+    def sort_merge_join(self, left, right):
+        """
+        Sort merge join of two relations on their shared variables
+        First sort both relations by the join key (unless they are already sorted by it) and then merge them
+
+        Parameters
+        ----------
+        left : Relation
+            Join result so far
+        right : Relation
+            Relation that should be joined
+
+        Returns
+        -------
+        Relation
+            Result of the sort merge join
+        """
+        shared_variables = [variable for variable in right.variables if variable in left.variables]
+        key_variable = shared_variables[0] if len(shared_variables) == 1 else None
+        left_indices, right_indices = sort_merge_join_indices(left.keys(shared_variables), right.keys(shared_variables),
+                                                              left_sorted=key_variable is not None and left.sorted_by == key_variable,
+                                                              right_sorted=key_variable is not None and right.sorted_by == key_variable)
+        # the matches are sorted by the join key
+        return self.combine(left, right, left_indices, right_indices, key_variable)
+
+    def leapfrog_triejoin(self):
+        """
+        Worst-case optimal join of all relations with the leapfrog triejoin (see leapfrog_triejoin.py)
+        Relations that were not reduced (and contain the whole property table) use the sorted arrays of the property tables as trie
+        indices, the other relations are sorted
+
+        Returns
+        -------
+        list
+            One integer array for each variable of the query (in the order of self.variables)
+        """
+        variable_order = choose_variable_order(self.query)
+        tries = []
+        for (subject, property, object), relation in zip(self.query, self.relations):
+            if self.reduced or len(relation) != len(self.property_tables[property]) or len(relation.variables) != 2:
+                tries.append(TrieIndex.from_columns(relation.variables, relation.columns, variable_order))
+            else:
+                tries.append(TrieIndex.from_property_table(self.property_tables[property], subject, object, variable_order))
+        return leapfrog_triejoin(tries, variable_order, self.variables)
+
+    def combine(self, left, right, left_indices, right_indices, sorted_by=None):
+        """
+        Build the join result from the indices of the matching rows of both relations
+
+        Parameters
+        ----------
+        left : Relation
+            Left relation of the join
+        right : Relation
+            Right relation of the join
+        left_indices : np.ndarray
+            Index of the left row of every result row
+        right_indices : np.ndarray
+            Index of the right row of every result row
+        sorted_by : str
+            Variable the result rows are sorted by (None if the order is unknown)
+
+        Returns
+        -------
+        Relation
+            Join result with the variables of the left relation followed by the new variables of the right relation
+        """
+        new_variables = [variable for variable in right.variables if variable not in left.variables]
+        columns = [column[left_indices] for column in left.columns]
+        columns += [right.column(variable)[right_indices] for variable in new_variables]
+        return Relation(left.variables + tuple(new_variables), columns, sorted_by)
+
+    def collect_results(self, variables=None, limit=None):
+        """
+        Write the results of the query to the output file (in the output format of the query engine, by default one line per
+        result with the terms separated by spaces)
+        Calling this method only returns valid results after run() was called
+
+        Parameters
+        ----------
+        variables : list
+            Variables that are written (projection), the other columns are not decoded (all variables if None)
+        limit : int
+            Maximum number of results that are written (all results if None)
+        """
+        variables = self.results.variables if variables is None else variables
+        rows = len(self.results) if limit is None else min(limit, len(self.results))
+        # decode every column of a batch at once (from the buffer of the term dictionary) and write the batch as one block
+        with self.profiler.operator('collect_results', lambda: [len(self.results)], path=self.output_path, variables=' '.join(variables),
+                                    format=self.output_format) as operator:
+            with ResultWriter(self.output_path, variables, self.term_dictionary, self.output_format) as writer:
+                for start in range(0, rows, RESULT_BATCH_SIZE):
+                    end = min(start + RESULT_BATCH_SIZE, rows)
+                    writer.write([self.results.column(variable)[start:end] for variable in variables])
+            operator.output_rows = rows
+
+if __name__ == '__main__':
+    data_path = 'data/test.txt'
+    properties = ['follows', 'friendOf', 'likes', 'hasReview']
+    data_preprocessor = DataPreprocessor(data_path, properties)
+
+    # star-shaped query: users that follow somebody, are friends with somebody and like a product
+    star_query = [('?user', 'follows', '?followed'), ('?user', 'friendOf', '?friend'), ('?user', 'likes', '?product')]
+
+    for query in [ASSIGNMENT_QUERY, star_query]:
+        for algorithm_type in ['hash_join', 'sort_merge_join', 'leapfrog_triejoin']:
+            query_engine = QueryEngine(algorithm_type, data_preprocessor, query)
+            print(query_engine.get_info())
+            query_engine.run()
+
+        # the cost-based optimizer chooses the join order, the join methods and if the Yannakakis reduction is done
+        query_engine = QueryEngine('cost_based', data_preprocessor, query, use_yannakakis=None)
+        query_engine.run()
+        print(query_engine.explain())
+
+    # count the results of the assignment query (in total and per user that follows somebody) without materializing them
+    query_engine = QueryEngine('hash_join', data_preprocessor, ASSIGNMENT_QUERY)
+    print("COUNT(*):", query_engine.count())
+    users, counts = query_engine.count(group_by='?user1')
+    print("COUNT(*) per ?user1:", dict(zip(query_engine.term_dictionary.decode(users), counts.tolist())))
+
+    # cyclic query (only supported by the leapfrog triejoin): users that are friends of each other
+    mutual_friends_query = [('?user1', 'friendOf', '?user2'), ('?user2', 'friendOf', '?user1')]
+    query_engine = QueryEngine('leapfrog_triejoin', data_preprocessor, mutual_friends_query)
+    query_engine.run()
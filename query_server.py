@@ -0,0 +1,361 @@
+import argparse
+from collections import OrderedDict
+import contextlib
+import json
+import os
+import socketserver
+import sys
+import time
+
+from data_preprocessor import DataPreprocessor
+from query_engine import ALGORITHM_TYPES, QueryEngine, Relation
+
+# memory bound of the cache of the reduced relations and of the results
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+# memory that is assumed for a cached count
+COUNT_BYTES = 64
+
+
+class LRUCache():
+    """
+    Cache with a memory bound: if the cached values use more than max_bytes, the least recently used values are evicted
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        """
+        Parameters
+        ----------
+        max_bytes : int
+            Memory bound of the cached values in bytes
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        """
+        Get a cached value and mark it as most recently used
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the value
+
+        Returns
+        -------
+        object
+            Cached value (None if the key is not cached)
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, size):
+        """
+        Cache a value, values larger than the memory bound are not cached
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the value
+        value : object
+            Value that should be cached
+        size : int
+            Memory used by the value in bytes
+        """
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (value, size)
+        self.nbytes += size
+        # evict the least recently used values until the cache fits into its memory bound
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.nbytes -= evicted_size
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def statistics(self):
+        """
+        Number of entries, used memory, hits and misses of the cache
+        """
+        return {'entries': len(self.entries), 'bytes': self.nbytes, 'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+def normalize_query(query):
+    """
+    Normalize a query for the cache keys: the terms of the triple patterns are stripped and duplicate triple patterns are removed
+    The order of the triple patterns does not change the results (up to the order of the rows), so the patterns are sorted
+
+    Parameters
+    ----------
+    query : list
+        List of triple patterns (subject, property, object)
+
+    Returns
+    -------
+    tuple
+        Sorted distinct triple patterns
+    """
+    return tuple(sorted(set(tuple(term.strip() for term in pattern) for pattern in query)))
+
+
+def validate_request(request):
+    """
+    Check the shape of a request before it is normalized or looked up in the cache
+
+    Parameters
+    ----------
+    request : object
+        Decoded JSON request
+
+    Raises
+    ------
+    ValueError
+        If the request is not a valid request of the protocol (see QueryServer)
+    """
+    if not isinstance(request, dict):
+        raise ValueError(f"Invalid request: expected a JSON object, got {type(request).__name__}")
+    if request.get('command', 'query') != 'query':
+        return
+    query = request.get('query')
+    if not isinstance(query, list) or not query:
+        raise ValueError("Invalid request: 'query' must be a non-empty list of triple patterns")
+    for pattern in query:
+        if not isinstance(pattern, list) or len(pattern) != 3 or not all(isinstance(term, str) and term.strip() for term in pattern):
+            raise ValueError(f"Invalid triple pattern {json.dumps(pattern)}: expected a list of three non-empty strings")
+    limit = request.get('limit')
+    if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 0):
+        raise ValueError(f"Invalid limit {json.dumps(limit)}: the limit must be a non-negative integer")
+    algorithm_type = request.get('algorithm', 'hash_join')
+    if algorithm_type not in ALGORITHM_TYPES:
+        raise ValueError(f"Unknown algorithm {json.dumps(algorithm_type)}, supported: {', '.join(ALGORITHM_TYPES)}")
+    group_by = request.get('group_by')
+    if group_by is not None and not isinstance(group_by, str):
+        raise ValueError(f"Invalid group_by {json.dumps(group_by)}: expected a variable")
+    for flag in ('count', 'yannakakis'):
+        if request.get(flag) is not None and not isinstance(request[flag], bool):
+            raise ValueError(f"Invalid {flag} {json.dumps(request[flag])}: expected true or false")
+
+
+class QueryServer():
+    """
+    Resident query service: the dataset is loaded once and the queries are answered by query engines over the loaded property
+    tables. The results (and counts) are cached for the normalized query, the semi-join results of the Yannakakis reduction are
+    cached for their lineage (see QueryEngine.semi_join), so repeated queries and queries with common subtrees skip the work
+    Both caches share one LRU cache with a memory bound
+
+    Requests and responses are JSON objects (one per line):
+        {"query": [["?user", "follows", "?friend"], ["?friend", "likes", "?product"]], "algorithm": "hash_join", "limit": 10}
+        {"query": [...], "count": true, "group_by": "?user"}
+        {"command": "statistics"} or {"command": "clear"}
+    """
+
+    def __init__(self, preprocessor : DataPreprocessor, cache_bytes=DEFAULT_CACHE_BYTES):
+        """
+        Parameters
+        ----------
+        preprocessor : DataPreprocessor
+            Preprocessor that contains the property tables
+        cache_bytes : int
+            Memory bound of the cache in bytes
+        """
+        self.preprocessor = preprocessor
+        self.term_dictionary = preprocessor.term_dictionary
+        self.cache = LRUCache(cache_bytes)
+
+    def query_engine(self, query, algorithm_type, use_yannakakis):
+        """
+        Query engine for a query, the semi-joins of the Yannakakis reduction use the cache
+        """
+        # the engine prints its progress, the protocol uses stdout for the responses
+        with contextlib.redirect_stdout(sys.stderr):
+            return QueryEngine(algorithm_type, self.preprocessor, query, use_yannakakis=use_yannakakis, cache=self.cache)
+
+    def results(self, query, algorithm_type='hash_join', use_yannakakis=True):
+        """
+        Results of a query (from the cache if the normalized query was answered before)
+
+        Parameters
+        ----------
+        query : list
+            List of triple patterns
+        algorithm_type : str
+            Join algorithm of the query engine (all algorithms have the same results, so it is not part of the cache key)
+        use_yannakakis : bool
+            If True, the relations are reduced before the joins
+
+        Returns
+        -------
+        Relation
+            Results with one column for each variable of the query (in the order of their first occurrence)
+        """
+        key = ('results', normalize_query(query))
+        results = self.cache.get(key)
+        if results is None:
+            query_engine = self.query_engine(query, algorithm_type, use_yannakakis)
+            with contextlib.redirect_stdout(sys.stderr):
+                query_engine.run()
+            results = query_engine.results
+            self.cache.put(key, results, results.nbytes())
+
+        # the cached results may come from a query with another order of the triple patterns
+        variables = []
+        for subject, _, object in query:
+            for term in (subject.strip(), object.strip()):
+                if term.startswith('?') and term not in variables:
+                    variables.append(term)
+        return Relation(variables, [results.column(variable) for variable in variables])
+
+    def count(self, query, group_by=None):
+        """
+        Number of results of a query without materializing them (see QueryEngine.count), from the cache if possible
+
+        Returns
+        -------
+        int or tuple
+            Number of results, or the values of the group variable and the number of results for each value
+        """
+        key = ('count', normalize_query(query), group_by)
+        count = self.cache.get(key)
+        if count is None:
+            count = self.query_engine(query, 'hash_join', True).count(group_by)
+            size = COUNT_BYTES if group_by is None else sum(array.nbytes for array in count)
+            self.cache.put(key, count, size)
+        return count
+
+    def execute(self, request):
+        """
+        Answer a request
+
+        Parameters
+        ----------
+        request : dict
+            Request of the protocol (see QueryServer)
+
+        Returns
+        -------
+        dict
+            Response, the results are decoded to their local names, errors are returned as {"error": message}
+        """
+        start_time = time.perf_counter()
+        hits = self.cache.hits
+        try:
+            validate_request(request)
+            command = request.get('command', 'query')
+            if command == 'statistics':
+                response = {'cache': self.cache.statistics()}
+            elif command == 'clear':
+                self.cache.clear()
+                response = {'cache': self.cache.statistics()}
+            elif command != 'query':
+                raise ValueError(f"Unknown command {command}")
+            elif request.get('count', False):
+                count = self.count(request['query'], request.get('group_by'))
+                if request.get('group_by') is None:
+                    response = {'count': count}
+                else:
+                    values, counts = count
+                    response = {'counts': dict(zip(self.term_dictionary.decode(values).tolist(), counts.tolist()))}
+            else:
+                results = self.results(request['query'], request.get('algorithm', 'hash_join'), request.get('yannakakis', True))
+                limit = request.get('limit')
+                rows = len(results) if limit is None else min(limit, len(results))
+                columns = [self.term_dictionary.decode(column[:rows]) for column in results.columns]
+                response = {
+                    'variables': list(results.variables),
+                    'number_of_results': len(results),
+                    'rows': [list(row) for row in zip(*(column.tolist() for column in columns))],
+                }
+        except (KeyError, ValueError, TypeError) as error:
+            response = {'error': str(error)}
+        except Exception as error:
+            # a request must never stop the server, the other clients are still served
+            response = {'error': f"{type(error).__name__}: {error}"}
+
+        # number of cached results and semi-join results the request used
+        response['cache_hits'] = self.cache.hits - hits
+        response['time'] = time.perf_counter() - start_time
+        return response
+
+    def serve_lines(self, input_file, output_file):
+        """
+        Answer the requests of an input stream (one JSON request per line) until the stream ends
+        """
+        for line in input_file:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as error:
+                response = {'error': f"Invalid request: {error}"}
+            else:
+                response = self.execute(request)
+            output_file.write(json.dumps(response) + '\n')
+            output_file.flush()
+
+    def serve_socket(self, socket_path):
+        """
+        Answer the requests of the clients of a Unix domain socket (one client after another, the caches are not thread-safe)
+        """
+        server = self
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                server.serve_lines((line.decode('utf-8') for line in self.rfile), LineWriter(self.wfile))
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        with socketserver.UnixStreamServer(socket_path, RequestHandler) as socket_server:
+            print(f"Serving on {socket_path}", file=sys.stderr)
+            try:
+                socket_server.serve_forever()
+            finally:
+                os.unlink(socket_path)
+
+
+class LineWriter():
+    """
+    Text interface (write and flush) of the binary stream of a socket
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        self.stream.write(text.encode('utf-8'))
+
+    def flush(self):
+        self.stream.flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Query server that answers JSON requests from stdin or a Unix domain socket")
+    parser.add_argument('data_path')
+    parser.add_argument('--properties', nargs='*', default=['follows', 'friendOf', 'likes', 'hasReview'])
+    parser.add_argument('--socket', help="path of the Unix domain socket (the requests are read from stdin if not given)")
+    parser.add_argument('--cache-bytes', type=int, default=DEFAULT_CACHE_BYTES)
+    arguments = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        data_preprocessor = DataPreprocessor(arguments.data_path, arguments.properties, cache_path=f"{arguments.data_path}.cache")
+    query_server = QueryServer(data_preprocessor, arguments.cache_bytes)
+    if arguments.socket is None:
+        query_server.serve_lines(sys.stdin, sys.stdout)
+    else:
+        query_server.serve_socket(arguments.socket)
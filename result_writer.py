@@ -0,0 +1,343 @@
+import json
+
+import numpy as np
+
+from data_structures import expand_ranges, gather_ranges
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    # pyarrow is optional, it is only needed for the parquet format
+    pyarrow = None
+
+# 'text': local names separated by spaces (the format of the assignment), 'tsv': complete terms separated by tabs with a header,
+# 'binary': int32 rows of term indices and a separate dictionary of the used terms, 'columnar': Arrow-style record batches of
+# the complete terms, 'parquet': Parquet file of the complete terms (needs pyarrow)
+OUTPUT_FORMATS = ('text', 'tsv', 'binary', 'columnar', 'parquet')
+# size of the write buffer of the output file
+DEFAULT_BUFFER_SIZE = 16 * 1024 * 1024
+# largest batch of padded terms (see format_rows), larger batches are assembled from the byte ranges of the terms
+MAX_PADDED_BYTES = 64 * 1024 * 1024
+# every binary and columnar result file starts with the magic bytes and the length of its JSON header
+BINARY_MAGIC = b'ADBISRB1'
+COLUMNAR_MAGIC = b'ADBISRC1'
+DICTIONARY_MAGIC = b'ADBISRD1'
+
+
+def fixed_width(data, offsets):
+    """
+    Pad encoded terms with zero bytes to the length of the longest term
+
+    Parameters
+    ----------
+    data : np.ndarray
+        uint8 array with the encoded terms one after another
+    offsets : np.ndarray
+        Term i is stored at data[offsets[i]:offsets[i + 1]]
+
+    Returns
+    -------
+    np.ndarray
+        uint8 array with one row per term
+    """
+    lengths = np.diff(offsets)
+    padded = np.zeros((len(lengths), int(lengths.max(initial=0))), dtype=np.uint8)
+    rows, positions = expand_ranges(offsets[:-1], lengths)
+    padded[rows, positions - np.repeat(offsets[:-1], lengths)] = data[positions]
+    return padded
+
+
+def decode_distinct(column, term_dictionary, with_namespace=False):
+    """
+    Decode the distinct terms of a column of term indices
+
+    Returns
+    -------
+    data : np.ndarray
+        uint8 array with the distinct encoded terms one after another
+    offsets : np.ndarray
+        Distinct term i is stored at data[offsets[i]:offsets[i + 1]]
+    inverse : np.ndarray
+        Distinct term of every row
+    """
+    distinct_indices, inverse = np.unique(np.asarray(column), return_inverse=True)
+    return (*term_dictionary.decode_bytes(distinct_indices, with_namespace), inverse.reshape(-1))
+
+
+def decode_column(column, term_dictionary, with_namespace=False):
+    """
+    Decode a column of term indices to the encoded terms one after another and their offsets (the layout of an Arrow string
+    column), see format_rows for the two ways the rows are assembled
+    """
+    data, offsets, inverse = decode_distinct(column, term_dictionary, with_namespace)
+    lengths = np.diff(offsets)
+    if len(inverse) * int(lengths.max(initial=0)) > MAX_PADDED_BYTES:
+        return gather_ranges(data, offsets[:-1][inverse], lengths[inverse])
+    padded = fixed_width(data, offsets)[inverse]
+    used = padded != 0
+    row_offsets = np.zeros(len(padded) + 1, dtype=np.int64)
+    np.cumsum(used.sum(axis=1), out=row_offsets[1:])
+    return padded[used], row_offsets
+
+
+def format_rows(columns, term_dictionary, separator, with_namespace=False, line_end=b'\n'):
+    """
+    Decode rows of term indices and format them as lines (all rows at once), every distinct term of a column is decoded once
+    If the lines are short, the terms are padded to the longest term of their column with zero bytes (which never occur in
+    UTF-8 encoded terms), the padded terms and the separators are put next to each other and the padding is removed. If the
+    padded rows would need more than MAX_PADDED_BYTES (e.g. because of a long literal), every line is copied from the byte
+    ranges of its terms and separators instead, which needs memory proportional to the length of the lines
+
+    Parameters
+    ----------
+    columns : list
+        One array of term indices for every column
+    term_dictionary : TermDictionary
+        Term dictionary that decodes the term indices
+    separator : bytes
+        Separator of the terms of a row
+    with_namespace : bool
+        If True, the complete terms are written, otherwise only the local names
+    line_end : bytes
+        End of every line
+
+    Returns
+    -------
+    bytes
+        Lines of all rows
+    """
+    decoded = [decode_distinct(column, term_dictionary, with_namespace) for column in columns]
+    ends = [separator] * (len(columns) - 1) + [line_end]
+    width = sum(int(np.diff(offsets).max(initial=0)) for _, offsets, _ in decoded) + sum(len(end) for end in ends)
+    number_of_rows = len(columns[0])
+
+    if number_of_rows * width <= MAX_PADDED_BYTES:
+        parts = []
+        for (data, offsets, inverse), end in zip(decoded, ends):
+            parts.append(fixed_width(data, offsets)[inverse])
+            parts.append(np.broadcast_to(np.frombuffer(end, dtype=np.uint8), (number_of_rows, len(end))))
+        lines = np.concatenate(parts, axis=1)
+        return lines[lines != 0].tobytes()
+
+    # the separator and the line end are stored at the start of the source, the distinct terms of the columns after them
+    sources = [np.frombuffer(separator + line_end, dtype=np.uint8)]
+    position = len(separator) + len(line_end)
+    starts, lengths = [], []
+    for (data, offsets, inverse), end in zip(decoded, ends):
+        sources.append(data)
+        starts.append(offsets[:-1][inverse] + position)
+        lengths.append(np.diff(offsets)[inverse])
+        position += len(data)
+        starts.append(np.full(number_of_rows, 0 if end is separator else len(separator), dtype=np.int64))
+        lengths.append(np.full(number_of_rows, len(end), dtype=np.int64))
+    data, _ = gather_ranges(np.concatenate(sources), np.stack(starts, axis=1).reshape(-1), np.stack(lengths, axis=1).reshape(-1))
+    return data.tobytes()
+
+
+def write_header(output_file, magic, header):
+    """
+    Write the magic bytes and a length-prefixed JSON header
+    """
+    header_bytes = json.dumps(header).encode('utf-8')
+    output_file.write(magic)
+    output_file.write(len(header_bytes).to_bytes(8, 'little'))
+    output_file.write(header_bytes)
+
+
+def read_header(input_file, magic):
+    """
+    Read the magic bytes and the length-prefixed JSON header (see write_header)
+    """
+    if input_file.read(len(magic)) != magic:
+        raise ValueError(f"{input_file.name} is not a result file of this format")
+    header_length = int.from_bytes(input_file.read(8), 'little')
+    return json.loads(input_file.read(header_length).decode('utf-8'))
+
+
+class ResultWriter():
+    """
+    Batched sink of query results: the results are written in batches of term indices (one array per variable), the columns of
+    a batch are decoded at once by the term dictionary (see TermDictionary.decode_bytes) and every batch is formatted and written
+    as one block, so nothing is done per result row in Python
+
+        with ResultWriter('output/results.tsv', ['?user', '?product'], term_dictionary, 'tsv') as writer:
+            writer.write([users, products])
+    """
+
+    def __init__(self, path, variables, term_dictionary, output_format='text', buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+        Parameters
+        ----------
+        path : str
+            Path to the output file (the binary format writes its dictionary to path + '.terms')
+        variables : list
+            Variables of the results (one column each)
+        term_dictionary : TermDictionary
+            Term dictionary that decodes the term indices
+        output_format : str
+            One of OUTPUT_FORMATS
+        buffer_size : int
+            Size of the write buffer in bytes
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Output format {output_format} not supported")
+        if output_format == 'parquet' and pyarrow is None:
+            raise ValueError("The parquet format needs the pyarrow package (pip install pyarrow)")
+        self.path = path
+        self.variables = list(variables)
+        self.term_dictionary = term_dictionary
+        self.output_format = output_format
+        # number of written results
+        self.rows = 0
+
+        self.output_file = None
+        self.parquet_writer = None
+        if output_format == 'parquet':
+            schema = pyarrow.schema([(variable, pyarrow.large_string()) for variable in self.variables])
+            self.parquet_writer = pyarrow.parquet.ParquetWriter(path, schema)
+            return
+
+        self.output_file = open(path, 'wb', buffering=buffer_size)
+        if output_format == 'tsv':
+            self.output_file.write(('\t'.join(self.variables) + '\n').encode('utf-8'))
+        elif output_format == 'binary':
+            write_header(self.output_file, BINARY_MAGIC, {'variables': self.variables, 'dtype': '<i4'})
+            # the terms that occur in the results are written to the dictionary when the writer is closed
+            self.used_terms = np.zeros(len(term_dictionary) + 1, dtype=bool)
+        elif output_format == 'columnar':
+            write_header(self.output_file, COLUMNAR_MAGIC, {'variables': self.variables})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+        return False
+
+    def write(self, columns):
+        """
+        Write a batch of results
+
+        Parameters
+        ----------
+        columns : list
+            One array of term indices for every variable (all arrays have the same length)
+        """
+        number_of_rows = len(columns[0])
+        if not number_of_rows:
+            return
+        self.rows += number_of_rows
+
+        if self.output_format == 'text':
+            self.output_file.write(format_rows(columns, self.term_dictionary, b' '))
+        elif self.output_format == 'tsv':
+            self.output_file.write(format_rows(columns, self.term_dictionary, b'\t', with_namespace=True))
+        elif self.output_format == 'binary':
+            rows = np.stack([np.asarray(column, dtype='<i4') for column in columns], axis=1)
+            self.output_file.write(rows.tobytes())
+            self.used_terms[rows.reshape(-1)] = True
+        elif self.output_format == 'columnar':
+            # a record batch: its header and the offsets and the data of every column (like the string columns of Arrow)
+            decoded = [decode_column(column, self.term_dictionary, with_namespace=True) for column in columns]
+            write_header(self.output_file, b'', {'rows': number_of_rows, 'data_bytes': [len(data) for data, _ in decoded]})
+            for data, offsets in decoded:
+                self.output_file.write(offsets.astype('<i8').tobytes())
+                self.output_file.write(data.tobytes())
+        else:
+            arrays = []
+            for column in columns:
+                data, offsets = decode_column(column, self.term_dictionary, with_namespace=True)
+                arrays.append(pyarrow.Array.from_buffers(pyarrow.large_string(), number_of_rows,
+                                                         [None, pyarrow.py_buffer(offsets), pyarrow.py_buffer(data)]))
+            self.parquet_writer.write_table(pyarrow.Table.from_arrays(arrays, names=self.variables))
+
+    def close(self):
+        """
+        Flush and close the output file (the binary format writes its dictionary now)
+        """
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+            self.parquet_writer = None
+        if self.output_file is None:
+            return
+        if self.output_format == 'binary':
+            self.write_dictionary()
+        self.output_file.close()
+        self.output_file = None
+
+    def write_dictionary(self):
+        """
+        Write the terms that occur in the binary results (their indices, the offsets of the terms and the encoded terms)
+        """
+        indices = np.nonzero(self.used_terms)[0].astype('<i4')
+        data, offsets = self.term_dictionary.decode_bytes(indices, with_namespace=True)
+        with open(f'{self.path}.terms', 'wb') as dictionary_file:
+            write_header(dictionary_file, DICTIONARY_MAGIC, {'terms': len(indices)})
+            dictionary_file.write(indices.tobytes())
+            dictionary_file.write(offsets.astype('<i8').tobytes())
+            dictionary_file.write(data.tobytes())
+
+
+def decode_strings(data, offsets):
+    """
+    Decode a column of encoded terms to a list of strings
+    """
+    data = data.tobytes()
+    return [data[start:end].decode('utf-8') for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def read_binary_results(path):
+    """
+    Read the results of the binary format
+
+    Parameters
+    ----------
+    path : str
+        Path to the result file (the dictionary is read from path + '.terms')
+
+    Returns
+    -------
+    variables : list
+        Variables of the results
+    rows : np.ndarray
+        int32 array with one row per result and one column per variable (memory-mapped)
+    terms : dict
+        Dictionary with the term indices as keys and the terms as values
+    """
+    with open(path, 'rb') as result_file:
+        header = read_header(result_file, BINARY_MAGIC)
+        data_start = result_file.tell()
+    rows = np.memmap(path, dtype=header['dtype'], mode='r', offset=data_start).reshape(-1, len(header['variables']))
+
+    with open(f'{path}.terms', 'rb') as dictionary_file:
+        number_of_terms = read_header(dictionary_file, DICTIONARY_MAGIC)['terms']
+        indices = np.frombuffer(dictionary_file.read(4 * number_of_terms), dtype='<i4')
+        offsets = np.frombuffer(dictionary_file.read(8 * (number_of_terms + 1)), dtype='<i8')
+        data = np.frombuffer(dictionary_file.read(), dtype=np.uint8)
+    return header['variables'], rows, dict(zip(indices.tolist(), decode_strings(data, offsets)))
+
+
+def read_columnar_results(path):
+    """
+    Read the record batches of the columnar format one after another
+
+    Parameters
+    ----------
+    path : str
+        Path to the result file
+
+    Returns
+    -------
+    generator
+        Dictionary with the variables as keys and the lists of the terms of the record batch as values
+    """
+    with open(path, 'rb') as result_file:
+        variables = read_header(result_file, COLUMNAR_MAGIC)['variables']
+        while result_file.peek(1):
+            header = read_header(result_file, b'')
+            batch = {}
+            for variable, data_bytes in zip(variables, header['data_bytes']):
+                offsets = np.frombuffer(result_file.read(8 * (header['rows'] + 1)), dtype='<i8')
+                batch[variable] = decode_strings(np.frombuffer(result_file.read(data_bytes), dtype=np.uint8), offsets)
+            yield batch
@@ -1,8 +1,18 @@
+import argparse
+import os
+
 from data_preprocessor import DataPreprocessor
 from join_algorithms import JoinAlgorithm
+from profiler import DISABLED_PROFILER, Profiler
 from collections import defaultdict
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the join algorithms on the query of the assignment")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of worker processes of the ingestion and of the partition-parallel joins")
+    parser.add_argument('--explain-analyze', action='store_true',
+                        help="measure every operator (the memory tracing slows down the runs) and print EXPLAIN ANALYZE")
+    arguments = parser.parse_args()
 
     # data_path = 'data/test.txt'
     data_path = 'data/100k.txt'
@@ -11,18 +21,32 @@ if __name__ == '__main__':
     # define relevant properties of the data triples
     properties = ['follows', 'friendOf', 'likes', 'hasReview']
 
-    # preprocess the data
-    data_preprocessor = DataPreprocessor(data_path, properties)
+    # measure the cardinalities, the time and the memory of every operator only if EXPLAIN ANALYZE is requested, tracing the
+    # memory slows down the allocations and would be included in the printed runtimes
+    profiler = Profiler() if arguments.explain_analyze else DISABLED_PROFILER
+
+    # preprocess the data (the encoded dataset is cached next to the data file, so only the first run parses the data file)
+    # with more than one worker, the data file is parsed by several worker processes
+    data_preprocessor = DataPreprocessor(data_path, properties, cache_path=f"{data_path}.cache", workers=arguments.workers,
+                                         profiler=profiler)
 
     # create a dictionary to store the information about the join algorithms (size and runtime)
     join_information = defaultdict()
 
     # run the join algorithms
-    for algorithm_type in ['hash_join', 'sort_merge_join']:
+    for algorithm_type in ['hash_join', 'sort_merge_join', 'leapfrog_triejoin']:
         for use_yannakakis in [True, False]:
             output_path = f"output/{algorithm_type}_{'yannakakis' if use_yannakakis else 'no_yannakakis'}.txt"
             print(f"Running {algorithm_type} with Yannakakis: {use_yannakakis}")
-            join_algorithm = JoinAlgorithm(algorithm_type, data_preprocessor, output_path, use_yannakakis)
-            size_info = join_algorithm.get_info()
-            runtime = join_algorithm.run()
+            # with more than one worker, the joins are executed partition-parallel
+            with JoinAlgorithm(algorithm_type, data_preprocessor, output_path, use_yannakakis, workers=arguments.workers,
+                               profiler=profiler) as join_algorithm:
+                size_info = join_algorithm.get_info()
+                runtime = join_algorithm.run()
             join_information[f"{algorithm_type}_{'yannakakis' if use_yannakakis else 'no_yannakakis'}"] = (size_info, runtime)
+
+    # EXPLAIN ANALYZE of the ingestion and of all runs, the same measurements are written as JSON trace
+    if arguments.explain_analyze:
+        print(profiler.explain_analyze())
+        os.makedirs('output', exist_ok=True)
+        profiler.to_json('output/trace.json')
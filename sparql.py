@@ -0,0 +1,654 @@
+import argparse
+import json
+import re
+
+import numpy as np
+
+from data_preprocessor import DataPreprocessor
+from profiler import DISABLED_PROFILER
+from query_engine import QueryEngine, Relation
+from result_writer import OUTPUT_FORMATS
+from term_dictionary import split_term
+
+# tokens of the supported SPARQL subset, IRIs are matched before the comparison operators: an IRI contains only the characters
+# of IRIREF in the SPARQL grammar (no spaces and none of <>"{}|^`\) and a < that is followed by a variable, a number or an
+# operator is a comparison (e.g. FILTER(?x<5&&?y>3))
+IRI_PATTERN = r'<(?![?$\d=!&|+\-.(])[^\x00-\x20<>"{}|^`\\]*>'
+TOKEN_PATTERN = re.compile(rf'''
+    (?P<iri>{IRI_PATTERN})
+  | (?P<literal>"(?:[^"\\]|\\.)*"(?:@[A-Za-z-]+|\^\^(?:{IRI_PATTERN}|[A-Za-z_][\w-]*:(?:[\w-]|\.(?=[\w-]))*))?)
+  | (?P<variable>[?$]\w+)
+  | (?P<number>[+-]?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<prefixed_name>[A-Za-z_][\w-]*:(?:[\w-]|\.(?=[\w-]))*|:(?:[\w-]|\.(?=[\w-]))*)
+  | (?P<keyword>[A-Za-z]+)
+  | (?P<operator><=|>=|!=|&&|=|<|>)
+  | (?P<punctuation>[{{}}().,;*])
+''', re.VERBOSE)
+COMPARISON_OPERATORS = ('=', '!=', '<', '<=', '>', '>=')
+# datatypes whose literals are compared as numbers
+NUMERIC_DATATYPES = ('integer', 'decimal', 'double', 'float', 'int', 'long', 'short', 'nonNegativeInteger', 'positiveInteger')
+
+
+def tokenize(text):
+    """
+    Split the text of a query into (kind, value) tokens, comments (# until the end of the line) are skipped
+
+    Raises
+    ------
+    ValueError
+        If the text contains characters that are not part of the supported subset
+    """
+    tokens = []
+    position = 0
+    while position < len(text):
+        if text[position].isspace():
+            position += 1
+            continue
+        if text[position] == '#':
+            end = text.find('\n', position)
+            position = len(text) if end == -1 else end
+            continue
+        match = TOKEN_PATTERN.match(text, position)
+        if match is None:
+            raise ValueError(f"Unexpected character {text[position]!r} at position {position}")
+        tokens.append((match.lastgroup, match.group()))
+        position = match.end()
+    return tokens
+
+
+def is_variable(term):
+    return term.startswith('?')
+
+
+def literal_value(term):
+    """
+    Value of a term for the comparisons of a filter: literals are compared by their lexical form (as number if they have a
+    numeric datatype or look like a number), IRIs and prefixed names by the term itself
+
+    Returns
+    -------
+    tuple
+        (0, number), (1, string) for literals and (2, term) for IRIs, values of different kinds are never equal or ordered
+    """
+    if term[0] == '"':
+        end = term.rindex('"')
+        lexical_form, datatype = term[1:end], term[end + 1:]
+        if datatype.startswith('^^') and not datatype.rstrip('>').endswith(NUMERIC_DATATYPES):
+            return 1, lexical_form
+        try:
+            return 0, float(lexical_form)
+        except ValueError:
+            return 1, lexical_form
+    try:
+        return 0, float(term)
+    except ValueError:
+        return 2, term
+
+
+def term_alternatives(term, prefixes):
+    """
+    Ways a constant may be written in the data: as written in the query, as IRI (expanded prefixed name) and as prefixed name
+
+    Parameters
+    ----------
+    term : str
+        Constant of the query
+    prefixes : dict
+        Namespaces of the prefixes of the query
+
+    Returns
+    -------
+    set
+        Terms that are equal to the constant
+    """
+    alternatives = {term}
+    for prefix, namespace in prefixes.items():
+        if term.startswith(prefix) and term[0] not in '<"':
+            alternatives.add(namespace + term[len(prefix):] + '>')
+        elif term.startswith(namespace) and term.endswith('>'):
+            alternatives.add(prefix + term[len(namespace):-1])
+    return alternatives
+
+
+class Filter():
+    """
+    Comparison of a variable with a constant (FILTER(?variable operator constant)), the building block of the pushed down filters
+    """
+
+    def __init__(self, variable, operator, value, alternatives=()):
+        """
+        Parameters
+        ----------
+        variable : str
+            Variable of the filter
+        operator : str
+            One of =, !=, <, <=, > and >=
+        value : str
+            Constant (literal, number, IRI or prefixed name)
+        alternatives : tuple
+            Other ways the constant may be written in the data (e.g. the IRI of a prefixed name)
+        """
+        self.variable = variable
+        self.operator = operator
+        self.value = value
+        self.kind, self.comparison_value = literal_value(value)
+        self.alternatives = set(alternatives) | {value}
+
+    def key(self):
+        return (self.variable, self.operator, self.value)
+
+    def matches(self, term):
+        """
+        Check if a term (as written in the data) matches the filter, terms that cannot be compared with the constant do not match
+        """
+        if self.kind == 2:
+            # IRIs can only be compared for equality
+            if self.operator not in ('=', '!='):
+                return False
+            return (term in self.alternatives) == (self.operator == '=')
+
+        kind, value = literal_value(term)
+        if kind != self.kind:
+            return False
+        if self.operator == '=':
+            return value == self.comparison_value
+        if self.operator == '!=':
+            return value != self.comparison_value
+        if self.operator == '<':
+            return value < self.comparison_value
+        if self.operator == '<=':
+            return value <= self.comparison_value
+        if self.operator == '>':
+            return value > self.comparison_value
+        return value >= self.comparison_value
+
+    def mask(self, values, term_dictionary):
+        """
+        Check for an array of encoded terms if they match the filter (every distinct term is decoded and compared only once)
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array, True for the terms that match
+        """
+        distinct_values, inverse = np.unique(np.asarray(values), return_inverse=True)
+        matches = np.array([self.matches(term_dictionary.term(value)) for value in distinct_values.tolist()], dtype=bool)
+        return matches[inverse.reshape(-1)]
+
+
+class PatternSelection():
+    """
+    Selection of the triples that can match one triple pattern: constant subject and object and the filters of its variables
+    """
+
+    def __init__(self, subjects, objects, subject_filters, object_filters, same_variable):
+        """
+        Parameters
+        ----------
+        subjects : set
+            Ways the constant subject may be written in the data (None if the subject is a variable)
+        objects : set
+            Ways the constant object may be written in the data (None if the object is a variable)
+        subject_filters : list
+            Filters of the subject variable
+        object_filters : list
+            Filters of the object variable
+        same_variable : bool
+            True if subject and object are the same variable
+        """
+        self.subjects = subjects
+        self.objects = objects
+        self.subject_filters = subject_filters
+        self.object_filters = object_filters
+        self.same_variable = same_variable
+
+    def is_restricted(self):
+        return self.subjects is not None or self.objects is not None or bool(self.subject_filters or self.object_filters) or self.same_variable
+
+    def matches(self, subject, object):
+        if self.subjects is not None and subject not in self.subjects:
+            return False
+        if self.objects is not None and object not in self.objects:
+            return False
+        if self.same_variable and subject != object:
+            return False
+        return all(filter.matches(subject) for filter in self.subject_filters) and all(filter.matches(object) for filter in self.object_filters)
+
+    def key(self):
+        return [sorted(self.subjects or []), sorted(self.objects or []), [filter.key() for filter in self.subject_filters],
+                [filter.key() for filter in self.object_filters], self.same_variable]
+
+
+class TripleSelection():
+    """
+    Selection of the triples that are loaded by the preprocessor for a query (see DataPreprocessor): a triple of a property
+    is loaded if it can match at least one triple pattern of the property
+    """
+
+    def __init__(self, patterns):
+        """
+        Parameters
+        ----------
+        patterns : dict
+            Dictionary with the property names as keys and the lists of the PatternSelection of their triple patterns as values,
+            the properties that have a triple pattern without restrictions are not part of the dictionary
+        """
+        self.patterns = patterns
+
+    def restricts(self, property):
+        """
+        Check if only some triples of the property are loaded (the other triples of the property do not need to be checked)
+        """
+        return property in self.patterns
+
+    def matches(self, property, subject, object):
+        """
+        Check if a triple of the data (property without prefix, subject and object as written in the data) is loaded
+        """
+        patterns = self.patterns.get(property)
+        return patterns is None or any(pattern.matches(subject, object) for pattern in patterns)
+
+    def key(self):
+        """
+        Description of the selection (stored in the dataset cache, so only caches with the same selection are used)
+        """
+        return json.dumps({property: [pattern.key() for pattern in patterns] for property, patterns in sorted(self.patterns.items())})
+
+
+class SparqlQuery():
+    """
+    Parsed SELECT query of the supported SPARQL subset:
+
+        PREFIX wsdbm: <http://db.uwaterloo.ca/~galuc/wsdbm/>
+        SELECT ?user ?product WHERE {
+            ?user wsdbm:follows wsdbm:User0 ; wsdbm:likes ?product .
+            ?product wsdbm:hasReview ?review .
+            FILTER(?review != wsdbm:Review5)
+        } LIMIT 10
+
+    Basic graph patterns (with ; and , abbreviations), constants as subject or object, FILTERs that compare a variable with a
+    constant (combined with &&), LIMIT and SELECT (COUNT(*) AS ?count) with an optional GROUP BY of one variable
+    Properties are matched by their local name like the property tables of the preprocessor
+    """
+
+    def __init__(self, prefixes, projection, patterns, filters, limit=None, count=None, group_by=None):
+        """
+        Parameters
+        ----------
+        prefixes : dict
+            Namespaces of the prefixes (e.g. 'wsdbm:' -> '<http://db.uwaterloo.ca/~galuc/wsdbm/')
+        projection : list
+            Selected variables (None for SELECT *)
+        patterns : list
+            Triple patterns (subject, property local name, object)
+        filters : list
+            Filters of the variables
+        limit : int
+            Maximum number of results (None if the query has no LIMIT)
+        count : str
+            Variable of the COUNT(*) (None if the results are selected)
+        group_by : str
+            Variable of the GROUP BY (None without grouping)
+        """
+        self.prefixes = prefixes
+        self.projection = projection
+        self.patterns = patterns
+        self.filters = filters
+        self.limit = limit
+        self.count = count
+        self.group_by = group_by
+
+    def properties(self):
+        """
+        Properties of the triple patterns (in the order of their first occurrence)
+        """
+        return list(dict.fromkeys(property for _, property, _ in self.patterns))
+
+    def alternatives(self, term):
+        """
+        Ways a constant may be written in the data (see term_alternatives)
+        """
+        return term_alternatives(term, self.prefixes)
+
+    def selection(self):
+        """
+        Selection of the triples that have to be loaded for the query: the constants and filters are pushed down into the
+        ingestion, so triples that cannot match any triple pattern are never encoded or stored
+
+        Returns
+        -------
+        TripleSelection
+            Selection of the triples (None if every triple pattern matches all triples of its property)
+        """
+        patterns = {}
+        unrestricted = set()
+        for subject, property, object in self.patterns:
+            pattern = PatternSelection(
+                None if is_variable(subject) else self.alternatives(subject),
+                None if is_variable(object) else self.alternatives(object),
+                [filter for filter in self.filters if filter.variable == subject],
+                [filter for filter in self.filters if filter.variable == object],
+                is_variable(subject) and subject == object,
+            )
+            if pattern.is_restricted():
+                patterns.setdefault(property, []).append(pattern)
+            else:
+                unrestricted.add(property)
+        patterns = {property: property_patterns for property, property_patterns in patterns.items() if property not in unrestricted}
+        return TripleSelection(patterns) if patterns else None
+
+    def resolve(self, term, term_dictionary):
+        """
+        Write a constant like in the data (the first way of writing it that is in the term dictionary)
+        """
+        if is_variable(term):
+            return term
+        return next((alternative for alternative in sorted(self.alternatives(term)) if alternative in term_dictionary), term)
+
+    def preprocess(self, data_path, cache_path=None, workers=1, profiler=DISABLED_PROFILER):
+        """
+        Load the properties of the query with the constants and filters pushed down into the ingestion
+
+        Returns
+        -------
+        DataPreprocessor
+            Preprocessor that contains the selected triples
+        """
+        return DataPreprocessor(data_path, self.properties(), cache_path=cache_path, workers=workers, profiler=profiler,
+                                selection=self.selection())
+
+    def execute(self, preprocessor, algorithm_type='hash_join', output_path=None, use_yannakakis=True, profiler=DISABLED_PROFILER,
+                output_format='text'):
+        """
+        Execute the query with the query engine (see QueryEngine)
+        Triple patterns without variables are checked once and removed, the constants of the other triple patterns are selected
+        from the CSR indices and the filters are applied to the relations before the Yannakakis reduction
+
+        Parameters
+        ----------
+        preprocessor : DataPreprocessor
+            Preprocessor that contains the property tables of the query
+        algorithm_type : str
+            Join algorithm of the query engine
+        output_path : str
+            If given, the decoded results of a SELECT query are written to this file (only the projected variables)
+        use_yannakakis : bool
+            If True, the relations are reduced before the joins
+        profiler : Profiler
+            Profiler of the query engine
+        output_format : str
+            Format of the output file (see result_writer.OUTPUT_FORMATS)
+
+        Returns
+        -------
+        Relation or int or tuple
+            Encoded results of a SELECT query (projected and limited), the number of results of a COUNT query or the values of
+            the group variable and the number of results for each value
+        """
+        term_dictionary = preprocessor.term_dictionary
+        patterns = [tuple(self.resolve(term, term_dictionary) if position != 1 else term for position, term in enumerate(pattern))
+                    for pattern in self.patterns]
+
+        # triple patterns without variables only decide if there are results at all
+        satisfied = all(self.contains_triple(preprocessor, pattern) for pattern in patterns if not any(map(is_variable, pattern[::2])))
+        patterns = [pattern for pattern in patterns if any(map(is_variable, pattern[::2]))]
+        if not patterns:
+            raise ValueError("The query needs at least one triple pattern with a variable")
+
+        filters = [Filter(filter.variable, filter.operator, self.resolve(filter.value, term_dictionary), filter.alternatives)
+                   for filter in self.filters]
+        query_engine = QueryEngine(algorithm_type, preprocessor, patterns, output_path, use_yannakakis, profiler, filters=filters,
+                                   output_format=output_format)
+        if self.count is not None:
+            count = query_engine.count(self.group_by)
+            if satisfied:
+                return count
+            return 0 if self.group_by is None else tuple(array[:0] for array in count)
+
+        query_engine.run()
+        if not satisfied:
+            query_engine.results = query_engine.results.filter(np.zeros(len(query_engine.results), dtype=bool))
+        variables = query_engine.variables if self.projection is None else self.projection
+        if output_path is not None:
+            query_engine.collect_results(variables, self.limit)
+        rows = len(query_engine.results) if self.limit is None else min(self.limit, len(query_engine.results))
+        return Relation(variables, [query_engine.results.column(variable)[:rows] for variable in variables])
+
+    @staticmethod
+    def contains_triple(preprocessor, pattern):
+        """
+        Check if a triple (a triple pattern without variables) is in the property tables
+        """
+        subject, property, object = pattern
+        subject_index, object_index = preprocessor.term_dictionary.get(subject), preprocessor.term_dictionary.get(object)
+        if subject_index is None or object_index is None:
+            return False
+        return bool(np.isin(object_index, preprocessor.property_tables[property].objects_of(subject_index)))
+
+
+class Parser():
+    """
+    Recursive descent parser of the supported SPARQL subset (see SparqlQuery)
+    """
+
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.position = 0
+        self.prefixes = {}
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise ValueError("Unexpected end of the query")
+        self.position += 1
+        return token
+
+    def accept(self, value):
+        """
+        Consume the next token if it has the value (keywords are case-insensitive)
+        """
+        kind, token = self.peek()
+        if token is not None and (token.upper() == value if kind == 'keyword' else token == value):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, value):
+        if not self.accept(value):
+            raise ValueError(f"Expected {value} but found {self.peek()[1]}")
+
+    def parse(self):
+        while self.accept('PREFIX'):
+            kind, prefix = self.next()
+            kind_iri, namespace = self.next()
+            if kind != 'prefixed_name' or not prefix.endswith(':') or kind_iri != 'iri':
+                raise ValueError(f"Invalid PREFIX declaration {prefix} {namespace}")
+            # the namespace without the closing > (the local name and > are appended)
+            self.prefixes[prefix] = namespace[:-1]
+
+        self.expect('SELECT')
+        if self.peek()[1] is not None and self.peek()[1].upper() in ('DISTINCT', 'REDUCED'):
+            raise ValueError("DISTINCT and REDUCED are not supported")
+        projection, count = self.parse_projection()
+        self.accept('WHERE')
+        patterns, filters = self.parse_group()
+
+        group_by = None
+        if self.accept('GROUP'):
+            self.expect('BY')
+            group_by = self.variable()
+        limit = None
+        if self.accept('LIMIT'):
+            kind, value = self.next()
+            if kind != 'number' or not value.isdigit():
+                raise ValueError(f"Invalid LIMIT {value}")
+            limit = int(value)
+        if self.peek()[0] is not None:
+            raise ValueError(f"Unexpected {self.peek()[1]} after the query")
+
+        if count is not None and projection not in ([], [group_by]):
+            raise ValueError("Only the GROUP BY variable can be selected next to COUNT(*)")
+        if count is None and group_by is not None:
+            raise ValueError("GROUP BY is only supported with COUNT(*)")
+        variables = set(variable for pattern in patterns for variable in pattern[::2] if is_variable(variable))
+        for variable in (projection or []) + [filter.variable for filter in filters] + ([group_by] if group_by else []):
+            if variable not in variables:
+                raise ValueError(f"Variable {variable} does not occur in a triple pattern")
+        return SparqlQuery(self.prefixes, projection, patterns, filters, limit, count, group_by)
+
+    def variable(self):
+        kind, value = self.next()
+        if kind != 'variable':
+            raise ValueError(f"Expected a variable but found {value}")
+        return '?' + value[1:]
+
+    def parse_projection(self):
+        """
+        Selected variables (None for *) and the variable of COUNT(*) (None if nothing is counted)
+        """
+        if self.accept('*'):
+            return None, None
+        projection, count = [], None
+        while self.peek()[0] == 'variable' or self.peek()[1] == '(':
+            if self.accept('('):
+                self.expect('COUNT')
+                self.expect('(')
+                if not self.accept('*'):
+                    # the variables of a basic graph pattern are always bound, so COUNT(?x) is COUNT(*)
+                    self.variable()
+                self.expect(')')
+                self.expect('AS')
+                count = self.variable()
+                self.expect(')')
+            else:
+                projection.append(self.variable())
+        if not projection and count is None:
+            raise ValueError("SELECT needs * or at least one variable")
+        return projection, count
+
+    def parse_group(self):
+        """
+        Triple patterns and filters of the group graph pattern { ... }
+        """
+        self.expect('{')
+        patterns, filters = [], []
+        while not self.accept('}'):
+            if self.accept('FILTER'):
+                filters.extend(self.parse_filter())
+            elif self.accept('.'):
+                continue
+            else:
+                subject = self.term()
+                while True:
+                    property = self.property()
+                    while True:
+                        patterns.append((subject, property, self.term()))
+                        if not self.accept(','):
+                            break
+                    if not self.accept(';'):
+                        break
+        if not patterns:
+            raise ValueError("The query has no triple patterns")
+        return patterns, filters
+
+    def parse_filter(self):
+        """
+        Comparisons of FILTER( ... ), combined with &&
+        """
+        self.expect('(')
+        filters = [self.comparison()]
+        while self.accept('&&'):
+            filters.append(self.comparison())
+        self.expect(')')
+        return filters
+
+    def comparison(self):
+        if self.accept('('):
+            filter = self.comparison()
+            self.expect(')')
+            return filter
+        left = self.term()
+        kind, operator = self.next()
+        if operator not in COMPARISON_OPERATORS:
+            raise ValueError(f"Unsupported operator {operator} in FILTER")
+        right = self.term()
+        if is_variable(left) == is_variable(right):
+            raise ValueError("A FILTER has to compare a variable with a constant")
+        if not is_variable(left):
+            # constant < ?variable is ?variable > constant
+            left, right = right, left
+            operator = {'<': '>', '<=': '>=', '>': '<', '>=': '<='}.get(operator, operator)
+        return Filter(left, operator, right, term_alternatives(right, self.prefixes))
+
+    def term(self):
+        kind, value = self.next()
+        if kind == 'variable':
+            return '?' + value[1:]
+        if kind in ('iri', 'literal', 'number', 'prefixed_name'):
+            return value
+        raise ValueError(f"Expected a term but found {value}")
+
+    def property(self):
+        """
+        Local name of the property of a triple pattern ('a' is rdf:type)
+        """
+        kind, value = self.next()
+        if kind == 'keyword' and value == 'a':
+            return 'type'
+        if kind == 'variable':
+            raise ValueError("Variables are not supported as properties")
+        if kind not in ('iri', 'prefixed_name'):
+            raise ValueError(f"Expected a property but found {value}")
+        return split_term(value)[1]
+
+
+def parse_query(text):
+    """
+    Parse a SELECT query of the supported SPARQL subset (see SparqlQuery)
+
+    Parameters
+    ----------
+    text : str
+        Text of the query
+
+    Returns
+    -------
+    SparqlQuery
+        Parsed query
+
+    Raises
+    ------
+    ValueError
+        If the query is not part of the supported subset
+    """
+    return Parser(text).parse()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a SPARQL SELECT query (basic graph patterns, FILTER, LIMIT and COUNT)")
+    parser.add_argument('data_path')
+    parser.add_argument('query_path', help="file that contains the query")
+    parser.add_argument('--algorithm', default='hash_join', choices=['hash_join', 'sort_merge_join', 'leapfrog_triejoin', 'cost_based'])
+    parser.add_argument('--output', default='output/sparql.txt', help="file of the results of a SELECT query")
+    parser.add_argument('--format', default='text', choices=OUTPUT_FORMATS, help="format of the output file")
+    parser.add_argument('--cache', help="path of the dataset cache (the cache is only valid for the same constants and filters)")
+    parser.add_argument('--workers', type=int, default=1)
+    arguments = parser.parse_args()
+
+    with open(arguments.query_path) as query_file:
+        sparql_query = parse_query(query_file.read())
+    data_preprocessor = sparql_query.preprocess(arguments.data_path, arguments.cache, arguments.workers)
+    print("Loaded triples: ", {property: len(table) for property, table in data_preprocessor.property_tables.items()})
+
+    result = sparql_query.execute(data_preprocessor, arguments.algorithm, arguments.output, output_format=arguments.format)
+    if sparql_query.count is None:
+        print(f"Wrote {len(result)} results to {arguments.output}")
+    elif sparql_query.group_by is None:
+        print(f"{sparql_query.count}: {result}")
+    else:
+        values, counts = result
+        for value, count in zip(data_preprocessor.term_dictionary.decode(values).tolist(), counts.tolist()):
+            print(f"{value} {count}")
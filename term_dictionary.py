@@ -0,0 +1,449 @@
+import bisect
+
+import numpy as np
+
+from data_structures import gather_ranges
+
+# every BLOCK_SIZE-th local name is stored completely, the other local names only store the suffix that differs from it
+BLOCK_SIZE = 16
+# the length of the shared prefix is stored in one byte
+MAX_PREFIX_LENGTH = 255
+# ASCII characters of the local name at the end of an IRI (see split_term)
+ALPHANUMERIC_BYTES = b'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+
+def split_term(string):
+    """
+    Split a term of the data into its namespace and its local name
+
+    Parameters
+    ----------
+    string : str
+        Term of the data (IRI in angle brackets, prefixed name or literal)
+
+    Returns
+    -------
+    tuple
+        Namespace and local name, the term is namespace + local name (+ '>' if the namespace starts with '<')
+    """
+    # literals (with language tag or datatype) have no namespace
+    if string[0] == '"':
+        return '', string
+
+    # IRIs from the watdiv.10M.nt dataset are surrounded by < and >, the local name is the alphanumeric end of the IRI
+    if string[-1] == '>':
+        string = string[:-1]
+        local_start = len(string)
+        while local_start > 0 and (string[local_start - 1].isdigit() or string[local_start - 1].isalpha()):
+            local_start -= 1
+        if local_start == len(string):
+            # the IRI does not end with an alphanumeric character, the whole IRI is the local name
+            return '<', string[1:]
+        return string[:local_start], string[local_start:]
+
+    # prefixed names from the 100k.txt dataset, the namespace ends with the first :
+    local_start = string.find(':') + 1
+    return string[:local_start], string[local_start:]
+
+
+def split_term_bytes(term):
+    """
+    Version of split_term for UTF-8 encoded terms (as they are read from the data file)
+    ASCII terms are split without decoding them, other terms are decoded and split with split_term, so both versions always
+    split a term the same way
+
+    Parameters
+    ----------
+    term : bytes
+        UTF-8 encoded term of the data
+
+    Returns
+    -------
+    tuple
+        Namespace (str) and UTF-8 encoded local name (bytes)
+    """
+    if term[:1] == b'"':
+        return '', term
+    if not term.isascii():
+        namespace, local_name = split_term(term.decode('utf-8'))
+        return namespace, local_name.encode('utf-8')
+
+    if term[-1:] == b'>':
+        term = term[:-1]
+        local_start = len(term.rstrip(ALPHANUMERIC_BYTES))
+        if local_start == len(term):
+            return '<', term[1:]
+        return term[:local_start].decode('ascii'), term[local_start:]
+
+    local_start = term.find(b':') + 1
+    return term[:local_start].decode('ascii'), term[local_start:]
+
+
+class TermDictionary():
+    """
+    Compact dictionary of the subjects and objects of the data
+    Every namespace is stored once. The terms are sorted by namespace and local name and get the indices 1 to n in this order,
+    so the terms of a namespace are stored next to each other and the index of a term is its position in the sorted order
+    The local names are front-coded in blocks: the first local name of a block is stored completely, the other local names
+    only store the length of the prefix they share with the first local name of the block and the remaining suffix
+    Decoding an index needs two slices of the byte buffer (O(1)), encoding a term is a binary search within its namespace
+    Terms that are added after the build (see add) get the indices n + 1, n + 2, ... and are stored uncompressed
+    """
+
+    # names of the arrays of a term dictionary (used to store and load the term dictionary without rebuilding it)
+    ARRAYS = ('namespace_offsets', 'buffer', 'offsets', 'prefix_lengths')
+
+    def __init__(self, namespaces, namespace_offsets, buffer, offsets, prefix_lengths):
+        """
+        Initialize the term dictionary from its arrays (use TermDictionary.build to create a term dictionary from terms)
+
+        Parameters
+        ----------
+        namespaces : list
+            Sorted namespaces
+        namespace_offsets : np.ndarray
+            The terms of namespaces[i] have the positions namespace_offsets[i] to namespace_offsets[i + 1] (exclusive)
+        buffer : np.ndarray
+            uint8 array with the front-coded local names
+        offsets : np.ndarray
+            The front-coded local name at position i is stored at buffer[offsets[i]:offsets[i + 1]]
+        prefix_lengths : np.ndarray
+            uint8 array with the length of the prefix every local name shares with the first local name of its block
+        """
+        self.namespaces = list(namespaces)
+        self.namespace_indices = {namespace: index for index, namespace in enumerate(self.namespaces)}
+        self.namespace_offsets = namespace_offsets
+        self.buffer = buffer
+        self.offsets = offsets
+        self.prefix_lengths = prefix_lengths
+        # terms added after the build (the index of added_terms[i] is number_of_sorted_terms + i + 1)
+        self.added_terms = []
+        self.added_indices = {}
+
+    @classmethod
+    def build(cls, rdf_dict):
+        """
+        Build the term dictionary from a dictionary with the terms as keys and provisional indices as values
+
+        Parameters
+        ----------
+        rdf_dict : dict
+            Dictionary with the terms (str or UTF-8 encoded bytes) as keys and the provisional indices (1 to n) as values
+
+        Returns
+        -------
+        term_dictionary : TermDictionary
+            Term dictionary that contains all terms
+        remap : np.ndarray
+            int32 array that contains for every provisional index the index of the term in the term dictionary
+        """
+        # sort the terms by namespace and local name (the byte order of UTF-8 strings is the same as the order of the strings)
+        entries = sorted((*split_term_bytes(term if isinstance(term, bytes) else term.encode('utf-8')), index)
+                         for term, index in rdf_dict.items())
+
+        namespaces = []
+        namespace_offsets = []
+        local_names = []
+        remap = np.zeros(len(rdf_dict) + 1, dtype=np.int32)
+        for position, (namespace, local_name, index) in enumerate(entries):
+            if not namespaces or namespaces[-1] != namespace:
+                namespaces.append(namespace)
+                namespace_offsets.append(position)
+            local_names.append(local_name)
+            remap[index] = position + 1
+        namespace_offsets.append(len(entries))
+
+        # front-code the local names in blocks of BLOCK_SIZE
+        suffixes = []
+        prefix_lengths = np.zeros(len(local_names), dtype=np.uint8)
+        for position, local_name in enumerate(local_names):
+            head = local_names[position - position % BLOCK_SIZE]
+            prefix_length = 0
+            if position % BLOCK_SIZE:
+                limit = min(len(head), len(local_name), MAX_PREFIX_LENGTH)
+                while prefix_length < limit and head[prefix_length] == local_name[prefix_length]:
+                    prefix_length += 1
+            prefix_lengths[position] = prefix_length
+            suffixes.append(local_name[prefix_length:])
+
+        buffer = np.frombuffer(b''.join(suffixes), dtype=np.uint8)
+        offsets = np.zeros(len(suffixes) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(suffix) for suffix in suffixes])
+
+        term_dictionary = cls(namespaces, np.array(namespace_offsets, dtype=np.int64), buffer, offsets, prefix_lengths)
+        return term_dictionary, remap
+
+    @classmethod
+    def from_arrays(cls, namespaces, arrays):
+        """
+        Create a term dictionary from its arrays (e.g. memory-mapped arrays of the dataset cache), nothing is copied
+
+        Parameters
+        ----------
+        namespaces : list
+            Sorted namespaces
+        arrays : dict
+            Dictionary that contains an array for each name in TermDictionary.ARRAYS
+
+        Returns
+        -------
+        TermDictionary
+            Term dictionary that uses the given arrays
+        """
+        return cls(namespaces, *(arrays[name] for name in cls.ARRAYS))
+
+    @property
+    def number_of_sorted_terms(self):
+        return len(self.prefix_lengths)
+
+    def __len__(self):
+        return self.number_of_sorted_terms + len(self.added_terms)
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    def local_name_bytes(self, index):
+        """
+        Get the UTF-8 encoded local name of a term
+
+        Parameters
+        ----------
+        index : int
+            Index of the term (1 to n)
+
+        Returns
+        -------
+        bytes
+            Local name of the term
+        """
+        position = index - 1
+        if not 0 <= position < len(self):
+            raise KeyError(index)
+        if position >= self.number_of_sorted_terms:
+            return split_term(self.added_terms[position - self.number_of_sorted_terms])[1].encode('utf-8')
+        suffix = self.buffer[self.offsets[position]:self.offsets[position + 1]].tobytes()
+        prefix_length = self.prefix_lengths[position]
+        if not prefix_length:
+            return suffix
+        head = position - position % BLOCK_SIZE
+        return self.buffer[self.offsets[head]:self.offsets[head] + prefix_length].tobytes() + suffix
+
+    def local_name(self, index):
+        """
+        Get the local name of a term (the term without its namespace, as it is written to the output files)
+
+        Parameters
+        ----------
+        index : int
+            Index of the term (1 to n)
+
+        Returns
+        -------
+        str
+            Local name of the term
+        """
+        return self.local_name_bytes(index).decode('utf-8')
+
+    def namespace(self, index):
+        """
+        Get the namespace of a term
+
+        Parameters
+        ----------
+        index : int
+            Index of the term (1 to n)
+
+        Returns
+        -------
+        str
+            Namespace of the term
+        """
+        if index > self.number_of_sorted_terms:
+            return split_term(self.added_terms[index - self.number_of_sorted_terms - 1])[0]
+        return self.namespaces[np.searchsorted(self.namespace_offsets, index - 1, side='right') - 1]
+
+    def term(self, index):
+        """
+        Get the complete term (namespace and local name)
+
+        Parameters
+        ----------
+        index : int
+            Index of the term (1 to n)
+
+        Returns
+        -------
+        str
+            Term as it is written in the data
+        """
+        namespace = self.namespace(index)
+        return namespace + self.local_name(index) + ('>' if namespace.startswith('<') else '')
+
+    def get(self, term, default=None):
+        """
+        Get the index of a term
+
+        Parameters
+        ----------
+        term : str
+            Term as it is written in the data
+        default : object
+            Value that is returned if the term is not in the term dictionary
+
+        Returns
+        -------
+        int
+            Index of the term (or default)
+        """
+        namespace, local_name = split_term(term)
+        namespace_index = self.namespace_indices.get(namespace)
+        if namespace_index is None:
+            return self.added_indices.get(term, default)
+
+        # binary search over the local names of the namespace
+        start, end = int(self.namespace_offsets[namespace_index]), int(self.namespace_offsets[namespace_index + 1])
+        local_name = local_name.encode('utf-8')
+        position = bisect.bisect_left(_LocalNames(self), local_name, start, end)
+        if position < end and self.local_name_bytes(position + 1) == local_name:
+            return position + 1
+        return self.added_indices.get(term, default)
+
+    def add(self, term):
+        """
+        Add a term that is not in the term dictionary (e.g. a term of inserted triples, see incremental_view.py)
+        The indices of the sorted terms are stored in the property tables and cannot change, so the term gets the next free
+        index after all other terms
+
+        Parameters
+        ----------
+        term : str
+            Term as it is written in the data
+
+        Returns
+        -------
+        int
+            Index of the term (its existing index if it is already in the term dictionary)
+        """
+        index = self.get(term)
+        if index is None:
+            self.added_terms.append(term)
+            index = self.added_indices[term] = len(self)
+        return index
+
+    def __getitem__(self, term):
+        index = self.get(term)
+        if index is None:
+            raise KeyError(term)
+        return index
+
+    def decode(self, indices, with_namespace=False):
+        """
+        Decode an array of indices
+        Every distinct index is decoded only once
+
+        Parameters
+        ----------
+        indices : np.ndarray
+            Indices of terms
+        with_namespace : bool
+            If True, the complete terms are returned, otherwise only the local names
+
+        Returns
+        -------
+        np.ndarray
+            Array of strings (dtype object) with the same length as indices
+        """
+        distinct_indices, inverse = np.unique(np.asarray(indices), return_inverse=True)
+        decode = self.term if with_namespace else self.local_name
+        decoded = np.array([decode(index) for index in distinct_indices.tolist()], dtype=object)
+        return decoded[inverse.reshape(-1)]
+
+    def decode_bytes(self, indices, with_namespace=False):
+        """
+        Decode an array of indices to UTF-8 encoded terms without decoding term by term
+        Every term is assembled from up to four byte ranges (namespace, shared prefix of its block, suffix and > for IRIs) and
+        the ranges of all terms are copied at once
+
+        Parameters
+        ----------
+        indices : np.ndarray
+            Indices of terms
+        with_namespace : bool
+            If True, the complete terms are returned, otherwise only the local names
+
+        Returns
+        -------
+        data : np.ndarray
+            uint8 array with the encoded terms one after another
+        offsets : np.ndarray
+            The term of indices[i] is stored at data[offsets[i]:offsets[i + 1]]
+        """
+        positions = np.asarray(indices, dtype=np.int64).reshape(-1) - 1
+        added = positions >= self.number_of_sorted_terms
+        if self.added_terms and added.any():
+            return self.decode_added_bytes(positions, added, with_namespace)
+        heads = positions - positions % BLOCK_SIZE
+        suffix_starts = self.offsets[positions]
+        # the head of a block is stored completely, the other local names start with a prefix of the head
+        ranges = [(self.offsets[heads], self.prefix_lengths[positions].astype(np.int64)),
+                  (suffix_starts, self.offsets[positions + 1] - suffix_starts)]
+        source = np.asarray(self.buffer)
+
+        if with_namespace:
+            namespace_bytes = [namespace.encode('utf-8') for namespace in self.namespaces] + [b'>']
+            namespace_lengths = np.array([len(namespace) for namespace in namespace_bytes], dtype=np.int64)
+            namespace_starts = len(source) + np.cumsum(namespace_lengths) - namespace_lengths
+            source = np.concatenate([source, np.frombuffer(b''.join(namespace_bytes), dtype=np.uint8)])
+
+            namespaces = np.searchsorted(self.namespace_offsets, positions, side='right') - 1
+            is_iri = np.array([namespace.startswith('<') for namespace in self.namespaces], dtype=bool)[namespaces]
+            ranges.insert(0, (namespace_starts[namespaces], namespace_lengths[namespaces]))
+            ranges.append((np.full(len(positions), namespace_starts[-1]), is_iri.astype(np.int64)))
+
+        starts = np.stack([start for start, _ in ranges], axis=1).reshape(-1)
+        lengths = np.stack([length for _, length in ranges], axis=1).reshape(-1)
+        data, range_offsets = gather_ranges(source, starts, lengths)
+        return data, range_offsets[::len(ranges)]
+
+    def decode_added_bytes(self, positions, added, with_namespace):
+        """
+        Version of decode_bytes for indices that contain added terms: the sorted terms are decoded with decode_bytes and the
+        added terms are encoded one by one (there are only a few of them)
+        """
+        data, offsets = self.decode_bytes(np.where(added, 1, positions + 1), with_namespace)
+        added_positions = positions[added] - self.number_of_sorted_terms
+        decode = self.term if with_namespace else self.local_name
+        added_bytes = [decode(self.number_of_sorted_terms + position + 1).encode('utf-8') for position in added_positions.tolist()]
+        added_lengths = np.array([len(term) for term in added_bytes], dtype=np.int64)
+
+        starts, lengths = offsets[:-1].copy(), np.diff(offsets)
+        starts[added] = len(data) + np.cumsum(added_lengths) - added_lengths
+        lengths[added] = added_lengths
+        source = np.concatenate([data, np.frombuffer(b''.join(added_bytes), dtype=np.uint8)])
+        return gather_ranges(source, starts, lengths)
+
+    def nbytes(self):
+        """
+        Get the memory used by the arrays of the term dictionary
+
+        Returns
+        -------
+        int
+            Number of bytes
+        """
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS) + sum(len(namespace) for namespace in self.namespaces)
+
+
+class _LocalNames():
+    """
+    Sequence view of the UTF-8 encoded local names in sorted order (used for the binary search of TermDictionary.get)
+    """
+
+    def __init__(self, term_dictionary):
+        self.term_dictionary = term_dictionary
+
+    def __len__(self):
+        return self.term_dictionary.number_of_sorted_terms
+
+    def __getitem__(self, position):
+        return self.term_dictionary.local_name_bytes(position + 1)